@@ -0,0 +1,79 @@
+"""Measure the per-step cost of building the request window.
+
+Simulates a long agent session (assistant tool calls, tool results and a
+screen message per step) and reports the average time ``main`` spends per
+step on ``trim_history`` and ``validate_history`` as the history grows.
+The cost should stay flat however long the session runs.
+
+Run with ``python benchmarks/history_window.py [--steps N] [--history H]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+from computer_control.history import MessageStore  # noqa: E402
+from computer_control.main import trim_history  # noqa: E402
+from computer_control.main import validate_history  # noqa: E402
+
+
+def step_messages(step: int) -> List[Dict[str, Any]]:
+    """Return the messages one agent step appends."""
+    ids = [f"call_{step}_{n}" for n in range(3)]
+    msgs: List[Dict[str, Any]] = [
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{"id": i, "type": "function"} for i in ids],
+        }
+    ]
+    msgs.extend(
+        {"role": "tool", "tool_call_id": i, "content": "ok"} for i in ids
+    )
+    msgs.append({"role": "user", "content": f"Updated screen {step}"})
+    return msgs
+
+
+def run(steps: int, history: int, report: int) -> None:
+    for label, store in (
+        ("store", MessageStore(window=history)),
+        ("list", []),
+    ):
+        store.append({"role": "system", "content": "system"})
+        store.append({"role": "user", "content": "goal"})
+        spent = 0.0
+        print(f"{label}: history={history}")
+        for step in range(1, steps + 1):
+            for msg in step_messages(step):
+                store.append(msg)
+            start = time.perf_counter()
+            validate_history(trim_history(store, history))
+            spent += time.perf_counter() - start
+            if step % report == 0:
+                print(
+                    f"  {len(store):>7} messages: "
+                    f"{spent / report * 1e6:7.1f} us/step"
+                )
+                spent = 0.0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=4000)
+    parser.add_argument("--history", type=int, default=8)
+    parser.add_argument("--report", type=int, default=500)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(args.steps, args.history, args.report)
@@ -0,0 +1,168 @@
+"""Drive concurrent agent sessions against the local mock API.
+
+Starts a ``computer_control.mockserver.MockServer`` (or uses ``--url``)
+and runs ``--sessions`` dry-run ``main.main`` sessions of ``--steps`` steps
+each, one process per session. Reports completed steps per second,
+request latency percentiles as seen by the sessions, the bytes they sent
+and the failures the server injected.
+
+Run with ``python benchmarks/load_test.py [--sessions N] [--steps S]
+[--latency SPEC] [--fault STATUS=P]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+from computer_control import client  # noqa: E402
+from computer_control.main import main as agent_main  # noqa: E402
+from computer_control import mockserver  # noqa: E402
+
+
+def session(url: str, steps: int, stream: bool) -> Dict[str, Any]:
+    """Run one dry-run session against ``url`` and time its requests."""
+    latencies: List[float] = []
+    failures = 0
+    query = client.query_pollinations
+
+    def timed(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            data = query(*args, **kwargs)
+        except Exception:
+            failures += 1
+            raise
+        latencies.append(time.perf_counter() - started)
+        return data
+
+    client.query_pollinations = timed
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent_main(
+                "Search the web for hello world",
+                steps=steps,
+                dry_run=True,
+                secure=False,
+                api_urls=[url],
+                stream=stream,
+            )
+    finally:
+        client.query_pollinations = query
+    return {"latencies": latencies, "failures": failures}
+
+
+def _session(args: Sequence[Any]) -> Dict[str, Any]:
+    return session(*args)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(
+    sessions: int,
+    steps: int,
+    url: Optional[str] = None,
+    stream: bool = False,
+    **server: Any,
+) -> Dict[str, Any]:
+    """Run the sessions and return the measurements.
+
+    Without ``url`` a mock server configured by ``server`` is started.
+    """
+    mock = None if url else mockserver.MockServer(**server).start()
+    target = url or mock.url
+    started = time.perf_counter()
+    try:
+        with multiprocessing.Pool(sessions) as pool:
+            results = pool.map(
+                _session, [(target, steps, stream)] * sessions
+            )
+        elapsed = time.perf_counter() - started
+    finally:
+        if mock is not None:
+            mock.stop()
+    latencies = sorted(t for r in results for t in r["latencies"])
+    report: Dict[str, Any] = {
+        "sessions": sessions,
+        "steps": len(latencies),
+        "failed": sum(r["failures"] for r in results),
+        "seconds": elapsed,
+        "steps_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p90": percentile(latencies, 0.9),
+        "p99": percentile(latencies, 0.99),
+    }
+    if mock is not None:
+        report["server"] = mock.stats()
+    return report
+
+
+def show(report: Dict[str, Any]) -> None:
+    print(
+        f"{report['sessions']} sessions, {report['steps']} steps "
+        f"({report['failed']} failed) in {report['seconds']:.2f}s: "
+        f"{report['steps_per_sec']:.1f} steps/s"
+    )
+    print(
+        "  latency: "
+        + ", ".join(
+            f"{q} {report[q] * 1000:.0f} ms" for q in ("p50", "p90", "p99")
+        )
+    )
+    server = report.get("server")
+    if server:
+        faults = {k: v for k, v in server.items() if k.isdigit()}
+        print(
+            f"  sent {server['bytes_received'] / 1024:.1f} KiB in "
+            f"{server['requests']} requests "
+            f"({server['bytes_received'] / max(1, server['requests']):.0f}"
+            f" B each), injected {faults or 'no failures'}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--url", help="existing endpoint instead of a mock")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--latency", default="lognormal:0.05:0.5")
+    parser.add_argument(
+        "--fault", action="append", default=[], metavar="STATUS=P"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    faults: Dict[int, float] = {}
+    for spec in args.fault:
+        faults.update(mockserver.parse_fault(spec))
+    show(
+        run(
+            args.sessions,
+            args.steps,
+            url=args.url,
+            stream=args.stream,
+            latency=args.latency,
+            faults=faults,
+            seed=args.seed,
+        )
+    )
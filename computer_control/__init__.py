@@ -1,12 +1,15 @@
 from . import controller
 from . import client
-from .main import main, trim_history
+from .main import main, main_async, trim_history
 from .controller import save_image
+from .frames import ScreenFrame
 
 __all__ = [
     "client",
     "controller",
     "main",
+    "main_async",
     "trim_history",
     "save_image",
+    "ScreenFrame",
 ]
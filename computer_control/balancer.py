@@ -0,0 +1,191 @@
+"""Spread requests over several compatible API endpoints."""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Collection, Dict, List, Optional, Sequence, Union
+
+
+class Backend:
+    """One endpoint and what the balancer knows about it."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.outstanding = 0
+        # smoothed latency of successful requests, ``None`` until the first
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.readmitted = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"Backend({self.url}, outstanding={self.outstanding}, "
+            f"ewma={self.ewma}, failures={self.failures})"
+        )
+
+
+class Balancer:
+    """Pick an endpoint for each request and watch their health.
+
+    With ``strategy`` ``"least"`` the backend with the fewest requests in
+    flight is chosen; with ``"ewma"`` that count is weighted by the
+    smoothed latency (``alpha``) of each backend, and a backend not yet
+    sampled by the mean latency of the others. Ties are broken at random.
+
+    Health checks are passive: ``eject_after`` consecutive failures take a
+    backend out for ``eject_for`` seconds, doubling with every further
+    ejection up to ``max_eject``. A backend coming back gets a growing share
+    of the traffic over ``ramp`` seconds rather than all of it at once.
+    When every backend is out, the one due back first is used.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        strategy: str = "least",
+        alpha: float = 0.3,
+        eject_after: int = 3,
+        eject_for: float = 10.0,
+        max_eject: float = 300.0,
+        ramp: float = 30.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        if not urls:
+            raise ValueError("Balancer needs at least one URL")
+        if strategy not in ("least", "ewma"):
+            raise ValueError(f"unknown strategy: {strategy}")
+        self.backends = [Backend(url) for url in urls]
+        self._by_url = {b.url: b for b in self.backends}
+        self.strategy = strategy
+        self.alpha = alpha
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+        self.max_eject = max_eject
+        self.ramp = ramp
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def _weight(self, backend: Backend, now: float) -> float:
+        if not backend.readmitted:
+            return 1.0
+        return min(1.0, 0.1 + 0.9 * (now - backend.readmitted) / self.ramp)
+
+    def _score(self, backend: Backend, now: float, seed: float) -> float:
+        load = backend.outstanding + 1
+        if self.strategy == "ewma":
+            load *= seed if backend.ewma is None else backend.ewma
+        return load / self._weight(backend, now)
+
+    def _seed(self) -> float:
+        # a backend without a latency sample is taken to be average, so it
+        # neither wins every pick nor is starved of the requests to get one
+        sampled = [b.ewma for b in self.backends if b.ewma is not None]
+        return sum(sampled) / len(sampled) if sampled else 1.0
+
+    def backend(self, url: str) -> Optional[Backend]:
+        """Return the backend serving ``url``, if it is one of ours."""
+        return self._by_url.get(url)
+
+    def pick(
+        self,
+        exclude: Union[Backend, Collection[Backend], None] = None,
+        strict: bool = False,
+    ) -> Backend:
+        """Return the backend for the next request and count it in flight.
+
+        ``exclude``, one backend or several, is avoided when another
+        backend is available, which is how a hedged copy reaches a
+        different endpoint. With ``strict`` only healthy backends not in
+        ``exclude`` are considered, and ``LookupError`` is raised when there
+        is none; that is how a failed request moves on to another endpoint.
+        """
+        if isinstance(exclude, Backend):
+            exclude = (exclude,)
+        skip = exclude or ()
+        with self._lock:
+            now = time.monotonic()
+            for backend in self.backends:
+                if backend.ejected_until and backend.ejected_until <= now:
+                    backend.ejected_until = 0.0
+                    backend.readmitted = now
+            healthy = [b for b in self.backends if not b.ejected_until]
+            candidates = [b for b in healthy if b not in skip]
+            if strict and not candidates:
+                raise LookupError("every healthy backend has been tried")
+            candidates = candidates or healthy
+            if candidates:
+                seed = self._seed()
+                scores = [self._score(b, now, seed) for b in candidates]
+                best = min(scores)
+                chosen = self.rng.choice(
+                    [b for b, s in zip(candidates, scores) if s == best]
+                )
+            else:
+                chosen = min(self.backends, key=lambda b: b.ejected_until)
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(
+        self, backend: Backend, ok: bool, latency: Optional[float] = None
+    ) -> None:
+        """Record the outcome of a request sent to ``backend``.
+
+        ``ok`` is ``False`` only when the endpoint itself failed; an answer
+        rejecting the request still shows it is healthy.
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.failures = 0
+                if (
+                    backend.readmitted
+                    and time.monotonic() - backend.readmitted >= self.ramp
+                ):
+                    # back to full share; forget earlier ejections
+                    backend.readmitted = 0.0
+                    backend.ejections = 0
+                if latency is not None:
+                    if backend.ewma is None:
+                        backend.ewma = latency
+                    else:
+                        backend.ewma += self.alpha * (latency - backend.ewma)
+                return
+            backend.errors += 1
+            backend.failures += 1
+            if backend.failures >= self.eject_after:
+                now = time.monotonic()
+                backoff = self.eject_for * 2**backend.ejections
+                backend.ejected_until = now + min(self.max_eject, backoff)
+                backend.ejections += 1
+                backend.failures = 0
+                backend.readmitted = 0.0
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return requests, errors and smoothed latency of each backend."""
+        with self._lock:
+            return {
+                b.url: {
+                    "requests": b.requests,
+                    "errors": b.errors,
+                    "ewma": b.ewma or 0.0,
+                    "ejected": float(bool(b.ejected_until)),
+                }
+                for b in self.backends
+            }
+
+    def describe(self) -> str:
+        """Return a one-line summary of ``stats``."""
+        parts: List[str] = []
+        for url, st in self.stats().items():
+            parts.append(
+                f"{url}: {st['requests']:.0f} requests, "
+                f"{st['errors']:.0f} errors, {st['ewma'] * 1000:.0f} ms"
+            )
+        return "; ".join(parts)
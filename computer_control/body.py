@@ -0,0 +1,112 @@
+"""Request bodies assembled from pre-serialized JSON fragments."""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore
+
+
+# Serialized messages kept between requests. Entries hold screenshots, so
+# this is a few history windows rather than the whole session, and their
+# bytes are capped as well.
+MESSAGE_CACHE = 32
+MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+def dumps(obj: Any) -> bytes:
+    """Return ``obj`` as JSON bytes, with ``orjson`` when it is installed.
+
+    Without ``orjson`` the output matches ``json.dumps`` byte for byte, so
+    ``budget.estimate_bytes`` is exact; ``orjson`` output is more compact
+    and the estimate becomes an upper bound.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _identity(obj: Any, leaves: List[Any]) -> Any:
+    """Return a key naming the values in ``obj`` by identity.
+
+    Equal keys mean the same leaf objects in the same structure, as long as
+    the objects collected in ``leaves`` stay alive.
+    """
+    if isinstance(obj, dict):
+        return tuple((k, _identity(v, leaves)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return (list, *(_identity(v, leaves) for v in obj))
+    leaves.append(obj)
+    return id(obj)
+
+
+class BodyBuilder:
+    """Build request bodies without re-serializing what was already sent.
+
+    The fixed ``fields`` (model, tools, tool choice and the like) are
+    encoded once. Each message is encoded the first time it is seen and
+    its bytes are reused while it keeps the same content, which is what
+    happens to the system prompt and to every screenshot as it moves
+    through the history window. ``frames.materialize`` hands out the same
+    data URL string for a frame on every request, so screenshots are
+    neither base64-encoded nor escaped again. At most ``max_messages``
+    messages and ``max_bytes`` serialized bytes are kept.
+    """
+
+    def __init__(
+        self,
+        fields: Dict[str, Any],
+        max_messages: int = MESSAGE_CACHE,
+        max_bytes: int = MESSAGE_BYTES,
+    ) -> None:
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.cached_bytes = 0
+        head = json.dumps(fields).encode()
+        self._prefix = head[:-1] + b', "messages": ['
+        self._lock = threading.Lock()
+        # identity key -> (leaves kept alive, serialized message)
+        self._messages: OrderedDict[Any, Tuple[List[Any], bytes]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def message(self, msg: Dict[str, Any]) -> bytes:
+        """Return the serialized form of ``msg``, cached by its content."""
+        leaves: List[Any] = []
+        key = _identity(msg, leaves)
+        with self._lock:
+            entry = self._messages.get(key)
+            if entry is not None:
+                self._messages.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        data = dumps(msg)
+        with self._lock:
+            self.misses += 1
+            if key not in self._messages:
+                self.cached_bytes += len(data)
+            self._messages[key] = (leaves, data)
+            while len(self._messages) > 1 and (
+                len(self._messages) > self.max_messages
+                or self.cached_bytes > self.max_bytes
+            ):
+                _, (_, old) = self._messages.popitem(last=False)
+                self.cached_bytes -= len(old)
+        return data
+
+    def build(self, messages: Sequence[Dict[str, Any]], **extra: Any) -> bytes:
+        """Return the body for ``messages`` with ``extra`` fields appended."""
+        parts = [self._prefix, b", ".join(self.message(m) for m in messages)]
+        parts.append(b"]")
+        for key, value in extra.items():
+            parts.append(b", " + json.dumps({key: value}).encode()[1:-1])
+        parts.append(b"}")
+        return b"".join(parts)
@@ -0,0 +1,197 @@
+"""Keep request bodies under a byte ceiling before they are sent."""
+
+from __future__ import annotations
+
+import io
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from PIL import Image
+
+from . import client
+from . import controller
+from .frames import ScreenFrame
+from .history import OMITTED, next_turn
+
+
+# Thumbnails cached per screenshot so older frames are re-encoded only once.
+THUMB_CACHE = 64
+
+
+def url_bytes(url: Any) -> int:
+    """Return the length of the data URL ``url`` serializes to."""
+    if isinstance(url, str):
+        return len(url)
+    size = getattr(url, "length", None)
+    if size is None:
+        size = len(url.data)
+    return len(f"data:{url.mime};base64,") + (size + 2) // 3 * 4
+
+
+def _image_url(part: Any) -> Any:
+    if isinstance(part, dict) and isinstance(part.get("image_url"), dict):
+        return part["image_url"].get("url")
+    return None
+
+
+def _part_bytes(part: Any) -> int:
+    url = _image_url(part)
+    if url is None:
+        return len(json.dumps(part))
+    blank = {**part, "image_url": {**part["image_url"], "url": ""}}
+    return len(json.dumps(blank)) + url_bytes(url)
+
+
+def message_bytes(msg: Dict[str, Any]) -> int:
+    """Return the serialized size of ``msg`` without building data URLs."""
+    content = msg.get("content")
+    if not isinstance(content, list):
+        return len(json.dumps(msg))
+    images = 0
+    parts = []
+    for part in content:
+        url = _image_url(part)
+        if url is None:
+            parts.append(part)
+            continue
+        images += url_bytes(url)
+        parts.append({**part, "image_url": {**part["image_url"], "url": ""}})
+    return len(json.dumps({**msg, "content": parts})) + images
+
+
+def estimate_bytes(msgs: Sequence[Dict[str, Any]]) -> int:
+    """Return the size of the request body ``client`` sends for ``msgs``."""
+    separators = 2 * max(0, len(msgs) - 1)
+    return (
+        client.payload_overhead()
+        + separators
+        + sum(message_bytes(m) for m in msgs)
+    )
+
+
+class RequestBudget:
+    """Shrink message batches until their request body fits ``max_bytes``.
+
+    Older screenshots are first replaced by small thumbnails, then by a text
+    placeholder, and only then are whole turns dropped from the front of the
+    batch. The newest screenshot and the final message are always kept.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        thumb_dim: int = 256,
+        thumb_quality: int = 40,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.thumb_dim = thumb_dim
+        self.thumb_quality = thumb_quality
+        self._thumbs: OrderedDict[str, Optional[ScreenFrame]] = OrderedDict()
+        # what the last ``fit`` did
+        self.last_bytes = 0
+        self.thumbnailed = 0
+        self.omitted = 0
+        self.dropped = 0
+
+    def fit(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return ``batch`` reduced to fit the budget.
+
+        Messages are copied before they are changed so the history itself
+        keeps the full screenshots.
+        """
+        batch = list(batch)
+        self.thumbnailed = self.omitted = self.dropped = 0
+        total = estimate_bytes(batch)
+        if total > self.max_bytes:
+            total = self._downgrade(batch, total, thumbnails=True)
+        if total > self.max_bytes:
+            total = self._downgrade(batch, total, thumbnails=False)
+        while total > self.max_bytes and len(batch) > 1:
+            # turns start at user messages so tool pairs stay together
+            start = next_turn(batch, 1, len(batch) - 1)
+            self.dropped += start
+            del batch[:start]
+            total = estimate_bytes(batch)
+        self.last_bytes = total
+        return batch
+
+    def _downgrade(
+        self, batch: List[Dict[str, Any]], total: int, thumbnails: bool
+    ) -> int:
+        """Downgrade older screenshots oldest first until ``total`` fits."""
+        newest = max(
+            (i for i, m in enumerate(batch) if self._images(m)), default=-1
+        )
+        for index in range(newest):
+            msg = batch[index]
+            if not self._images(msg):
+                continue
+            parts = []
+            for part in msg["content"]:
+                url = _image_url(part)
+                if url is None or total <= self.max_bytes:
+                    parts.append(part)
+                    continue
+                if thumbnails:
+                    thumb = self._thumbnail(url)
+                    if thumb is None or url_bytes(thumb) >= url_bytes(url):
+                        parts.append(part)
+                        continue
+                    new = {**part, "image_url": {**part["image_url"]}}
+                    new["image_url"]["url"] = thumb
+                    self.thumbnailed += 1
+                else:
+                    new = {"type": "text", "text": OMITTED}
+                    self.omitted += 1
+                total += _part_bytes(new) - _part_bytes(part)
+                parts.append(new)
+            batch[index] = {**msg, "content": parts}
+            if total <= self.max_bytes:
+                break
+        return total
+
+    @staticmethod
+    def _images(msg: Dict[str, Any]) -> bool:
+        content = msg.get("content")
+        return isinstance(content, list) and any(
+            _image_url(p) is not None for p in content
+        )
+
+    def _thumbnail(self, url: Any) -> Optional[ScreenFrame]:
+        if isinstance(url, str):
+            try:
+                url = ScreenFrame.from_data_url(url)
+            except ValueError:
+                return None
+        if url.sha in self._thumbs:
+            self._thumbs.move_to_end(url.sha)
+            return self._thumbs[url.sha]
+        thumb: Optional[ScreenFrame] = None
+        try:
+            with Image.open(io.BytesIO(url.data)) as im:
+                im.draft("RGB", (self.thumb_dim, self.thumb_dim))
+                data = controller.encode_jpeg(
+                    im.convert("RGB"), self.thumb_dim, self.thumb_quality
+                )
+            thumb = ScreenFrame(data, "image/jpeg")
+        except (ValueError, OSError):
+            pass
+        self._thumbs[url.sha] = thumb
+        if len(self._thumbs) > THUMB_CACHE:
+            self._thumbs.popitem(last=False)
+        return thumb
+
+    def describe(self) -> str:
+        """Return a one-line summary of the last ``fit``."""
+        text = (
+            f"{self.last_bytes / 1024:.0f} KB of "
+            f"{self.max_bytes / 1024:.0f} KB"
+        )
+        if self.thumbnailed:
+            text += f", {self.thumbnailed} screenshots thumbnailed"
+        if self.omitted:
+            text += f", {self.omitted} omitted"
+        if self.dropped:
+            text += f", {self.dropped} messages dropped"
+        return text
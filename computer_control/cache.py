@@ -0,0 +1,218 @@
+"""On-disk cache of model responses for repeatable runs."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from .frames import FRAME_TOLERANCE, frames_match
+
+
+# Number of most recent tool calls that are part of the cache key.
+TOOL_HISTORY = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    context TEXT NOT NULL,
+    digest BLOB,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_context ON responses (context);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+"""
+
+
+def normalize_goal(goal: str) -> str:
+    """Return ``goal`` lower-cased with whitespace collapsed."""
+    return " ".join(goal.lower().split())
+
+
+def tool_history(
+    msgs: Sequence[Dict[str, Any]], count: int = TOOL_HISTORY
+) -> List[List[Any]]:
+    """Return the names and arguments of the last ``count`` tool calls.
+
+    Only the tail of ``msgs`` is scanned, oldest call first.
+    """
+    calls: List[List[Any]] = []
+    for index in range(len(msgs) - 1, -1, -1):
+        for call in reversed(msgs[index].get("tool_calls") or []):
+            func = call.get("function", {})
+            try:
+                args = json.loads(func.get("arguments") or "{}")
+            except json.JSONDecodeError:
+                args = func.get("arguments")
+            calls.append([func.get("name"), args])
+            if len(calls) == count:
+                return calls[::-1]
+    return calls[::-1]
+
+
+def context_key(goal: str, msgs: Sequence[Dict[str, Any]]) -> str:
+    """Return the cache key for ``goal`` and the recent tool history."""
+    text = json.dumps(
+        [normalize_goal(goal), tool_history(msgs)], sort_keys=True
+    )
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """Model responses stored by goal, tool history and screen digest.
+
+    A response is served again when the normalized goal and the last few
+    tool calls are identical and the screen digest matches within
+    ``tolerance`` (see ``frames.frames_match``). Entries expire after
+    ``ttl`` seconds, and the least recently used ones are evicted once
+    there are more than ``max_entries`` or they take more than
+    ``max_bytes``. The cache lives in an SQLite file so several runs can
+    share it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        tolerance: int = FRAME_TOLERANCE,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def lookup(
+        self,
+        goal: str,
+        msgs: Sequence[Dict[str, Any]],
+        digest: Optional[bytes],
+    ) -> Optional[Dict[str, Any]]:
+        """Return the cached response for this state or ``None``.
+
+        Tool call ids in the returned response are fresh so they never
+        clash with earlier ones in the history. Without a ``digest`` the
+        screen is unknown and nothing matches.
+        """
+        if digest is None:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT id, digest, response FROM responses "
+                "WHERE context = ? AND created > ? ORDER BY used DESC",
+                (context_key(goal, msgs), now - self.ttl),
+            ).fetchall()
+            for row_id, stored, response in rows:
+                if frames_match(stored, digest, self.tolerance):
+                    self._db.execute(
+                        "UPDATE responses SET used = ? WHERE id = ?",
+                        (now, row_id),
+                    )
+                    self.hits += 1
+                    return _fresh_ids(json.loads(response))
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        goal: str,
+        msgs: Sequence[Dict[str, Any]],
+        digest: Optional[bytes],
+        response: Dict[str, Any],
+    ) -> None:
+        """Remember ``response`` for this state and evict old entries.
+
+        Nothing is stored without a ``digest``, as it could never match.
+        """
+        if digest is None or not response.get("choices"):
+            return
+        text = json.dumps(response)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO responses "
+                "(context, digest, response, size, created, used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    context_key(goal, msgs),
+                    digest,
+                    text,
+                    len(text) + len(digest),
+                    now,
+                    now,
+                ),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute(
+            "DELETE FROM responses WHERE created <= ?", (now - self.ttl,)
+        )
+        count, size = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        excess_rows = max(0, count - self.max_entries)
+        excess_bytes = size - self.max_bytes
+        dropped = 0
+        freed = 0
+        victims = []
+        for row_id, row_size in self._db.execute(
+            "SELECT id, size FROM responses ORDER BY used ASC"
+        ):
+            if dropped >= excess_rows and freed >= excess_bytes:
+                break
+            victims.append((row_id,))
+            dropped += 1
+            freed += row_size
+        self._db.executemany("DELETE FROM responses WHERE id = ?", victims)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counts plus the number and size of entries."""
+        with self._lock:
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": count,
+            "bytes": size,
+        }
+
+    def describe(self) -> str:
+        """Return a one-line summary of ``stats``."""
+        st = self.stats()
+        return (
+            f"{st['hits']} hits, {st['misses']} misses, {st['entries']} "
+            f"entries ({st['bytes'] / 1024:.0f} KB)"
+        )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+
+def _fresh_ids(response: Dict[str, Any]) -> Dict[str, Any]:
+    for choice in response.get("choices") or []:
+        for call in (choice.get("message") or {}).get("tool_calls") or []:
+            call["id"] = f"call_{uuid.uuid4().hex[:24]}"
+    return response
@@ -0,0 +1,98 @@
+"""Background screenshot capture overlapping the agent loop."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class CaptureWorker:
+    """Run ``capture`` on a worker thread and keep the latest result.
+
+    The worker is double buffered: the front buffer holds the last finished
+    frame while the next one is grabbed and encoded in the background.
+    ``request`` starts a capture, optionally once the UI is expected to have
+    settled, and returns immediately. ``result`` waits for the newest
+    requested frame. Requests made while a capture is running are coalesced
+    into a single follow-up capture.
+    """
+
+    def __init__(self, capture: Callable[..., Any]) -> None:
+        self._capture = capture
+        self._cond = threading.Condition()
+        self._requested = 0
+        self._started = 0
+        self._ready = 0
+        self._due = 0.0
+        self._kwargs: Dict[str, Any] = {}
+        self._front: Any = None
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="capture-worker", daemon=True
+        )
+        self._thread.start()
+
+    def request(self, delay: float = 0.0, **kwargs: Any) -> None:
+        """Capture a new frame ``delay`` seconds from now.
+
+        ``kwargs`` are passed on to the capture function.
+        """
+        with self._cond:
+            self._requested += 1
+            self._due = time.monotonic() + max(0.0, delay)
+            self._kwargs = kwargs
+            self._cond.notify_all()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """Return the frame for the latest ``request``.
+
+        Exceptions raised by the capture function are re-raised here.
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._ready >= self._requested or self._closed,
+                timeout,
+            ):
+                raise TimeoutError("capture did not finish in time")
+            if self._ready < self._requested:
+                raise RuntimeError("capture worker is closed")
+            if self._error is not None:
+                raise self._error
+            return self._front
+
+    def close(self) -> None:
+        """Stop the worker thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._requested > self._started
+                )
+                if self._closed:
+                    return
+                # wait for the settle time unless a newer request moves it
+                while (pause := self._due - time.monotonic()) > 0:
+                    self._cond.wait(pause)
+                    if self._closed:
+                        return
+                generation = self._started = self._requested
+                kwargs = self._kwargs
+
+            frame: Any = None
+            error: Optional[BaseException] = None
+            try:
+                frame = self._capture(**kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                error = exc
+
+            with self._cond:
+                self._front, self._error = frame, error
+                self._ready = generation
+                self._cond.notify_all()
@@ -3,19 +3,53 @@
 from __future__ import annotations
 
 
+import asyncio
+import contextlib
+import functools
 import json
 import os
+import queue
+import threading
 import time
-from typing import Any, Callable, Dict, List, Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import requests
+import requests.adapters
+
+try:
+    import aiohttp  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    aiohttp = None  # type: ignore
 
+from . import balancer
+from . import body
+from . import coalesce
 from . import controller
+from . import hedge
+from . import limiter
+from . import retry
+from . import scheduler
 
 
-POLLINATIONS_API = os.environ.get(
-    "POLLINATIONS_API", "https://text.pollinations.ai/openai"
-)
+# A comma-separated list of compatible endpoints is spread over by
+# ``PollinationsClient``; one-off requests use the first.
+POLLINATIONS_APIS = [
+    url.strip()
+    for url in os.environ.get(
+        "POLLINATIONS_API", "https://text.pollinations.ai/openai"
+    ).split(",")
+    if url.strip()
+]
+POLLINATIONS_API = POLLINATIONS_APIS[0]
 
 POLLINATIONS_REFERRER = os.environ.get(
     "POLLINATIONS_REFERRER", "https://example.com"
@@ -32,10 +66,19 @@ FUNCTIONS_SPEC: List[Dict[str, Any]] = [
         "type": "function",
         "function": {
             "name": "run_shell",
-            "description": "Run a shell command",
+            "description": (
+                "Run a shell command and return its exit code and output"
+            ),
             "parameters": {
                 "type": "object",
-                "properties": {"command": {"type": "string"}},
+                "properties": {
+                    "command": {"type": "string"},
+                    "timeout": {
+                        "type": "number",
+                        "description": "Seconds before it is stopped",
+                        "default": 120,
+                    },
+                },
                 "required": ["command"],
             },
         },
@@ -290,12 +333,9 @@ ACTION_MAP: Dict[str, Callable[..., None]] = {
 }
 
 
-def query_pollinations(
-    messages: List[Dict[str, Any]], retries: int = 3
-) -> Dict[str, Any]:
-    """Send ``messages`` to Pollinations and return the JSON response."""
-
-    payload = {
+def build_payload(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the request body sent to Pollinations for ``messages``."""
+    return {
         "model": "openai",
         "messages": messages,
         "tools": FUNCTIONS_SPEC,
@@ -303,49 +343,709 @@ def query_pollinations(
         "temperature": 0.2,
     }
 
+
+def payload_overhead() -> int:
+    """Return the serialized size of a request body without messages."""
+    return len(json.dumps(build_payload([])))
+
+
+def body_builder() -> body.BodyBuilder:
+    """Return a ``body.BodyBuilder`` for the fields of ``build_payload``."""
+    fields = build_payload([])
+    del fields["messages"]
+    return body.BodyBuilder(fields)
+
+
+# JSON bodies are posted as bytes built by a ``body.BodyBuilder``.
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+_body = body_builder()
+
+# Retry policy of one-off requests made without an installed client.
+_retry = retry.RetryPolicy()
+
+# Rate and concurrency limits shared by all requests of this process.
+_governor = limiter.from_env()
+
+
+def set_governor(governor: limiter.Governor) -> None:
+    """Apply ``governor`` to every request made from now on."""
+    global _governor
+    _governor = governor
+
+
+def get_governor() -> limiter.Governor:
+    """Return the ``limiter.Governor`` shared by all clients."""
+    return _governor
+
+
+def query_pollinations(
+    messages: List[Dict[str, Any]],
+    retries: int = 3,
+    on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Send ``messages`` to Pollinations and return the JSON response.
+
+    The request goes through the client installed with ``set_client`` when
+    there is one and through a one-off connection otherwise. With
+    ``on_tool_call`` the response is streamed and each tool call is passed
+    to it as soon as its arguments are complete; the return value still has
+    the shape of a regular response.
+    """
+
+    if _client is not None:
+        return _client.query(messages, retries, on_tool_call)
     headers = {"Referer": POLLINATIONS_REFERRER}
+    return _send(
+        requests.post,
+        POLLINATIONS_API,
+        messages,
+        headers,
+        30,
+        retries,
+        on_tool_call,
+        _body,
+    )
+
+
+def _api_error(status: int, text: str, err: Any) -> RuntimeError:
+    """Return the error reported for a failed response."""
+    details = {}
+    if isinstance(err, dict):
+        details = err.get("details", {}).get("error", {})
+    if details.get("code") == "content_filter":  # noqa: E501
+        return RuntimeError(
+            "Pollinations blocked the prompt due to content filtering."  # noqa: E501
+        )
+    if status >= 500:
+        return retry.EndpointUnavailable(
+            f"Pollinations API returned {status}: {text}"
+        )
+    return RuntimeError(f"Pollinations API returned {status}: {text}")
+
+
+def _route(
+    lb: Optional[balancer.Balancer], url: str, exclude: Optional[str] = None
+) -> str:
+    """Return the URL for the next request, chosen by ``lb`` if given."""
+    if lb is None:
+        return url
+    skip = lb.backend(exclude) if exclude is not None else None
+    return lb.pick(skip).url
+
+
+class _Route:
+    """The endpoint of one request and its report to ``lb``.
+
+    Without ``lb``, or for a ``url`` it does not balance, the request stays
+    on ``url``. Otherwise the backend serving ``url`` counts the request in
+    flight until ``release`` or ``answered``; ``fail_over`` reports it as
+    failed and moves the request to a healthy backend not tried yet.
+    """
 
-    delay = 1
-    for attempt in range(1, retries + 1):
+    def __init__(self, lb: Optional[balancer.Balancer], url: str) -> None:
+        self.lb = lb
+        self.url = url
+        self.backend = lb.backend(url) if lb is not None else None
+        self.tried: List[balancer.Backend] = []
+        self.started = time.monotonic()
+
+    def release(self, ok: bool, latency: Optional[float] = None) -> None:
+        """Report the outcome of the request to the current backend."""
+        if self.lb is not None and self.backend is not None:
+            self.lb.release(self.backend, ok, latency)
+            self.tried.append(self.backend)
+            self.backend = None
+
+    def answered(self) -> None:
+        """Count the request as finished by the current backend."""
+        self.release(True, time.monotonic() - self.started)
+
+    def fail_over(self) -> bool:
+        """Move the request to another backend; ``False`` if none is left."""
+        if self.lb is None:
+            return False
+        skip = self.tried + [self.backend] if self.backend else self.tried
         try:
-            response = requests.post(
-                POLLINATIONS_API, json=payload, headers=headers, timeout=30
-            )
-        except requests.RequestException as exc:  # network issues  # noqa: E501
-            if attempt == retries:
-                raise RuntimeError(
-                    "Failed to contact Pollinations API"
-                ) from exc  # noqa: E501
-            time.sleep(delay)
-            delay *= 2
+            backend = self.lb.pick(skip, strict=True)
+        except LookupError:
+            return False
+        self.release(False)
+        self.backend = backend
+        self.url = backend.url
+        self.started = time.monotonic()
+        return True
+
+
+@contextlib.contextmanager
+def _tracked(lb: Optional[balancer.Balancer], url: str) -> Iterator[_Route]:
+    """Report the outcome of a request routed to ``url`` back to ``lb``.
+
+    The request counts as finished when the block ends, or earlier when
+    the route's ``answered`` is called, as ``_send`` does once the headers
+    of a streamed response have arrived.
+    """
+    route = _Route(lb, url)
+    try:
+        yield route
+        route.answered()
+    except retry.EndpointUnavailable:
+        route.release(False)
+        raise
+    finally:
+        route.release(True)
+
+
+def _start(
+    policy: retry.RetryPolicy, route: _Route, attempts: int
+) -> retry.RetryState:
+    """Begin a request on ``route``, skipping endpoints failing fast."""
+    while True:
+        try:
+            return policy.start(route.url, attempts)
+        except retry.EndpointUnavailable:
+            if not route.fail_over():
+                raise
+
+
+def _next_attempt(
+    state: retry.RetryState,
+    route: _Route,
+    status: Optional[int] = None,
+    after: Optional[str] = None,
+) -> Optional[float]:
+    """Record a failed attempt and return the wait before the next one.
+
+    A failure worth retrying moves the request at once to another backend
+    of ``route`` while there are untried ones; only when they are used up
+    is the same endpoint retried after a backoff. ``None`` means give up.
+    """
+    wait = state.failed(status, after)
+    if not state.policy.retryable(status) or state.remaining() <= 0:
+        return None
+    moved = False
+    while route.fail_over():
+        moved = True
+        try:
+            state.switch(route.url)
+        except retry.EndpointUnavailable:
             continue
+        return 0.0
+    # a backend skipped for its open breaker cannot be retried either
+    return None if moved else wait
+
+
+def _send(
+    post: Callable[..., Any],
+    url: str,
+    messages: List[Dict[str, Any]],
+    headers: Dict[str, str],
+    timeout: Any,
+    retries: int,
+    on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+    builder: Optional[body.BodyBuilder] = None,
+    policy: Optional[retry.RetryPolicy] = None,
+    route: Optional[_Route] = None,
+) -> Dict[str, Any]:
+    """POST ``messages`` with ``post`` retrying failures under ``policy``.
+
+    The body is built once by ``builder`` and resent unchanged on retries.
+    Given a balanced ``route``, failed attempts move on to other backends
+    (see ``_next_attempt``); at most ``retries`` attempts go to the last
+    one. A streamed response is read after its request slot is given back
+    and the route has been answered, so the tool calls run while it
+    arrives count neither as requests in flight nor as the endpoint's
+    latency.
+    """
+
+    builder = builder or _body
+    extra: Dict[str, Any] = {}
+    if on_tool_call is not None:
+        data = builder.build(messages, stream=True)
+        extra["stream"] = True
+    else:
+        data = builder.build(messages)
+    headers = {**headers, **JSON_HEADERS}
 
-        if not response.ok:  # HTTP error
-            if response.status_code == 413:
-                raise RuntimeError(
-                    "Pollinations API returned 413: request entity too large"
+    route = route or _Route(None, url)
+    state = _start(policy or _retry, route, retries)
+    while True:
+        with _governor.slot():
+            try:
+                response = post(
+                    route.url,
+                    data=data,
+                    headers=headers,
+                    timeout=state.timeout(timeout),
+                    **extra,
                 )
-            if attempt == retries:
-                try:
-                    err = response.json()
-                except Exception:  # pragma: no cover - non-JSON error
-                    err = {}
-                details = err.get("details", {}).get("error", {})
-                if details.get("code") == "content_filter":  # noqa: E501
+            except requests.RequestException as exc:  # network issues  # noqa: E501
+                wait = _next_attempt(state, route)
+                if wait is None:
+                    raise retry.EndpointUnavailable(
+                        "Failed to contact Pollinations API"
+                    ) from exc  # noqa: E501
+            else:
+                if response.ok:
+                    state.succeeded()
+                    if on_tool_call is None:
+                        return response.json()
+                    break
+                if response.status_code == 413:
+                    state.succeeded()
                     raise RuntimeError(
-                        "Pollinations blocked the prompt due to content filtering."  # noqa: E501
+                        "Pollinations API returned 413: request entity too large"  # noqa: E501
+                    )
+                headers_in = getattr(response, "headers", None) or {}
+                wait = _next_attempt(
+                    state,
+                    route,
+                    response.status_code,
+                    headers_in.get("Retry-After"),
+                )
+                if wait is None:
+                    try:
+                        err = response.json()
+                    except Exception:  # pragma: no cover - non-JSON error
+                        err = {}
+                    raise _api_error(
+                        response.status_code, response.text, err
                     ) from None
-                raise RuntimeError(
-                    f"Pollinations API returned {response.status_code}: {response.text}"  # noqa: E501
+        # the slot is free while waiting to retry
+        time.sleep(wait)
+    route.answered()
+    return read_stream(response, on_tool_call)
+
+
+class ToolCallAssembler:
+    """Rebuild a chat message from streamed ``delta`` chunks.
+
+    Tool calls are handed to ``on_tool_call`` in order, each one as soon as
+    its arguments form complete JSON or a later call has started.
+    """
+
+    def __init__(self, on_tool_call: Callable[[Dict[str, Any]], None]):
+        self.on_tool_call = on_tool_call
+        self.content = ""
+        self.calls: List[Dict[str, Any]] = []
+        self.finish_reason: Optional[str] = None
+        self.dispatched = 0
+
+    def feed(self, chunk: Dict[str, Any]) -> None:
+        """Apply one ``chat.completion.chunk``."""
+        choice = (chunk.get("choices") or [{}])[0]
+        delta = choice.get("delta") or {}
+        self.content += delta.get("content") or ""
+        for part in delta.get("tool_calls") or []:
+            index = part.get("index", max(0, len(self.calls) - 1))
+            while len(self.calls) <= index:
+                self.calls.append(
+                    {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    }
                 )
-            time.sleep(delay)
-            delay *= 2
-            continue
+            call = self.calls[index]
+            call["id"] = part.get("id") or call["id"]
+            func = part.get("function") or {}
+            call["function"]["name"] += func.get("name") or ""
+            call["function"]["arguments"] += func.get("arguments") or ""
+        self.finish_reason = choice.get("finish_reason") or self.finish_reason
+        self._dispatch()
+
+    def _dispatch(self, final: bool = False) -> None:
+        while self.dispatched < len(self.calls):
+            call = self.calls[self.dispatched]
+            later = self.dispatched < len(self.calls) - 1
+            if not (final or later or self._complete(call)):
+                return
+            self.dispatched += 1
+            self.on_tool_call(call)
+
+    @staticmethod
+    def _complete(call: Dict[str, Any]) -> bool:
+        args = call["function"]["arguments"].rstrip()
+        if not call["function"]["name"] or not args.endswith("}"):
+            return False
+        try:
+            json.loads(args)
+        except json.JSONDecodeError:
+            return False
+        return True
+
+    def finish(self) -> Dict[str, Any]:
+        """Dispatch what is left and return the assembled response."""
+        self._dispatch(final=True)
+        message: Dict[str, Any] = {
+            "role": "assistant",
+            "content": self.content,
+        }
+        if self.calls:
+            message["tool_calls"] = self.calls
+        return {
+            "choices": [
+                {"message": message, "finish_reason": self.finish_reason}
+            ]
+        }
+
+
+def _event_lines(response: Any) -> Iterator[str]:
+    """Yield the lines of a streamed ``response`` as soon as they arrive.
+
+    ``iter_lines`` waits for whole 512 byte blocks, which would hold back
+    small events. The raw stream is read with ``decode_content`` since
+    ``requests`` leaves a compressed body, which it asks for, compressed.
+    """
+    read = getattr(response.raw, "read1", None)
+    if read is None:
+        for raw in response.iter_lines():
+            yield raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        return
+    pending = b""
+    while chunk := read(65536, decode_content=True):
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8")
+    if pending:
+        yield pending.rstrip(b"\r").decode("utf-8")
+
+
+def read_stream(
+    response: Any, on_tool_call: Callable[[Dict[str, Any]], None]
+) -> Dict[str, Any]:
+    """Consume a server-sent events ``response`` and return the message.
+
+    The events are read on a separate thread while ``on_tool_call`` runs
+    on this one, so a slow action or a confirmation prompt neither stalls
+    the connection into its read timeout nor delays reading the rest.
+    Calls still waiting when the stream fails are not executed.
+    Servers that answer with plain JSON are handled too; their tool calls
+    are dispatched once the body has arrived.
+    """
+    ctype = response.headers.get("Content-Type", "")
+    if "text/event-stream" not in ctype:
+        data = response.json()
+        message = (data.get("choices") or [{}])[0].get("message") or {}
+        for call in message.get("tool_calls") or []:
+            on_tool_call(call)
+        return data
+
+    calls: "queue.Queue[Any]" = queue.Queue()
+    end = object()
+    outcome: List[Any] = []
+
+    def reader() -> None:
+        try:
+            outcome.append(_read_events(response, calls.put))
+        except BaseException as exc:  # handed to the caller
+            outcome.append(exc)
+        finally:
+            calls.put(end)
+
+    threading.Thread(target=reader, name="stream", daemon=True).start()
+    try:
+        while (call := calls.get()) is not end:
+            if outcome and isinstance(outcome[0], BaseException):
+                # the turn failed; calls still queued are dropped
+                break
+            on_tool_call(call)
+    except BaseException:
+        # stops the reader; it is not waited for
+        response.close()
+        raise
+    if isinstance(outcome[0], BaseException):
+        raise outcome[0]
+    return outcome[0]
+
+
+def _read_events(
+    response: Any, on_tool_call: Callable[[Dict[str, Any]], None]
+) -> Dict[str, Any]:
+    assembler = ToolCallAssembler(on_tool_call)
+    lines: List[str] = []
+    try:
+        for line in _event_lines(response):
+            if line.startswith("data:"):
+                lines.append(line[5:].strip())
+                continue
+            if line or not lines:
+                continue  # comments and other fields
+            data = "\n".join(lines)
+            lines = []
+            if data == "[DONE]":
+                break
+            assembler.feed(json.loads(data))
+    except requests.RequestException as exc:
+        raise RuntimeError("Pollinations stream was interrupted") from exc
+    except ValueError as exc:
+        raise RuntimeError("Pollinations sent an invalid stream") from exc
+    finally:
+        response.close()
+    return assembler.finish()
+
+
+class StreamDispatcher:
+    """Execute streamed tool calls one by one as they arrive.
+
+    Used as the ``on_tool_call`` of ``query_pollinations``. The wait that
+    ``execute_tool_calls`` does between actions happens before each call
+    after the first, and after the last one only in ``finish``.
+    """
+
+    def __init__(
+        self,
+        dry_run: bool = False,
+        secure: bool = False,
+        delay: float = 0.0,
+        settle: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.dry_run = dry_run
+        self.secure = secure
+        self.delay = delay
+        self.settle = settle
+        self.results: List[Dict[str, Any]] = []
+        self.calls = 0
+        self.cancelled = False
+
+    def __call__(self, call: Dict[str, Any]) -> None:
+        if self.cancelled:
+            return
+        if self.calls:
+            self._pause()
+        self.calls += 1
+        self.results.extend(
+            execute_tool_calls(
+                [call],
+                dry_run=self.dry_run,
+                secure=self.secure,
+                delay=self.delay,
+                trailing_delay=False,
+                settle=self.settle,
+            )
+            or []
+        )
+
+    def _pause(self) -> None:
+        if self.settle is not None and not self.dry_run:
+            self.settle()
+        elif self.delay > 0:
+            time.sleep(self.delay)
+
+    def finish(self, trailing_delay: bool = True) -> List[Dict[str, Any]]:
+        """Return the tool messages, waiting after the last action first."""
+        if self.calls and trailing_delay:
+            self._pause()
+        return self.results
+
+    def cancel(self) -> None:
+        """Skip the calls that would still be dispatched."""
+        self.cancelled = True
+
+
+class PollinationsClient:
+    """Pollinations API client reusing connections between requests.
+
+    A pooled ``requests.Session`` keeps up to ``pool_size`` connections
+    alive, so only the first request of a session pays for DNS, TCP and TLS
+    setup. ``connect_timeout`` and ``read_timeout`` bound the two phases of
+    each attempt separately. Failed attempts are retried as
+    ``retry_policy`` decides, by default a fresh ``retry.RetryPolicy``.
+
+    With a ``hedge.Hedger`` as ``hedger`` a request that runs longer than
+    usual is sent a second time, to ``hedge_url`` if given, and the first
+    answer is used. Streamed requests are never hedged since their tool
+    calls are executed while they arrive.
+
+    Given several ``urls`` (by default those in ``POLLINATIONS_API``), each
+    request goes to the endpoint a ``balancer.Balancer`` with ``strategy``
+    picks, and a hedge goes to a different one. ``url`` is the single
+    endpoint otherwise.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        referrer: Optional[str] = None,
+        pool_size: int = 4,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        retry_policy: Optional[retry.RetryPolicy] = None,
+        hedger: Optional[hedge.Hedger] = None,
+        hedge_url: Optional[str] = None,
+        urls: Optional[Sequence[str]] = None,
+        strategy: str = "least",
+    ) -> None:
+        urls = list(urls or ([url] if url else POLLINATIONS_APIS))
+        self.url = urls[0]
+        self.urls = urls
+        self.balancer = (
+            balancer.Balancer(urls, strategy) if len(urls) > 1 else None
+        )
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry_policy = retry_policy or retry.RetryPolicy()
+        self.hedger = hedger
+        self.hedge_url = hedge_url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(urls),
+            pool_maxsize=pool_size,
+            pool_block=False,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {
+                "Referer": referrer or POLLINATIONS_REFERRER,
+                "Connection": "keep-alive",
+            }
+        )
+        self._warm_thread: Optional[threading.Thread] = None
+        self.body = body_builder()
+
+    def query(
+        self,
+        messages: List[Dict[str, Any]],
+        retries: int = 3,
+        on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Send ``messages`` and return the JSON response.
+
+        See ``query_pollinations`` for ``on_tool_call``.
+        """
+
+        def send(url: str) -> Dict[str, Any]:
+            with _tracked(self.balancer, url) as route:
+                return _send(
+                    self.session.post,
+                    url,
+                    messages,
+                    {},
+                    self.timeout,
+                    retries,
+                    on_tool_call,
+                    self.body,
+                    self.retry_policy,
+                    route,
+                )
+
+        primary = _route(self.balancer, self.url)
+        if self.hedger is None or on_tool_call is not None:
+            return send(primary)
+        return self.hedger.run(
+            send,
+            primary,
+            self.hedge_url
+            or (lambda: _route(self.balancer, self.url, primary)),
+        )
+
+    def warm_up(self, background: bool = False) -> bool:
+        """Open a pooled connection to each endpoint before querying.
+
+        Any HTTP response counts as success since only the connection is
+        wanted. With ``background`` the connection is opened on a daemon
+        thread and ``True`` is returned immediately.
+        """
+        if background:
+            self._warm_thread = threading.Thread(
+                target=self.warm_up, name="http-warm-up", daemon=True
+            )
+            self._warm_thread.start()
+            return True
+        warmed = False
+        for url in self.urls:
+            try:
+                self.session.head(url, timeout=self.timeout).close()
+            except requests.RequestException:
+                continue
+            warmed = True
+        return warmed
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        if self._warm_thread is not None:
+            self._warm_thread.join(self.timeout[0])
+        if self.hedger is not None:
+            self.hedger.close()
+        self.session.close()
+
+    def __enter__(self) -> "PollinationsClient":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
 
-        return response.json()
+_client: Optional[PollinationsClient] = None
 
-    # should never reach here
-    raise RuntimeError("Failed to contact Pollinations API")
+
+def set_client(pc: Optional[PollinationsClient]) -> None:
+    """Send ``query_pollinations`` requests through ``pc``.
+
+    Passing ``None`` closes the current client and restores one-off
+    requests.
+    """
+    global _client
+    if _client is not None and _client is not pc:
+        _client.close()
+    _client = pc
+
+
+def _tool_message(call_id: str, name: Any, content: str) -> Dict[str, Any]:
+    return {
+        "role": "tool",
+        "tool_call_id": call_id,
+        "name": name,
+        "content": content,
+    }
+
+
+def _run_tool_call(
+    call: Dict[str, Any], dry_run: bool = False, secure: bool = False
+) -> Tuple[Dict[str, Any], Optional[bool]]:
+    """Run one tool call and return its message and what happened.
+
+    The flag is ``True`` if the action ran, ``False`` if it was skipped or
+    only printed, and ``None`` if the call was invalid.
+    """
+    call_id = call.get("id", "")
+    name = call.get("function", {}).get("name")
+    args = call.get("function", {}).get("arguments", "{}")
+
+    if not name:
+        print(f"Unknown tool call without name: {call}")
+        return _tool_message(call_id, name, "error: missing name"), None
+
+    func = ACTION_MAP.get(name)
+    if not func:
+        print(f"Unknown tool {name}")
+        return _tool_message(call_id, name, "error: unknown tool"), None
+
+    try:
+        params = json.loads(args) if args else {}
+    except json.JSONDecodeError:
+        print(f"Invalid arguments for {name}: {args}")
+        return _tool_message(call_id, name, "error: bad args"), None
+
+    print(f"{name}({params})")
+    if secure:
+        resp = input(f"Execute {name}? [y/N] ")
+        if resp.lower() not in ("y", "yes"):
+            print(f"Skipped {name}")
+            return _tool_message(call_id, name, "skipped"), False
+
+    if dry_run:
+        print(f"[DRY-RUN] {name}({params})")
+        return _tool_message(call_id, name, "dry-run"), False
+
+    try:
+        result = func(**params)
+        print(f"Executed {name}")
+        content = "" if result is None else str(result)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"Error executing {name}: {exc}")
+        content = f"error: {exc}"
+    return _tool_message(call_id, name, content), True
 
 
 def execute_tool_calls(
@@ -354,108 +1054,385 @@ def execute_tool_calls(
     secure: bool = False,
     delay: float = 0.0,
     console: Optional[Any] = None,
+    trailing_delay: bool = True,
+    settle: Optional[Callable[[], Any]] = None,
+    optimize: bool = True,
 ) -> List[Dict[str, Any]]:
-    """Run the tool calls returned by the model and return tool messages."""
-
-    results: List[Dict[str, Any]] = []
-
-    for call in tool_calls:
-        call_id = call.get("id", "")
-        name = call.get("function", {}).get("name")
-        args = call.get("function", {}).get("arguments", "{}")
-
-        if not name:
-            print(f"Unknown tool call without name: {call}")
-            results.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": name,
-                    "content": "error: missing name",
-                }
+    """Run the tool calls returned by the model and return tool messages.
+
+    ``delay`` seconds are slept after each call. If ``settle`` is given it
+    is called after each executed action instead, typically to wait until
+    the screen stops changing. With ``trailing_delay`` unset the wait after
+    the last call is skipped so the caller can handle it itself.
+
+    With ``optimize`` runs of calls that ``coalesce.plan`` can merge are
+    executed as one action, and adjacent shell and file operations run
+    concurrently as ``scheduler.plan`` allows, waited for as one action.
+    Either way there is one message per tool call, in the original order.
+    With ``secure`` or ``dry_run`` the calls always run one at a time, and
+    with ``secure`` they are not merged either, so each call confirmed is
+    one the model issued.
+    """
+
+    calls = tool_calls
+    groups: Optional[List[coalesce.Group]] = None
+    if optimize and not secure and len(tool_calls) > 1:
+        planned = coalesce.plan(tool_calls)
+        if len(planned) < len(tool_calls):
+            print(
+                f"Coalesced {len(tool_calls)} tool calls into "
+                f"{len(planned)} actions"
             )
-            continue
+            groups = planned
+            calls = [call for call, _ in planned]
 
-        func = ACTION_MAP.get(name)
-        if not func:
-            print(f"Unknown tool {name}")
-            results.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": name,
-                    "content": "error: unknown tool",
-                }
+    if optimize and not (secure or dry_run):
+        runs = scheduler.plan(calls)
+    else:
+        runs = [[index] for index in range(len(calls))]
+    results: List[Dict[str, Any]] = [{} for _ in calls]
+    last = len(runs) - 1
+
+    for index, run in enumerate(runs):
+        if len(run) == 1:
+            outcomes = [_run_tool_call(calls[run[0]], dry_run, secure)]
+        else:
+            print(f"Running {len(run)} tool calls concurrently")
+            outcomes = scheduler.run(
+                [calls[n] for n in run],
+                functools.partial(_run_tool_call, dry_run=dry_run),
             )
+        for n, (message, _) in zip(run, outcomes):
+            results[n] = message
+        acted = [ran for _, ran in outcomes if ran is not None]
+        if not acted:
             continue
+        final = index == last and not trailing_delay
+        if settle is not None and any(acted):
+            if not final:
+                settle()
+        elif delay > 0 and not final:
+            time.sleep(delay)
 
-        try:
-            params = json.loads(args) if args else {}
-        except json.JSONDecodeError:
-            print(f"Invalid arguments for {name}: {args}")
-            results.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": name,
-                    "content": "error: bad args",
-                }
+    if groups is not None:
+        return coalesce.expand(tool_calls, groups, results)
+    return results
+
+
+class AsyncPollinationsClient:
+    """Asyncio counterpart of ``PollinationsClient`` built on ``aiohttp``.
+
+    One instance can be shared by many sessions running in the same event
+    loop; they draw from a pool of at most ``pool_size`` keep-alive
+    connections. Requests, their retry backoff and streamed responses are
+    all awaitable and stop cleanly when the awaiting task is cancelled.
+    Retries follow ``retry_policy``, hedging ``hedger`` and ``hedge_url``
+    and balancing ``urls`` and ``strategy`` as in ``PollinationsClient``;
+    the losing copy of a hedged request is cancelled.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        referrer: Optional[str] = None,
+        pool_size: int = 4,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        retry_policy: Optional[retry.RetryPolicy] = None,
+        hedger: Optional[hedge.Hedger] = None,
+        hedge_url: Optional[str] = None,
+        urls: Optional[Sequence[str]] = None,
+        strategy: str = "least",
+    ) -> None:
+        if aiohttp is None:
+            raise RuntimeError("AsyncPollinationsClient requires aiohttp")
+        urls = list(urls or ([url] if url else POLLINATIONS_APIS))
+        self.url = urls[0]
+        self.urls = urls
+        self.balancer = (
+            balancer.Balancer(urls, strategy) if len(urls) > 1 else None
+        )
+        self.referrer = referrer or POLLINATIONS_REFERRER
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self._session: Any = None
+        self.body = body_builder()
+        self.retry_policy = retry_policy or retry.RetryPolicy()
+        self.hedger = hedger
+        self.hedge_url = hedge_url
+
+    def _get_session(self) -> Any:
+        # aiohttp sessions belong to the loop they are created in
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                headers={"Referer": self.referrer},
             )
-            continue
+        return self._session
 
-        print(f"{name}({params})")
-        if secure:
-            resp = input(f"Execute {name}? [y/N] ")
-            if resp.lower() not in ("y", "yes"):
-                print(f"Skipped {name}")
-                results.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": call_id,
-                        "name": name,
-                        "content": "skipped",
-                    }
-                )
-                if delay > 0:
-                    time.sleep(delay)
+    async def query(
+        self,
+        messages: List[Dict[str, Any]],
+        retries: int = 3,
+        on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Send ``messages`` and return the JSON response.
+
+        See ``query_pollinations`` for ``on_tool_call``; it is called from
+        the event loop and must not block.
+        """
+        if on_tool_call is not None:
+            data = self.body.build(messages, stream=True)
+        else:
+            data = self.body.build(messages)
+
+        async def send(url: str) -> Dict[str, Any]:
+            with _tracked(self.balancer, url) as route:
+                return await self._post(route, data, retries, on_tool_call)
+
+        primary = _route(self.balancer, self.url)
+        if self.hedger is None or on_tool_call is not None:
+            return await send(primary)
+        return await self.hedger.run_async(
+            send,
+            primary,
+            self.hedge_url
+            or (lambda: _route(self.balancer, self.url, primary)),
+        )
+
+    async def _post(
+        self,
+        route: _Route,
+        data: bytes,
+        retries: int,
+        on_tool_call: Optional[Callable[[Dict[str, Any]], None]],
+    ) -> Dict[str, Any]:
+        """POST ``data`` along ``route`` retrying failures."""
+        session = self._get_session()
+        state = _start(self.retry_policy, route, retries)
+        while True:
+            async with _governor.slot_async():
+                try:
+                    async with session.post(
+                        route.url,
+                        data=data,
+                        headers=JSON_HEADERS,
+                        timeout=aiohttp.ClientTimeout(
+                            total=max(0.001, state.remaining()),
+                            sock_connect=self.timeout.sock_connect,
+                            sock_read=self.timeout.sock_read,
+                        ),
+                    ) as response:
+                        if response.status < 400:
+                            state.succeeded()
+                            if on_tool_call is not None:
+                                return await self._read_stream(
+                                    response, on_tool_call
+                                )
+                            return await response.json(content_type=None)
+                        if response.status == 413:
+                            state.succeeded()
+                            raise RuntimeError(
+                                "Pollinations API returned 413: request entity too large"  # noqa: E501
+                            )
+                        text = await response.text()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                    wait = _next_attempt(state, route)
+                    if wait is None:
+                        raise retry.EndpointUnavailable(
+                            "Failed to contact Pollinations API"
+                        ) from exc
+                else:
+                    wait = _next_attempt(
+                        state,
+                        route,
+                        response.status,
+                        response.headers.get("Retry-After"),
+                    )
+                    if wait is None:
+                        try:
+                            err = json.loads(text)
+                        except ValueError:
+                            err = {}
+                        raise _api_error(response.status, text, err)
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    async def _read_stream(
+        response: Any, on_tool_call: Callable[[Dict[str, Any]], None]
+    ) -> Dict[str, Any]:
+        if "text/event-stream" not in response.headers.get(
+            "Content-Type", ""
+        ):
+            data = await response.json(content_type=None)
+            message = (data.get("choices") or [{}])[0].get("message") or {}
+            for call in message.get("tool_calls") or []:
+                on_tool_call(call)
+            return data
+
+        assembler = ToolCallAssembler(on_tool_call)
+        lines: List[str] = []
+        try:
+            async for raw in response.content:
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line.startswith("data:"):
+                    lines.append(line[5:].strip())
+                    continue
+                if line or not lines:
+                    continue
+                data = "\n".join(lines)
+                lines = []
+                if data == "[DONE]":
+                    break
+                assembler.feed(json.loads(data))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise RuntimeError("Pollinations stream was interrupted") from exc
+        except ValueError as exc:
+            raise RuntimeError("Pollinations sent an invalid stream") from exc
+        return assembler.finish()
+
+    async def warm_up(self) -> bool:
+        """Open a pooled connection to each endpoint before querying."""
+        warmed = False
+        for url in self.urls:
+            try:
+                async with self._get_session().head(url):
+                    pass
+            except (aiohttp.ClientError, asyncio.TimeoutError):
                 continue
+            warmed = True
+        return warmed
+
+    async def close(self) -> None:
+        """Close all pooled connections."""
+        if self.hedger is not None:
+            self.hedger.close()
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self) -> "AsyncPollinationsClient":
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.close()
 
-        if dry_run:
-            print(f"[DRY-RUN] {name}({params})")
-            results.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": name,
-                    "content": "dry-run",
-                }
-            )
-            if delay > 0:
-                time.sleep(delay)
-            continue
 
+async def in_thread(
+    func: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Any:
+    """Run ``func`` on the loop's default executor and await the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def execute_tool_calls_async(
+    tool_calls: List[Dict[str, Any]],
+    dry_run: bool = False,
+    secure: bool = False,
+    delay: float = 0.0,
+    trailing_delay: bool = True,
+    settle: Optional[Callable[[], Any]] = None,
+    optimize: bool = True,
+) -> List[Dict[str, Any]]:
+    """Awaitable ``execute_tool_calls``.
+
+    Each action runs on a worker thread and the waits between them are
+    ``asyncio`` sleeps, so cancelling the task stops before the next action.
+    """
+    groups = (
+        coalesce.plan(tool_calls)
+        if optimize and not secure
+        else [(call, [n]) for n, call in enumerate(tool_calls)]
+    )
+    dispatcher = AsyncStreamDispatcher(dry_run, secure, delay, settle)
+    for call, _ in groups:
+        dispatcher(call)
+    results = await dispatcher.finish(trailing_delay)
+    if len(groups) == len(tool_calls):
+        return results
+    return coalesce.expand(tool_calls, groups, results)
+
+
+class AsyncStreamDispatcher:
+    """Asyncio ``StreamDispatcher`` executing calls on a background task.
+
+    Calling the dispatcher only queues the tool call, so the event loop can
+    keep reading the stream while earlier actions run.
+    """
+
+    def __init__(
+        self,
+        dry_run: bool = False,
+        secure: bool = False,
+        delay: float = 0.0,
+        settle: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.dry_run = dry_run
+        self.secure = secure
+        self.delay = delay
+        self.settle = settle
+        self.results: List[Dict[str, Any]] = []
+        self.calls = 0
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def __call__(self, call: Dict[str, Any]) -> None:
+        self._queue.put_nowait(call)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            call = await self._queue.get()
+            try:
+                if self.calls:
+                    await self._pause()
+                self.calls += 1
+                results = await in_thread(
+                    execute_tool_calls,
+                    [call],
+                    dry_run=self.dry_run,
+                    secure=self.secure,
+                    delay=self.delay,
+                    trailing_delay=False,
+                    settle=self.settle,
+                )
+                self.results.extend(results or [])
+            finally:
+                self._queue.task_done()
+
+    async def _pause(self) -> None:
+        if self.settle is not None and not self.dry_run:
+            await in_thread(self.settle)
+        elif self.delay > 0:
+            await asyncio.sleep(self.delay)
+
+    async def finish(
+        self, trailing_delay: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Wait for queued calls and return their tool messages."""
         try:
-            result = func(**params)
-            print(f"Executed {name}")
-            results.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": name,
-                    "content": "" if result is None else str(result),
-                }
-            )
-        except Exception as exc:  # pylint: disable=broad-except
-            print(f"Error executing {name}: {exc}")
-            results.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": name,
-                    "content": f"error: {exc}",
-                }
-            )
-        if delay > 0:
-            time.sleep(delay)
+            if self._task is not None:
+                joined = asyncio.ensure_future(self._queue.join())
+                await asyncio.wait(
+                    {joined, self._task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                joined.cancel()
+                if self._task.done():
+                    self._task.result()  # re-raise what stopped the worker
+            if self.calls and trailing_delay:
+                await self._pause()
+        finally:
+            self.cancel()
+        return self.results
 
-    return results
+    def cancel(self) -> None:
+        """Stop executing queued calls."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,161 @@
+"""Type long text by pasting it through the system clipboard.
+
+``pyautogui.write`` presses one key per character with a pause after each
+and cannot type characters outside ASCII. ``paste`` instead places the
+text on the clipboard, presses the paste shortcut and then puts the
+previous clipboard text back.
+
+The clipboard is reached through the platform's tools: ``pbcopy`` and
+``pbpaste`` on macOS, ``wl-copy`` and ``wl-paste`` under Wayland, and
+``xclip`` or ``xsel`` under X11, which keep running in the background as
+the owner of the X selection until something else is copied. Windows uses
+the clipboard of ``tkinter``.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Callable, List, Optional
+
+try:
+    import tkinter as tk
+except Exception:  # pragma: no cover - optional dependency
+    tk = None  # type: ignore
+
+# Seconds the pasted text stays on the clipboard before the previous text
+# is restored; the target application reads it after the key press.
+RESTORE_DELAY = 0.3
+# Seconds a clipboard tool may take.
+TOOL_TIMEOUT = 2.0
+
+
+class ClipboardError(RuntimeError):
+    """The clipboard could not be read or written."""
+
+
+class CommandClipboard:
+    """Clipboard reached through a copy and a paste command."""
+
+    def __init__(self, copy: List[str], paste: List[str]) -> None:
+        self.copy = copy
+        self.paste = paste
+
+    def get(self) -> Optional[str]:
+        """Return the clipboard text, or ``None`` if it holds none."""
+        try:
+            done = subprocess.run(
+                self.paste,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                timeout=TOOL_TIMEOUT,
+            )
+        except (OSError, subprocess.SubprocessError) as exc:
+            raise ClipboardError(f"cannot read the clipboard: {exc}") from exc
+        if done.returncode != 0:
+            return None
+        return done.stdout.decode("utf-8", "replace")
+
+    def set(self, text: str) -> None:
+        # the tool may stay in the background to serve the selection, so
+        # its output must not be a pipe this process waits on
+        try:
+            subprocess.run(
+                self.copy,
+                input=text.encode("utf-8"),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=TOOL_TIMEOUT,
+                check=True,
+            )
+        except (OSError, subprocess.SubprocessError) as exc:
+            raise ClipboardError(f"cannot write the clipboard: {exc}") from exc
+
+
+class TkClipboard:  # pragma: no cover - Windows
+    """Clipboard of ``tkinter``; its content outlives the window only on
+    Windows."""
+
+    def _root(self) -> "tk.Tk":
+        try:
+            root = tk.Tk()
+        except Exception as exc:
+            raise ClipboardError(f"no clipboard: {exc}") from exc
+        root.withdraw()
+        return root
+
+    def get(self) -> Optional[str]:
+        root = self._root()
+        try:
+            return root.clipboard_get()
+        except Exception:
+            return None
+        finally:
+            root.destroy()
+
+    def set(self, text: str) -> None:
+        root = self._root()
+        try:
+            root.clipboard_clear()
+            root.clipboard_append(text)
+            root.update()
+        finally:
+            root.destroy()
+
+
+def detect() -> Optional[object]:
+    """Return a clipboard for this system, or ``None`` if there is none."""
+    if sys.platform == "darwin":
+        if shutil.which("pbcopy") and shutil.which("pbpaste"):
+            return CommandClipboard(["pbcopy"], ["pbpaste"])
+        return None
+    if os.name == "nt":  # pragma: no cover - Windows
+        return TkClipboard() if tk is not None else None
+    if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-copy"):
+        return CommandClipboard(["wl-copy"], ["wl-paste", "--no-newline"])
+    if not os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("xclip"):
+        return CommandClipboard(
+            ["xclip", "-selection", "clipboard", "-in"],
+            ["xclip", "-selection", "clipboard", "-out"],
+        )
+    if shutil.which("xsel"):
+        return CommandClipboard(
+            ["xsel", "--clipboard", "--input"],
+            ["xsel", "--clipboard", "--output"],
+        )
+    return None
+
+
+def paste(
+    text: str,
+    press: Callable[[], None],
+    board: Optional[object] = None,
+) -> bool:
+    """Paste ``text`` with the shortcut ``press`` sends.
+
+    ``board`` defaults to ``detect()``. Returns ``False``, with nothing
+    pressed, if the text cannot be put on the clipboard; the caller should
+    type it instead. Clipboard text from before is restored; other content,
+    such as an image, is not.
+    """
+    board = board if board is not None else detect()
+    if board is None:
+        return False
+    try:
+        previous = board.get()  # type: ignore[attr-defined]
+        board.set(text)  # type: ignore[attr-defined]
+    except ClipboardError:
+        return False
+    press()
+    time.sleep(RESTORE_DELAY)
+    if previous is not None:
+        try:
+            board.set(previous)  # type: ignore[attr-defined]
+        except ClipboardError:
+            pass
+    return True
@@ -0,0 +1,199 @@
+"""Rewrite a batch of tool calls into fewer, equivalent actions.
+
+Models often spell out every low-level step: a ``move_mouse`` right before
+a ``click`` on the same spot, text typed in several ``write_text`` pieces,
+or a shortcut as ``key_down``/``press_key``/``key_up``. Each action costs a
+round of ``pyautogui``'s pause plus the delay between actions, so ``plan``
+merges such runs before they are executed and ``expand`` turns the results
+back into one tool message per original call.
+
+Only adjacent calls are merged; a call with an unknown name or invalid
+arguments is left alone and separates the calls around it.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# A call to execute and the indices of the original calls it stands for.
+Group = Tuple[Dict[str, Any], List[int]]
+
+# Pointer actions that move the mouse to their own ``x``, ``y`` first.
+POSITIONED = frozenset({"click", "double_click"})
+
+
+class _Action:
+    __slots__ = ("name", "params", "indices")
+
+    def __init__(
+        self, name: str, params: Dict[str, Any], indices: List[int]
+    ) -> None:
+        self.name = name
+        self.params = params
+        self.indices = indices
+
+    def follows(self, other: "_Action") -> bool:
+        return self.indices[0] == other.indices[-1] + 1
+
+    def key(self) -> Optional[str]:
+        key = self.params.get("key")
+        return key if isinstance(key, str) and len(self.params) == 1 else None
+
+
+def _parse(index: int, call: Dict[str, Any]) -> Optional[_Action]:
+    func = call.get("function") or {}
+    name = func.get("name")
+    if not name:
+        return None
+    try:
+        params = json.loads(func.get("arguments") or "{}")
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(params, dict):
+        return None
+    return _Action(name, params, [index])
+
+
+def _redundant_move(move: _Action, then: _Action) -> bool:
+    """Return ``True`` if ``then`` makes the earlier ``move`` pointless."""
+    if move.name != "move_mouse" or not then.follows(move):
+        return False
+    if then.name == "move_mouse":
+        return True
+    return then.name in POSITIONED and all(
+        then.params.get(axis) == move.params.get(axis) for axis in "xy"
+    )
+
+
+def _text(action: _Action) -> Optional[str]:
+    text = action.params.get("text")
+    if action.name != "write_text" or len(action.params) != 1:
+        return None
+    return text if isinstance(text, str) else None
+
+
+def _hotkey(
+    actions: List[_Action], start: int
+) -> Optional[Tuple[_Action, int]]:
+    """Match a key sequence at ``start`` and return it as one ``hotkey``.
+
+    The sequence is one or more ``key_down``, an optional ``press_key`` and
+    a ``key_up`` for each held key in reverse order. The index after it is
+    returned too.
+    """
+    downs: List[str] = []
+    i = start
+    while i < len(actions) and actions[i].name == "key_down":
+        key = actions[i].key()
+        if key is None or i > start and not actions[i].follows(actions[i - 1]):
+            break
+        downs.append(key)
+        i += 1
+    if not downs:
+        return None
+    keys = list(downs)
+    if (
+        i < len(actions)
+        and actions[i].name == "press_key"
+        and actions[i].follows(actions[i - 1])
+        and actions[i].key() is not None
+    ):
+        keys.append(actions[i].key() or "")
+        i += 1
+    for key in reversed(downs):
+        if (
+            i >= len(actions)
+            or actions[i].name != "key_up"
+            or actions[i].key() != key
+            or not actions[i].follows(actions[i - 1])
+        ):
+            return None
+        i += 1
+    indices = [n for a in actions[start:i] for n in a.indices]
+    return _Action("hotkey", {"keys": keys}, indices), i
+
+
+def plan(tool_calls: List[Dict[str, Any]]) -> List[Group]:
+    """Return the calls to execute in place of ``tool_calls``.
+
+    Redundant moves are dropped, adjacent ``write_text`` calls are joined
+    and key sequences become a ``hotkey``. Every original call belongs to
+    exactly one group, and groups keep the original order.
+    """
+    actions: List[_Action] = []
+    passthrough: Dict[int, Dict[str, Any]] = {}
+    for index, call in enumerate(tool_calls):
+        action = _parse(index, call)
+        if action is None:
+            passthrough[index] = call
+        else:
+            actions.append(action)
+
+    merged: List[_Action] = []
+    i = 0
+    while i < len(actions):
+        combo = _hotkey(actions, i)
+        if combo is not None:
+            action, i = combo
+        else:
+            action = actions[i]
+            i += 1
+        prev = merged[-1] if merged else None
+        if prev is not None and _redundant_move(prev, action):
+            merged.pop()
+            action = _Action(
+                action.name, action.params, prev.indices + action.indices
+            )
+        elif prev is not None and action.follows(prev):
+            first, second = _text(prev), _text(action)
+            if first is not None and second is not None:
+                merged[-1] = _Action(
+                    "write_text",
+                    {"text": first + second},
+                    prev.indices + action.indices,
+                )
+                continue
+        merged.append(action)
+
+    groups: List[Group] = []
+    for action in merged:
+        if len(action.indices) == 1:
+            call = tool_calls[action.indices[0]]
+        else:
+            call = {
+                "id": tool_calls[action.indices[0]].get("id", ""),
+                "type": "function",
+                "function": {
+                    "name": action.name,
+                    "arguments": json.dumps(action.params),
+                },
+            }
+        groups.append((call, action.indices))
+    groups.extend((call, [index]) for index, call in passthrough.items())
+    groups.sort(key=lambda group: group[1][0])
+    return groups
+
+
+def expand(
+    tool_calls: List[Dict[str, Any]],
+    groups: List[Group],
+    results: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Return one tool message per call of ``tool_calls``.
+
+    ``results`` holds the message of each group's call; its content is
+    reported for every original call of the group.
+    """
+    messages: List[Dict[str, Any]] = []
+    for (_, indices), result in zip(groups, results):
+        for index in indices:
+            call = tool_calls[index]
+            messages.append(
+                {
+                    **result,
+                    "tool_call_id": call.get("id", ""),
+                    "name": (call.get("function") or {}).get("name"),
+                }
+            )
+    return messages
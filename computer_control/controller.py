@@ -10,9 +10,11 @@ import sys
 import shutil
 import tempfile
 import webbrowser
-from typing import Any, List, Dict, Sequence
+from typing import Any, List, Dict, Optional, Sequence
 from PIL import Image, ImageGrab
 
+from . import clipboard, shell
+
 
 try:
     import pyautogui  # type: ignore
@@ -24,6 +26,17 @@ class GUIUnavailable(RuntimeError):
     """Raised when GUI actions are requested but unavailable."""
 
 
+# Persistent screenshot backend installed with ``set_grabber``.
+_grabber: Any = None
+# Shell running ``run_shell`` commands, installed with ``set_shell_session``.
+_shell_session: Optional[shell.ShellSession] = None
+# ``write_text`` pastes text at least this long through the clipboard, as
+# well as text ``pyautogui`` cannot type; 0 always types.
+PASTE_MIN_CHARS = 64
+# Shortcut pasting the clipboard into the focused window.
+PASTE_KEYS = ("command", "v") if sys.platform == "darwin" else ("ctrl", "v")
+
+
 def _get_pyautogui() -> Any:
     """Return the ``pyautogui`` module or raise ``GUIUnavailable``."""
     if pyautogui is None:
@@ -39,9 +52,35 @@ def ensure_gui_available() -> None:
     _get_pyautogui()
 
 
-def run_shell(command: str) -> None:
-    """Run a shell command on any platform."""
-    subprocess.run(command, shell=True, check=True)
+def run_shell(command: str, timeout: float = shell.TIMEOUT) -> str:
+    """Run a shell command on any platform and summarise its output.
+
+    The command runs in the session installed with ``set_shell_session``,
+    or else in a new shell. It is stopped after ``timeout`` seconds, at
+    most ``shell.MAX_TIMEOUT``; its output is shown on the console as well.
+    """
+    timeout = min(float(timeout), shell.MAX_TIMEOUT)
+    if _shell_session is not None:
+        result = _shell_session.run(command, timeout=timeout, echo=True)
+    else:
+        result = shell.run(command, timeout=timeout, echo=True)
+    return result.summary()
+
+
+def set_shell_session(session: Optional[shell.ShellSession]) -> None:
+    """Run ``run_shell`` commands in ``session``.
+
+    Passing ``None`` closes the current session; every command then gets
+    a new shell.
+    """
+    global _shell_session
+    if _shell_session is not None and _shell_session is not session:
+        _shell_session.close()
+    _shell_session = session
+
+
+def get_shell_session() -> Optional[shell.ShellSession]:
+    return _shell_session
 
 
 def move_mouse(x: int, y: int) -> None:
@@ -60,8 +99,27 @@ def double_click(x: int, y: int, button: str = "left") -> None:
     pg.doubleClick(x=x, y=y, button=button)
 
 
+def set_paste_min_chars(count: int) -> None:
+    """Paste ``write_text`` text of ``count`` or more characters.
+
+    ``0`` turns pasting off, so all text is typed key by key.
+    """
+    global PASTE_MIN_CHARS
+    PASTE_MIN_CHARS = max(0, int(count))
+
+
 def write_text(text: str) -> None:
+    """Type ``text``, pasting it through the clipboard when it is long.
+
+    Pasting takes the same time for any length, and also enters characters
+    ``pyautogui`` cannot type; the text is typed if there is no clipboard.
+    """
     pg = _get_pyautogui()
+    if PASTE_MIN_CHARS and (
+        len(text) >= PASTE_MIN_CHARS or not text.isascii()
+    ):
+        if clipboard.paste(text, lambda: pg.hotkey(*PASTE_KEYS)):
+            return
     pg.write(text)
 
 
@@ -194,33 +252,77 @@ def _blank_data_url() -> str:
     return f"data:image/png;base64,{b64}"
 
 
-def capture_screen() -> str:
+def set_grabber(grabber: Any) -> None:
+    """Take screenshots with ``grabber`` (a ``grabber.ScreenGrabber``).
+
+    Passing ``None`` closes the current backend and restores ``pyautogui``.
+    """
+    global _grabber
+    if _grabber is not None and _grabber is not grabber:
+        _grabber.close()
+    _grabber = grabber
+
+
+def fast_grabber() -> bool:
+    """Return ``True`` if screenshots are cheap enough to poll."""
+    return bool(getattr(_grabber, "fast", False))
+
+
+def pyautogui_screenshot() -> Image.Image | None:
+    """Return a screenshot taken with ``pyautogui`` or platform utilities."""
     pg = _get_pyautogui()
 
     try:
-        image = pg.screenshot()
-
+        return pg.screenshot()
     except Exception:
-        image = _fallback_screenshot()
-        if image is None:
-            return _blank_data_url()
+        return _fallback_screenshot()
+
+
+def grab_screen() -> Image.Image | None:
+    """Return a full-resolution screenshot or ``None`` if none is possible."""
+    if _grabber is not None:
+        try:
+            return _grabber.grab()
+        except Exception:
+            pass
+    return pyautogui_screenshot()
 
+
+def encode_jpeg(
+    image: Image.Image, max_dim: int | None = 800, quality: int = 70
+) -> bytes:
+    """Return ``image`` as JPEG bytes no larger than ``max_dim``."""
     try:
-        max_dim = max(image.size)
-        if max_dim > 800:
-            ratio = 800 / max_dim
+        longest = max(image.size)
+        if max_dim and longest > max_dim:
+            ratio = max_dim / longest
             new_size = (int(image.width * ratio), int(image.height * ratio))
             image = image.resize(new_size)
     except Exception:
         pass
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
     buf = io.BytesIO()
     # Compress to JPEG to keep requests small
-    image.save(buf, format="JPEG", quality=70, optimize=True)
+    image.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
 
-    data = base64.b64encode(buf.getvalue()).decode()
+def encode_image(
+    image: Image.Image, max_dim: int | None = 800, quality: int = 70
+) -> str:
+    """Return ``image`` as a JPEG data URL no larger than ``max_dim``."""
+    data = base64.b64encode(encode_jpeg(image, max_dim, quality)).decode()
     return f"data:image/jpeg;base64,{data}"
 
 
+def capture_screen() -> str:
+    image = grab_screen()
+    if image is None:
+        return _blank_data_url()
+    return encode_image(image)
+
+
 def save_image(data_url: str, path: str) -> None:
     """Save a base64 ``data_url`` to ``path``."""
     if not data_url.startswith("data:image"):
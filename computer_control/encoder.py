@@ -0,0 +1,181 @@
+"""Encode screenshots to fit a per-frame byte and time budget."""
+
+from __future__ import annotations
+
+import io
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, features
+
+
+MIN_QUALITY = 20
+MAX_QUALITY = 85
+# The probe is this many times smaller than the frame along each axis.
+PROBE_FACTOR = 4
+# Screens with at most this many colours are treated as flat UI.
+FLAT_COLORS = 256
+
+MIME = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+def available_formats() -> List[str]:
+    """Return the supported output formats, preferred first."""
+    fmts = ["jpeg", "png"]
+    if features.check("webp"):
+        fmts.insert(0, "webp")
+    return fmts
+
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "png":
+        image.save(buf, format="PNG", optimize=True)
+    elif fmt == "webp":
+        image.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _b64_len(size: int) -> int:
+    return (size + 2) // 3 * 4
+
+
+def _scaled(image: Image.Image, max_dim: int) -> Image.Image:
+    longest = max(image.size)
+    if longest <= max_dim:
+        return image
+    ratio = max_dim / longest
+    width = max(1, int(image.width * ratio))
+    height = max(1, int(image.height * ratio))
+    return image.resize((width, height), Image.BILINEAR)
+
+
+def _bisect_quality(
+    probe: Image.Image, fmt: str, budget: float
+) -> Tuple[Optional[int], float]:
+    """Return the highest quality whose probe encoding fits ``budget``.
+
+    ``budget`` is already scaled down to the probe's area. The second value
+    is the time in seconds of a single probe encode.
+    """
+    lo, hi = MIN_QUALITY, MAX_QUALITY
+    best: Optional[int] = None
+    elapsed = 0.0
+    tries = 0
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        start = time.perf_counter()
+        size = len(_encode(probe, fmt, mid))
+        elapsed += time.perf_counter() - start
+        tries += 1
+        if size <= budget:
+            best = mid
+            lo = mid + 5
+        else:
+            hi = mid - 5
+    return best, elapsed / max(1, tries)
+
+
+def encode_raw(
+    image: Image.Image,
+    max_bytes: int,
+    max_ms: float = 0.0,
+    max_dim: int = 1280,
+    min_dim: int = 400,
+    formats: Optional[Sequence[str]] = None,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Return encoded ``image`` bytes whose data URL fits ``max_bytes``.
+
+    Resolution, format and quality are chosen by bisecting the quality on a
+    downsampled probe and verifying the pick on the full frame. Screens with
+    few colours are first tried as a palette PNG which keeps text crisp.
+    When ``max_ms`` is set, formats and resolutions whose estimated encode
+    time exceeds it are skipped. The second return value describes the
+    chosen parameters.
+    """
+    start = time.perf_counter()
+    fmts = [f for f in (formats or available_formats()) if f in MIME]
+    if not fmts:
+        raise ValueError("no supported image format")
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = _scaled(image, max_dim)
+
+    def done(
+        data: bytes, fmt: str, quality: Optional[int], frame: Image.Image
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        info = {
+            "format": fmt,
+            "mime": MIME[fmt],
+            "quality": quality,
+            "size": frame.size,
+            "bytes": len(f"data:{MIME[fmt]};base64,") + _b64_len(len(data)),
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        return data, info
+
+    header = len("data:image/jpeg;base64,")
+    # base64 inflates the payload by a third
+    budget = max(1, (max_bytes - header) * 3 // 4)
+    best: Optional[Tuple[bytes, str, Optional[int], Image.Image]] = None
+
+    if "png" in fmts:
+        probe = image.reduce(PROBE_FACTOR) if min(image.size) > 64 else image
+        colors = probe.getcolors(FLAT_COLORS)
+        if colors is not None:
+            palette = image.quantize(colors=max(16, len(colors)))
+            data = _encode(palette, "png", 0)
+            if len(data) <= budget:
+                return done(data, "png", None, image)
+
+    lossy = [f for f in fmts if f != "png"] or ["jpeg"]
+    frame = image
+    while True:
+        factor = PROBE_FACTOR if min(frame.size) >= PROBE_FACTOR * 16 else 1
+        probe = frame.reduce(factor) if factor > 1 else frame
+        area_ratio = (frame.width * frame.height) / (
+            probe.width * probe.height
+        )
+        for fmt in lossy:
+            target = budget / area_ratio
+            # two full-size attempts: the probe's estimate, then one
+            # corrected by how far the first attempt overshot
+            for _ in range(2):
+                quality, probe_time = _bisect_quality(probe, fmt, target)
+                if quality is None or (
+                    max_ms and probe_time * area_ratio * 1000 > max_ms
+                ):
+                    break
+                data = _encode(frame, fmt, quality)
+                if len(data) <= budget:
+                    return done(data, fmt, quality, frame)
+                if best is None or len(data) < len(best[0]):
+                    best = (data, fmt, quality, frame)
+                target *= budget / len(data)
+        elapsed = (time.perf_counter() - start) * 1000
+        if max(frame.size) <= min_dim or (max_ms and elapsed > max_ms):
+            break
+        frame = _scaled(frame, max(min_dim, int(max(frame.size) * 0.75)))
+
+    if best is None:
+        data = _encode(frame, lossy[-1], MIN_QUALITY)
+        best = (data, lossy[-1], MIN_QUALITY, frame)
+    if len(best[0]) > budget:
+        # out of time or resolutions: one last shrink sized by the overshoot
+        data, fmt, quality, frame = best
+        shrink = (budget / len(data)) ** 0.5 * 0.9
+        frame = _scaled(frame, max(1, int(max(frame.size) * shrink)))
+        best = (_encode(frame, fmt, quality), fmt, quality, frame)
+    return done(*best)
+
+
+def describe(info: Dict[str, Any]) -> str:
+    """Return a one-line summary of ``encode_raw`` parameters."""
+    quality = "" if info["quality"] is None else f" q={info['quality']}"
+    width, height = info["size"]
+    return (
+        f"{info['format']}{quality} {width}x{height} "
+        f"{info['bytes'] / 1024:.1f} KB in {info['ms']:.0f} ms"
+    )
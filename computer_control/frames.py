@@ -0,0 +1,454 @@
+"""Helpers for fingerprinting and comparing screenshots."""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from . import controller
+
+
+Box = Tuple[int, int, int, int]
+
+
+# Side length of the grayscale thumbnail used as a frame fingerprint. At 64
+# cells a 1920x1080 screen maps to roughly 30x17 pixel blocks so even a single
+# typed character still shifts the average of its block.
+DIGEST_SIZE = 64
+
+# Largest per-cell difference still treated as "the same screen". This
+# absorbs JPEG noise without hiding real UI changes.
+FRAME_TOLERANCE = 3
+
+# Screenshots ``wait_for_settle`` takes at most when each one is slow,
+# e.g. ``pyautogui`` running ``scrot``.
+SLOW_POLLS = 6
+
+
+def frame_digest(image: Image.Image, size: int = DIGEST_SIZE) -> bytes:
+    """Return a downsampled grayscale digest of ``image``."""
+    thumb = image.convert("L").resize((size, size), Image.BILINEAR)
+    return thumb.tobytes()
+
+
+def bytes_digest(data: bytes, size: int = DIGEST_SIZE) -> Optional[bytes]:
+    """Return the digest of encoded image ``data`` or ``None`` if invalid."""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            # JPEG can decode straight to a reduced scale which is much
+            # cheaper than a full decode followed by a resize.
+            im.draft("L", (size * 2, size * 2))
+            return frame_digest(im, size)
+    except (ValueError, OSError):
+        return None
+
+
+def frames_match(
+    a: Optional[bytes], b: Optional[bytes], tolerance: int = FRAME_TOLERANCE
+) -> bool:
+    """Return ``True`` if digests ``a`` and ``b`` describe the same screen."""
+    if a is None or b is None or len(a) != len(b):
+        return False
+    if a == b:
+        return True
+    if tolerance <= 0:
+        return False
+    size = int(len(a) ** 0.5)
+    if size * size != len(a):
+        return False
+    diff = ImageChops.difference(
+        Image.frombytes("L", (size, size), a),
+        Image.frombytes("L", (size, size), b),
+    )
+    return diff.getextrema()[1] <= tolerance
+
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+
+
+class ScreenFrame:
+    """An encoded screenshot kept as raw bytes.
+
+    Frames travel through the message history in place of base64 data URL
+    strings. The data URL the API expects is only built by ``data_url`` when
+    a request is serialized, and ``save`` writes the bytes unchanged.
+    """
+
+    __slots__ = (
+        "data",
+        "mime",
+        "sha",
+        "width",
+        "height",
+        "timestamp",
+        "_digest",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        data: bytes,
+        mime: str = "image/jpeg",
+        size: Optional[Tuple[int, int]] = None,
+        timestamp: Optional[float] = None,
+    ) -> None:
+        self.data = data
+        self.mime = mime
+        self.sha = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if size is None:
+            try:
+                with Image.open(io.BytesIO(data)) as im:
+                    size = im.size
+            except (ValueError, OSError):
+                size = (0, 0)
+        self.width, self.height = size
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._digest: Any = False
+
+    @classmethod
+    def from_image(
+        cls, image: Image.Image, max_dim: Optional[int] = 800
+    ) -> "ScreenFrame":
+        """Return ``image`` encoded as a JPEG frame."""
+        return cls(controller.encode_jpeg(image, max_dim))
+
+    @classmethod
+    def from_data_url(cls, data_url: str) -> "ScreenFrame":
+        """Return a frame holding the decoded payload of ``data_url``."""
+        if not data_url.startswith("data:image"):
+            raise ValueError("invalid data url")
+        header, b64 = data_url.split(",", 1)
+        mime = header[len("data:") :].split(";", 1)[0]  # noqa: E203
+        return cls(base64.b64decode(b64), mime)
+
+    @property
+    def digest(self) -> Optional[bytes]:
+        """The perceptual digest used to compare frames, computed once."""
+        if self._digest is False:
+            self._digest = bytes_digest(self.data)
+        return self._digest
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS.get(self.mime, "img")
+
+    def data_url(self) -> str:
+        """Return the frame as a base64 data URL."""
+        b64 = base64.b64encode(self.data).decode()
+        return f"data:{self.mime};base64,{b64}"
+
+    def save(self, path: str) -> None:
+        """Write the encoded image to ``path``."""
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ScreenFrame):
+            return NotImplemented
+        return self.sha == other.sha
+
+    def __hash__(self) -> int:
+        return hash(self.sha)
+
+    def __repr__(self) -> str:
+        return (
+            f"ScreenFrame({self.mime}, {self.width}x{self.height}, "
+            f"{len(self.data)} bytes, sha={self.sha[:8]})"
+        )
+
+
+def is_frame(url: Any) -> bool:
+    """Return ``True`` for frame objects that build their own data URL."""
+    if isinstance(url, str):
+        return False
+    return callable(getattr(url, "data_url", None))
+
+
+# Data URLs built by ``materialize``, each kept only while its frame is
+# alive, so a frame is base64-encoded once while it stays in the history
+# and its string goes with it.
+_data_urls: "weakref.WeakKeyDictionary[Any, str]" = (
+    weakref.WeakKeyDictionary()
+)
+_data_urls_lock = threading.Lock()
+
+
+def _data_url(frame: Any) -> str:
+    """Return ``frame.data_url()``, the same string while ``frame`` lives."""
+    try:
+        with _data_urls_lock:
+            url = _data_urls.get(frame)
+    except TypeError:  # not weakly referenceable
+        return frame.data_url()
+    if url is not None:
+        return url
+    url = frame.data_url()
+    with _data_urls_lock:
+        _data_urls[frame] = url
+    return url
+
+
+def materialize(msgs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return ``msgs`` with every frame replaced by its data URL.
+
+    Frames are ``ScreenFrame`` objects or anything else with a ``data_url``
+    method. Messages without frames are passed through unchanged; the
+    others are shallow copies so the stored history keeps its frames. A
+    frame seen on a recent call yields the identical string again, which
+    lets ``body.BodyBuilder`` reuse its serialized message.
+    """
+    out: List[Dict[str, Any]] = []
+    for msg in msgs:
+        content = msg.get("content")
+        if isinstance(content, list) and any(
+            is_frame(part.get("image_url", {}).get("url")) for part in content
+        ):
+            parts = []
+            for part in content:
+                url = part.get("image_url", {}).get("url")
+                if is_frame(url):
+                    part = {**part, "image_url": {**part["image_url"]}}
+                    part["image_url"]["url"] = _data_url(url)
+                parts.append(part)
+            msg = {**msg, "content": parts}
+        out.append(msg)
+    return out
+
+
+def wait_for_settle(
+    stable: float = 0.3, timeout: float = 3.0, interval: float = 0.05
+) -> Optional[Image.Image]:
+    """Wait until the screen stops changing and return the last frame.
+
+    The screen is polled every ``interval`` seconds and compared through
+    ``frame_digest``. The call returns once nothing changed for ``stable``
+    seconds or after ``timeout`` seconds, whichever comes first. ``None``
+    is returned when no screenshot can be taken.
+
+    Only a fast grabber (``controller.fast_grabber``) is polled at that
+    rate. Otherwise each screenshot costs a full capture, so the polls are
+    spaced by at least the time one takes and stop after ``SLOW_POLLS``.
+    """
+    start = time.monotonic()
+    fast = controller.fast_grabber()
+    last: Optional[bytes] = None
+    since = start
+    polls = 0
+    while True:
+        grabbed = time.monotonic()
+        try:
+            image = controller.grab_screen()
+        except controller.GUIUnavailable:
+            return None
+        if image is None:
+            return None
+        polls += 1
+        now = time.monotonic()
+        digest = frame_digest(image)
+        if not frames_match(digest, last):
+            last, since = digest, now
+        elif now - since >= stable:
+            return image
+        if now - start >= timeout or not fast and polls >= SLOW_POLLS:
+            return image
+        time.sleep(interval if fast else max(interval, now - grabbed))
+
+
+def changed_regions(
+    previous: Image.Image,
+    current: Image.Image,
+    cell: int = 16,
+    threshold: int = 24,
+    max_regions: int = 3,
+) -> List[Box]:
+    """Return bounding boxes of the areas that differ between two frames.
+
+    The frames are compared on a grid of ``cell`` sized blocks. Neighbouring
+    changed blocks are grouped into one box and when more than
+    ``max_regions`` groups remain they are merged into a single box.
+    """
+    if previous.size != current.size:
+        return [(0, 0, current.width, current.height)]
+    diff = ImageChops.difference(previous.convert("L"), current.convert("L"))
+    if diff.getbbox() is None:
+        return []
+    mask = diff.point(lambda v: 255 if v > threshold else 0)
+    cols = (current.width + cell - 1) // cell
+    rows = (current.height + cell - 1) // cell
+    grid = mask.resize((cols, rows), Image.BOX).tobytes()
+
+    seen = [False] * len(grid)
+    boxes: List[Box] = []
+    for start, value in enumerate(grid):
+        if not value or seen[start]:
+            continue
+        seen[start] = True
+        stack = [start]
+        x0, y0, x1, y1 = cols, rows, 0, 0
+        while stack:
+            idx = stack.pop()
+            cx, cy = idx % cols, idx // cols
+            x0, y0 = min(x0, cx), min(y0, cy)
+            x1, y1 = max(x1, cx), max(y1, cy)
+            # 8-connected so diagonal strokes stay one region
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    nx, ny = cx + dx, cy + dy
+                    if 0 <= nx < cols and 0 <= ny < rows:
+                        n = ny * cols + nx
+                        if grid[n] and not seen[n]:
+                            seen[n] = True
+                            stack.append(n)
+        boxes.append(
+            (
+                x0 * cell,
+                y0 * cell,
+                min(current.width, (x1 + 1) * cell),
+                min(current.height, (y1 + 1) * cell),
+            )
+        )
+
+    if len(boxes) > max_regions:
+        boxes = [
+            (
+                min(b[0] for b in boxes),
+                min(b[1] for b in boxes),
+                max(b[2] for b in boxes),
+                max(b[3] for b in boxes),
+            )
+        ]
+    return boxes
+
+
+class DeltaCapture:
+    """Capture the screen as periodic keyframes plus changed-region crops.
+
+    Every ``keyframe_interval`` steps, or when the changes cover more than
+    ``max_area`` of the screen, a downscaled full frame is produced. In
+    between only the changed rectangles are encoded, at full resolution,
+    together with their screen offsets.
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int = 5,
+        max_dim: int = 800,
+        max_regions: int = 3,
+        max_area: float = 0.5,
+    ) -> None:
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.max_dim = max_dim
+        self.max_regions = max_regions
+        self.max_area = max_area
+        # what the model has seen so far: last keyframe plus pasted crops
+        self.reference: Optional[Image.Image] = None
+        self.steps_since_keyframe = 0
+        self.last_was_keyframe = False
+
+    def capture(
+        self,
+        caption: str = "Updated screen",
+        image: Optional[Image.Image] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Return message content parts for the current screen.
+
+        ``image`` is used instead of grabbing a new screenshot if given.
+        ``None`` means nothing changed since the previous capture.
+        ``controller.GUIUnavailable`` propagates to the caller.
+        """
+        if image is None:
+            image = controller.grab_screen()
+        self.last_was_keyframe = False
+        if image is None:
+            self.reference = None
+            self.last_was_keyframe = True
+            return [
+                {"type": "text", "text": caption},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": ScreenFrame.from_data_url(
+                            controller._blank_data_url()
+                        )
+                    },
+                },
+            ]
+
+        self.steps_since_keyframe += 1
+        if (
+            self.reference is None
+            or self.steps_since_keyframe >= self.keyframe_interval
+        ):
+            return self._keyframe(image, caption)
+
+        boxes = changed_regions(
+            self.reference, image, max_regions=self.max_regions
+        )
+        if not boxes:
+            return None
+        area = sum((b[2] - b[0]) * (b[3] - b[1]) for b in boxes)
+        if area > self.max_area * image.width * image.height:
+            return self._keyframe(image, caption)
+
+        parts: List[Dict[str, Any]] = [
+            {
+                "type": "text",
+                "text": (
+                    f"{caption}: only the changed regions are shown at full "
+                    "resolution, the rest of the screen is as before."
+                ),
+            }
+        ]
+        for box in boxes:
+            crop = image.crop(box)
+            self.reference.paste(crop, box[:2])
+            parts.append(
+                {
+                    "type": "text",
+                    "text": (
+                        f"Region at x={box[0]}, y={box[1]} size "
+                        f"{box[2] - box[0]}x{box[3] - box[1]}"
+                    ),
+                }
+            )
+            parts.append(
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": ScreenFrame.from_image(crop, max_dim=None)
+                    },
+                }
+            )
+        return parts
+
+    def snapshot(self) -> Optional[ScreenFrame]:
+        """Return the screen as the model currently knows it, downscaled."""
+        if self.reference is None:
+            return None
+        return ScreenFrame.from_image(self.reference, self.max_dim)
+
+    def _keyframe(
+        self, image: Image.Image, caption: str
+    ) -> List[Dict[str, Any]]:
+        self.reference = image.copy()
+        self.steps_since_keyframe = 0
+        self.last_was_keyframe = True
+        return [
+            {
+                "type": "text",
+                "text": f"{caption} ({image.width}x{image.height} screen)",
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": ScreenFrame.from_image(image, self.max_dim)
+                },
+            },
+        ]
@@ -0,0 +1,414 @@
+"""Persistent screenshot backends.
+
+``pyautogui.screenshot`` spawns ``scrot`` and reads back a temporary PNG on
+every call. The backends here keep a connection to the display open for the
+whole session instead. ``auto_grabber`` picks the fastest one available and
+``controller.set_grabber`` installs it.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from . import controller
+
+
+ZPIXMAP = 2
+ALL_PLANES = 0xFFFFFFFF
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+class ScreenGrabber:
+    """Interface for screenshot backends."""
+
+    name = "base"
+    # cheap enough to be polled many times a second
+    fast = False
+
+    def grab(self) -> Image.Image:
+        """Return a full-resolution screenshot of the whole screen."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+
+
+class PyAutoGUIGrabber(ScreenGrabber):
+    """Fallback backend using ``pyautogui`` and platform utilities."""
+
+    name = "pyautogui"
+
+    def grab(self) -> Image.Image:
+        image = controller.pyautogui_screenshot()
+        if image is None:
+            raise RuntimeError("screenshot failed")
+        return image
+
+
+class _XImage(ctypes.Structure):
+    # Only the leading fields are read; the struct is always allocated by Xlib.
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+class _ShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+_XErrorHandler = ctypes.CFUNCTYPE(
+    ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p
+)
+
+
+# X errors per display of an ``XShmGrabber``, counted by ``_on_x_error``.
+_x_errors: Dict[int, int] = {}
+_x_errors_lock = threading.Lock()
+# The installed handler and the one it replaced, kept alive for Xlib.
+_x_handlers: Dict[str, Any] = {}
+
+
+def _on_x_error(display: Any, event: Any) -> int:
+    """Count errors on grabber displays and pass the others on.
+
+    Xlib's default handler exits the process, so errors on the grabber's
+    own connection are only counted. Errors on other connections, such as
+    the one of Tk, go to the handler that was installed before.
+    """
+    with _x_errors_lock:
+        if display in _x_errors:
+            _x_errors[display] += 1
+            return 0
+    previous = _x_handlers.get("previous")
+    return previous(display, event) if previous else 0
+
+
+def _install_error_handler(set_handler: Any) -> None:
+    """Install ``_on_x_error`` with ``XSetErrorHandler``, once per process.
+
+    The handler is global to libX11, so it is never swapped per call; a
+    grab on a worker thread would otherwise race with Tk's connection.
+    """
+    with _x_errors_lock:
+        if "installed" in _x_handlers:
+            return
+        handler = _XErrorHandler(_on_x_error)
+        previous = set_handler(handler)
+        _x_handlers["installed"] = handler
+        if previous:
+            _x_handlers["previous"] = _XErrorHandler(previous)
+
+
+def _load(name: str) -> ctypes.CDLL:
+    path = ctypes.util.find_library(name)
+    if not path:
+        raise OSError(f"lib{name} not found")
+    return ctypes.CDLL(path)
+
+
+def _bind(lib: ctypes.CDLL, name: str, restype: Any, *argtypes: Any) -> Any:
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = list(argtypes)
+    return func
+
+
+class XShmGrabber(ScreenGrabber):
+    """X11 backend reading the root window into a reused buffer.
+
+    The MIT-SHM extension lets the X server write pixels straight into a
+    shared memory segment. Displays without it (for example over SSH) use
+    plain ``XGetImage`` on the same long-lived connection.
+
+    The connection is the grabber's own and guarded by a lock, so grabs may
+    come from any thread; X errors on it are counted by a handler installed
+    once for the whole process.
+    """
+
+    name = "xshm"
+    fast = True
+
+    def __init__(self, display: Optional[str] = None) -> None:
+        x11 = _load("X11")
+        xext = _load("Xext")
+        libc = ctypes.CDLL(None, use_errno=True)
+        vp = ctypes.c_void_p
+        self._x = {
+            "open": _bind(x11, "XOpenDisplay", vp, ctypes.c_char_p),
+            "close": _bind(x11, "XCloseDisplay", ctypes.c_int, vp),
+            "screen": _bind(x11, "XDefaultScreen", ctypes.c_int, vp),
+            "root": _bind(
+                x11, "XRootWindow", ctypes.c_ulong, vp, ctypes.c_int
+            ),
+            "width": _bind(
+                x11, "XDisplayWidth", ctypes.c_int, vp, ctypes.c_int
+            ),
+            "height": _bind(
+                x11, "XDisplayHeight", ctypes.c_int, vp, ctypes.c_int
+            ),
+            "visual": _bind(x11, "XDefaultVisual", vp, vp, ctypes.c_int),
+            "depth": _bind(
+                x11, "XDefaultDepth", ctypes.c_int, vp, ctypes.c_int
+            ),
+            "sync": _bind(x11, "XSync", ctypes.c_int, vp, ctypes.c_int),
+            "get_image": _bind(
+                x11,
+                "XGetImage",
+                ctypes.POINTER(_XImage),
+                vp,
+                ctypes.c_ulong,
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_uint,
+                ctypes.c_uint,
+                ctypes.c_ulong,
+                ctypes.c_int,
+            ),
+            "destroy": _bind(
+                x11, "XDestroyImage", ctypes.c_int, ctypes.POINTER(_XImage)
+            ),
+            "error_handler": _bind(
+                x11, "XSetErrorHandler", vp, _XErrorHandler
+            ),
+            "shm_query": _bind(xext, "XShmQueryExtension", ctypes.c_int, vp),
+            "shm_create": _bind(
+                xext,
+                "XShmCreateImage",
+                ctypes.POINTER(_XImage),
+                vp,
+                vp,
+                ctypes.c_uint,
+                ctypes.c_int,
+                vp,
+                ctypes.POINTER(_ShmSegmentInfo),
+                ctypes.c_uint,
+                ctypes.c_uint,
+            ),
+            "shm_attach": _bind(
+                xext,
+                "XShmAttach",
+                ctypes.c_int,
+                vp,
+                ctypes.POINTER(_ShmSegmentInfo),
+            ),
+            "shm_detach": _bind(
+                xext,
+                "XShmDetach",
+                ctypes.c_int,
+                vp,
+                ctypes.POINTER(_ShmSegmentInfo),
+            ),
+            "shm_get": _bind(
+                xext,
+                "XShmGetImage",
+                ctypes.c_int,
+                vp,
+                ctypes.c_ulong,
+                ctypes.POINTER(_XImage),
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_ulong,
+            ),
+        }
+        self._libc = {
+            "shmget": _bind(
+                libc,
+                "shmget",
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_size_t,
+                ctypes.c_int,
+            ),
+            "shmat": _bind(
+                libc, "shmat", vp, ctypes.c_int, vp, ctypes.c_int
+            ),
+            "shmdt": _bind(libc, "shmdt", ctypes.c_int, vp),
+            "shmctl": _bind(
+                libc, "shmctl", ctypes.c_int, ctypes.c_int, ctypes.c_int, vp
+            ),
+        }
+
+        self._lock = threading.Lock()
+        _install_error_handler(self._x["error_handler"])
+
+        name = display.encode() if display else None
+        self._display = self._x["open"](name)
+        if not self._display:
+            raise RuntimeError("cannot open X display")
+        with _x_errors_lock:
+            _x_errors[self._display] = 0
+        screen = self._x["screen"](self._display)
+        self._root = self._x["root"](self._display, screen)
+        self.width = self._x["width"](self._display, screen)
+        self.height = self._x["height"](self._display, screen)
+        self._image: Optional[Any] = None
+        self._shm: Optional[_ShmSegmentInfo] = None
+        try:
+            self._attach_shm(screen)
+        except OSError:
+            self._release_shm()
+
+    def _error_count(self) -> int:
+        with _x_errors_lock:
+            return _x_errors.get(self._display, 0)
+
+    def _attach_shm(self, screen: int) -> None:
+        if not self._x["shm_query"](self._display):
+            raise OSError("MIT-SHM unavailable")
+        info = _ShmSegmentInfo()
+        image = self._x["shm_create"](
+            self._display,
+            self._x["visual"](self._display, screen),
+            self._x["depth"](self._display, screen),
+            ZPIXMAP,
+            None,
+            ctypes.byref(info),
+            self.width,
+            self.height,
+        )
+        if not image:
+            raise OSError("XShmCreateImage failed")
+        self._image = image
+        self._shm = info
+        if image.contents.bits_per_pixel != 32:
+            raise OSError("unsupported pixel format")
+        size = image.contents.bytes_per_line * image.contents.height
+        info.shmid = self._libc["shmget"](
+            IPC_PRIVATE, size, IPC_CREAT | 0o600
+        )
+        if info.shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        addr = self._libc["shmat"](info.shmid, None, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            errno = ctypes.get_errno()
+            info.shmaddr = None
+            self._libc["shmctl"](info.shmid, IPC_RMID, None)
+            raise OSError(errno, "shmat failed")
+        info.shmaddr = addr
+        info.readOnly = 0
+        image.contents.data = addr
+        errors = self._error_count()
+        self._x["shm_attach"](self._display, ctypes.byref(info))
+        self._x["sync"](self._display, 0)
+        # The segment disappears once both sides detach.
+        self._libc["shmctl"](info.shmid, IPC_RMID, None)
+        if self._error_count() != errors:
+            raise OSError("XShmAttach failed")
+
+    def _release_shm(self) -> None:
+        info, image = self._shm, self._image
+        self._shm = self._image = None
+        if info is not None and info.shmaddr:
+            self._x["shm_detach"](self._display, ctypes.byref(info))
+            self._x["sync"](self._display, 0)
+            self._libc["shmdt"](info.shmaddr)
+        if image:
+            # the pixel memory belongs to the segment, not to Xlib
+            image.contents.data = None
+            self._x["destroy"](image)
+
+    @staticmethod
+    def _to_pil(image: Any) -> Image.Image:
+        img = image.contents
+        if img.bits_per_pixel != 32:
+            raise RuntimeError("unsupported pixel format")
+        size = img.bytes_per_line * img.height
+        buf = (ctypes.c_char * size).from_address(img.data)
+        return Image.frombytes(
+            "RGB",
+            (img.width, img.height),
+            buf,
+            "raw",
+            "BGRX",
+            img.bytes_per_line,
+            1,
+        )
+
+    def grab(self) -> Image.Image:
+        with self._lock:
+            if not self._display:
+                raise RuntimeError("grabber is closed")
+            return self._grab()
+
+    def _grab(self) -> Image.Image:
+        if self._image is not None:
+            ok = self._x["shm_get"](
+                self._display, self._root, self._image, 0, 0, ALL_PLANES
+            )
+            if not ok:
+                raise RuntimeError("XShmGetImage failed")
+            return self._to_pil(self._image)
+        image = self._x["get_image"](
+            self._display,
+            self._root,
+            0,
+            0,
+            self.width,
+            self.height,
+            ALL_PLANES,
+            ZPIXMAP,
+        )
+        if not image:
+            raise RuntimeError("XGetImage failed")
+        try:
+            return self._to_pil(image)
+        finally:
+            self._x["destroy"](image)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._display:
+                return
+            self._release_shm()
+            self._x["close"](self._display)
+            with _x_errors_lock:
+                _x_errors.pop(self._display, None)
+            self._display = None
+
+
+def auto_grabber() -> ScreenGrabber:
+    """Return the fastest screenshot backend that works on this system.
+
+    ``COMPUTER_CONTROL_GRABBER`` may be set to ``xshm`` or ``pyautogui`` to
+    force a backend; the default ``auto`` tries them in that order.
+    """
+    choice = os.environ.get("COMPUTER_CONTROL_GRABBER", "auto").lower()
+    if (
+        choice in ("auto", "xshm")
+        and sys.platform.startswith("linux")
+        and os.environ.get("DISPLAY")
+    ):
+        try:
+            return XShmGrabber()
+        except (OSError, RuntimeError, AttributeError) as exc:
+            if choice == "xshm":
+                print(f"Warning: XShm grabber unavailable: {exc}")
+    return PyAutoGUIGrabber()
@@ -0,0 +1,237 @@
+"""Hedged requests: a second copy is sent when the first one is slow."""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+
+T = TypeVar("T")
+
+# An alternate URL, or a function choosing one when the hedge is sent.
+Alternate = Optional[Union[str, Callable[[], str]]]
+
+# Latencies remembered per endpoint.
+WINDOW = 200
+
+
+class LatencyTracker:
+    """Rolling latency samples of each endpoint.
+
+    The last ``window`` successful request durations are kept per URL and
+    answer percentile queries.
+    """
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, url: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(url)
+            if samples is None:
+                samples = self._samples[url] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, url: str) -> int:
+        with self._lock:
+            return len(self._samples.get(url, ()))
+
+    def percentile(self, url: str, q: float) -> Optional[float]:
+        """Return the ``q`` quantile (0 to 1) of ``url`` or ``None``."""
+        with self._lock:
+            ordered: List[float] = sorted(self._samples.get(url, ()))
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def histogram(self, url: str, bounds: List[float]) -> List[int]:
+        """Return sample counts of ``url`` per bucket below each bound.
+
+        The last bucket counts the samples above every bound.
+        """
+        counts = [0] * (len(bounds) + 1)
+        with self._lock:
+            for seconds in self._samples.get(url, ()):
+                counts[bisect.bisect_left(bounds, seconds)] += 1
+        return counts
+
+
+class Hedger:
+    """Decide when to send a second copy of a slow request.
+
+    A request still running after the ``quantile`` of its endpoint's recent
+    latencies (and at least ``min_delay`` seconds) is sent again, to the
+    alternate URL when there is one; the first answer wins. No hedge is
+    sent before ``min_samples`` latencies are known, and hedges never
+    exceed ``max_ratio`` of all requests, so the extra load stays bounded.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.9,
+        min_delay: float = 0.5,
+        min_samples: int = 10,
+        max_ratio: float = 0.1,
+        tracker: Optional[LatencyTracker] = None,
+    ) -> None:
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.tracker = tracker or LatencyTracker()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def delay(self, url: str) -> Optional[float]:
+        """Return the seconds after which ``url`` is hedged, or ``None``."""
+        if self.tracker.count(url) < self.min_samples:
+            return None
+        latency = self.tracker.percentile(url, self.quantile)
+        return max(self.min_delay, latency or 0.0)
+
+    def _start(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def _allow(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.max_ratio * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    @staticmethod
+    def _target(url: str, alternate: Alternate) -> str:
+        if callable(alternate):
+            return alternate()
+        return alternate or url
+
+    def _timed(self, call: Callable[[str], T], url: str) -> T:
+        started = time.monotonic()
+        result = call(url)
+        self.tracker.record(url, time.monotonic() - started)
+        return result
+
+    def run(
+        self,
+        call: Callable[[str], T],
+        url: str,
+        alternate: Alternate = None,
+    ) -> T:
+        """Return ``call(url)``, hedged with ``call(alternate or url)``.
+
+        ``alternate`` may be a function returning the URL; it is only
+        called when the hedge is sent.
+
+        The losing request runs to completion on a worker thread and its
+        result is discarded; blocking HTTP calls cannot be interrupted.
+        """
+        self._start()
+        wait = self.delay(url)
+        if wait is None:
+            return self._timed(call, url)
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(
+                    4, thread_name_prefix="hedge"
+                )
+            pool = self._pool
+        first = pool.submit(self._timed, call, url)
+        try:
+            return first.result(timeout=wait)
+        except concurrent.futures.TimeoutError:
+            pass
+        if not self._allow():
+            return first.result()
+        second = pool.submit(self._timed, call, self._target(url, alternate))
+        pending = {first, second}
+        while True:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None or not pending:
+                    for other in pending:
+                        other.cancel()
+                    if future is second and future.exception() is None:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+
+    async def run_async(
+        self,
+        call: Callable[[str], Awaitable[T]],
+        url: str,
+        alternate: Alternate = None,
+    ) -> T:
+        """Asyncio version of ``run``; the losing request is cancelled."""
+        self._start()
+
+        async def timed(target: str) -> T:
+            started = time.monotonic()
+            result = await call(target)
+            self.tracker.record(target, time.monotonic() - started)
+            return result
+
+        wait = self.delay(url)
+        if wait is None:
+            return await timed(url)
+        first = asyncio.ensure_future(timed(url))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=wait)
+            if done or not self._allow():
+                return await first
+            second = asyncio.ensure_future(
+                timed(self._target(url, alternate))
+            )
+            tasks.add(second)
+            pending: Any = tasks
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None or not pending:
+                        if task is second and task.exception() is None:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def describe(self) -> str:
+        """Return a one-line summary of the hedges sent."""
+        return (
+            f"{self.hedged} of {self.requests} requests hedged, "
+            f"{self.hedge_wins} won by the hedge"
+        )
+
+    def close(self) -> None:
+        """Stop the worker threads once running requests finish."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
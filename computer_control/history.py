@@ -0,0 +1,366 @@
+"""Conversation history kept within a bounded memory footprint."""
+
+from __future__ import annotations
+
+import base64
+import threading
+from collections import deque
+from typing import (
+    Any,
+    Counter,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .frames import ScreenFrame
+
+
+# Text longer than this is shortened once a message leaves the window.
+STUB_CHARS = 200
+# Replaces screenshots that are no longer kept.
+OMITTED = "[earlier screenshot omitted]"
+
+
+class SpilledFrame:
+    """A screenshot whose bytes were moved to the store's spill file.
+
+    It stands in for a ``frames.ScreenFrame`` and reads the bytes back only
+    when ``data_url`` is called while serializing a request.
+    """
+
+    __slots__ = ("spill", "offset", "length", "mime", "sha", "width", "height")
+
+    def __init__(
+        self, spill: "_SpillFile", offset: int, frame: ScreenFrame
+    ) -> None:
+        self.spill = spill
+        self.offset = offset
+        self.length = len(frame.data)
+        self.mime = frame.mime
+        self.sha = frame.sha
+        self.width = frame.width
+        self.height = frame.height
+
+    @property
+    def data(self) -> bytes:
+        return self.spill.read(self.offset, self.length)
+
+    def data_url(self) -> str:
+        b64 = base64.b64encode(self.data).decode()
+        return f"data:{self.mime};base64,{b64}"
+
+    def __repr__(self) -> str:
+        return (
+            f"SpilledFrame({self.mime}, {self.width}x{self.height}, "
+            f"{self.length} bytes at {self.offset})"
+        )
+
+
+class _SpillFile:
+    """Append-only file holding evicted screenshot bytes.
+
+    The file belongs to one store: it is emptied when opened, so it does
+    not grow from one run to the next.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "wb+")
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        with self._lock:
+            offset = self.size
+            self._file.seek(offset)
+            self._file.write(data)
+            self._file.flush()
+            self.size += len(data)
+            return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _frame_parts(msg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the ``image_url`` parts of ``msg`` holding in-memory frames."""
+    content = msg.get("content")
+    if not isinstance(content, list):
+        return []
+    return [
+        part
+        for part in content
+        if isinstance(part.get("image_url", {}).get("url"), ScreenFrame)
+    ]
+
+
+def call_ids(msg: Dict[str, Any]) -> List[str]:
+    """Return the tool call ids requested by assistant message ``msg``."""
+    return [c.get("id", "") for c in msg.get("tool_calls") or []]
+
+
+def window_bounds(
+    msgs: Sequence[Dict[str, Any]], limit: int
+) -> Tuple[int, int]:
+    """Return the slice of the last ``limit`` messages that may be sent.
+
+    The slice starts at a system or user message and does not end with an
+    assistant message whose tool calls have not been answered yet.
+    """
+    if limit <= 0:
+        return 0, 0
+    end = len(msgs)
+    start = max(0, end - limit)
+    while start < end and msgs[start]["role"] not in ("system", "user"):
+        start += 1
+    while end > start and msgs[end - 1].get("tool_calls"):
+        end -= 1
+    return start, end
+
+
+def next_turn(msgs: Sequence[Dict[str, Any]], index: int, end: int) -> int:
+    """Return the first system or user message at or after ``index``."""
+    while index < end and msgs[index]["role"] not in ("system", "user"):
+        index += 1
+    return index
+
+
+def last_unanswered(
+    msgs: Sequence[Dict[str, Any]], start: int, end: int
+) -> Optional[int]:
+    """Return the index of the last assistant message in ``msgs[start:end]``
+    with a tool call lacking a later response, or ``None``.
+
+    The slice is scanned once from the end; each call consumes one later
+    response with its id.
+    """
+    answers: Counter[str] = Counter()
+    for index in range(end - 1, start - 1, -1):
+        msg = msgs[index]
+        if msg.get("tool_calls"):
+            for call_id in call_ids(msg):
+                if not answers[call_id]:
+                    return index
+                answers[call_id] -= 1
+        elif msg.get("tool_call_id"):
+            answers[msg["tool_call_id"]] += 1
+    return None
+
+
+class MessageStore:
+    """Append-only message history with a bounded screenshot footprint.
+
+    Only screenshots in the last ``window`` messages are kept in memory, and
+    never more than ``max_image_bytes`` of them. Older ones are appended to
+    ``spill_path`` and read back lazily when a request needs them, or
+    replaced by a short text stub when no spill file is configured. Long
+    text content of messages outside the window is shortened as well. The
+    store supports ``len``, indexing, slicing and iteration so it can be
+    passed wherever a list of messages is expected.
+
+    Tool calls are paired with their responses as messages arrive, so
+    ``trimmed`` returns a valid window without rescanning the history.
+
+    The screenshots of the message given to ``pin`` stay in memory while
+    it is in the window, whatever ``max_image_bytes`` says.
+    """
+
+    def __init__(
+        self,
+        window: int = 8,
+        max_image_bytes: int = 32 * 1024 * 1024,
+        spill_path: Optional[str] = None,
+    ) -> None:
+        self.window = window
+        self.max_image_bytes = max_image_bytes
+        self._messages: List[Dict[str, Any]] = []
+        # (message index, image part) for frames still held in memory
+        self._resident: Deque[Tuple[int, Dict[str, Any]]] = deque()
+        self.image_bytes = 0
+        self.text_bytes = 0
+        self.spilled = 0
+        self.dropped = 0
+        self._stubbed = 0
+        self._pinned = -1
+        self._spill = _SpillFile(spill_path) if spill_path else None
+        # call id -> indexes of assistant messages still waiting for it
+        self._open: Dict[str, Deque[int]] = {}
+        # assistant message index -> number of unanswered calls
+        self._unanswered: Dict[int, int] = {}
+        # assistant messages with unanswered calls, oldest first
+        self._incomplete: Deque[int] = deque()
+
+    def append(self, msg: Dict[str, Any]) -> None:
+        index = len(self._messages)
+        self._messages.append(msg)
+        self._pair(index, msg)
+        content = msg.get("content")
+        if isinstance(content, str):
+            self.text_bytes += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                self.text_bytes += len(part.get("text", ""))
+        for part in _frame_parts(msg):
+            self._resident.append((index, part))
+            self.image_bytes += len(part["image_url"]["url"].data)
+        self._evict()
+
+    def extend(self, msgs: List[Dict[str, Any]]) -> None:
+        for msg in msgs:
+            self.append(msg)
+
+    def _pair(self, index: int, msg: Dict[str, Any]) -> None:
+        if msg.get("tool_calls"):
+            ids = call_ids(msg)
+            for call_id in ids:
+                if call_id:
+                    self._open.setdefault(call_id, deque()).append(index)
+            self._unanswered[index] = len(ids)
+            self._incomplete.append(index)
+            return
+        waiting = self._open.get(msg.get("tool_call_id") or "")
+        if not waiting:
+            return
+        caller = waiting.popleft()
+        if not waiting:
+            del self._open[msg["tool_call_id"]]
+        self._unanswered[caller] -= 1
+        if not self._unanswered[caller]:
+            del self._unanswered[caller]
+
+    def trimmed(self, limit: int) -> List[Dict[str, Any]]:
+        """Return at most ``limit`` recent messages that form a valid request.
+
+        Matches ``main.trim_history`` on the full history (tool call ids are
+        unique) but costs O(``limit``) however long the session has run.
+        """
+        start, end = window_bounds(self._messages, limit)
+        # answered calls are dropped lazily from the newest end
+        incomplete = self._incomplete
+        while incomplete and incomplete[-1] not in self._unanswered:
+            incomplete.pop()
+        cut = None
+        for index in reversed(incomplete):
+            if index < start:
+                break
+            if index < end and index in self._unanswered:
+                cut = index
+                break
+        if cut is not None:
+            start = cut + 1
+        start = next_turn(self._messages, start, end)
+        return self._messages[start:end]
+
+    def pin(self, msg: Dict[str, Any]) -> None:
+        """Keep the screenshots of ``msg``, a stored message, in memory.
+
+        Only one message is pinned at a time; it is the screenshot the next
+        request cannot do without.
+        """
+        for index in range(len(self._messages) - 1, -1, -1):
+            if self._messages[index] is msg:
+                self._pinned = index
+                return
+        raise ValueError("message is not in the store")
+
+    def _evict(self) -> None:
+        boundary = len(self._messages) - self.window
+        while self._stubbed < boundary:
+            self._stub(self._messages[self._stubbed])
+            self._stubbed += 1
+        while self._resident and self._resident[0][0] < boundary:
+            self._release(self._resident.popleft()[1])
+        # under memory pressure the oldest go first, but never the newest
+        # screenshot or the pinned one
+        position = 0
+        while (
+            self.image_bytes > self.max_image_bytes
+            and position < len(self._resident) - 1
+        ):
+            index, part = self._resident[position]
+            if index == self._pinned:
+                position += 1
+                continue
+            del self._resident[position]
+            self._release(part)
+
+    def _release(self, part: Dict[str, Any]) -> None:
+        """Spill or drop the in-memory screenshot in ``part``."""
+        frame = part["image_url"]["url"]
+        self.image_bytes -= len(frame.data)
+        if self._spill is not None:
+            offset = self._spill.write(frame.data)
+            part["image_url"]["url"] = SpilledFrame(self._spill, offset, frame)
+            self.spilled += 1
+        else:
+            part.clear()
+            part.update({"type": "text", "text": OMITTED})
+            self.dropped += 1
+
+    def _stub(self, msg: Dict[str, Any]) -> None:
+        content = msg.get("content")
+        texts = [msg] if isinstance(content, str) else []
+        if isinstance(content, list):
+            texts = [p for p in content if isinstance(p.get("text"), str)]
+        for holder in texts:
+            key = "content" if holder is msg else "text"
+            text = holder[key]
+            if len(text) > STUB_CHARS:
+                holder[key] = text[:STUB_CHARS] + "..."
+                self.text_bytes -= len(text) - len(holder[key])
+
+    def footprint(self) -> Dict[str, int]:
+        """Return message count and the bytes held in memory and on disk."""
+        return {
+            "messages": len(self._messages),
+            "images_in_memory": len(self._resident),
+            "image_bytes": self.image_bytes,
+            "text_bytes": self.text_bytes,
+            "spilled": self.spilled,
+            "spill_bytes": self._spill.size if self._spill else 0,
+            "dropped": self.dropped,
+        }
+
+    def describe(self) -> str:
+        """Return a one-line summary of ``footprint``."""
+        fp = self.footprint()
+        text = (
+            f"{fp['messages']} messages, {fp['images_in_memory']} images "
+            f"({fp['image_bytes'] / 1024:.0f} KB) in memory"
+        )
+        if fp["spilled"]:
+            text += (
+                f", {fp['spilled']} spilled "
+                f"({fp['spill_bytes'] / 1024:.0f} KB on disk)"
+            )
+        if fp["dropped"]:
+            text += f", {fp['dropped']} dropped"
+        return text
+
+    def close(self) -> None:
+        """Close the spill file if one is open."""
+        if self._spill is not None:
+            self._spill.close()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        return self._messages[index]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._messages)
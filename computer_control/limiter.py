@@ -0,0 +1,374 @@
+"""Request rate and concurrency limits shared by every client."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore
+
+
+# How often a caller waiting for a slot held by another process checks
+# again; slots of this process wake their waiters when released.
+POLL = 0.01
+# Queueing delays remembered for the statistics.
+WINDOW = 1000
+
+
+class Governor:
+    """Token-bucket rate limit plus a cap on requests in flight.
+
+    At most ``rate`` requests start per second on average, with bursts of
+    up to ``burst``, and no more than ``max_in_flight`` run at once. A zero
+    disables the respective limit. Every attempt, retries and hedges
+    included, takes a slot with ``slot`` or ``slot_async``.
+
+    With ``lock_path`` the limits hold across processes: the bucket lives in
+    that file and is updated under ``flock``, and each request in flight
+    holds a lock on one of ``max_in_flight`` slot files next to it. Locks
+    of a process that dies are released by the OS, so nothing leaks.
+
+    Callers waiting for a slot or a token are served in arrival order:
+    only the longest waiting one may take them, so a busy bucket cannot
+    starve anyone. The time each caller waited is recorded; see ``stats``.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: int = 1,
+        max_in_flight: int = 0,
+        lock_path: Optional[str] = None,
+    ) -> None:
+        if lock_path and fcntl is None:
+            raise RuntimeError("cross-process limits require fcntl")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_in_flight = max_in_flight
+        self.lock_path = lock_path
+        self.in_flight = 0
+        self._tokens = float(self.burst)
+        self._stamp = time.time()
+        self._held: Set[int] = set()
+        self._slot_files: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # waiting callers in arrival order: ``_ThreadWaiter`` for
+        # ``acquire``, ``_AsyncWaiter`` for ``acquire_async``
+        self._queue: Deque[Any] = deque()
+        self._waits: Deque[float] = deque(maxlen=WINDOW)
+        self.requests = 0
+        self.waited = 0
+        self.total_wait = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.rate > 0 or self.max_in_flight > 0
+
+    def _take_slot(self) -> Optional[int]:
+        """Return a free slot index, ``-1`` when unlimited, or ``None``."""
+        if self.max_in_flight <= 0:
+            return -1
+        if self.lock_path is None:
+            if self.in_flight >= self.max_in_flight:
+                return None
+            return -1
+        for index in range(self.max_in_flight):
+            if index in self._held:
+                continue
+            handle = self._slot_files.get(index)
+            if handle is None:
+                handle = open(f"{self.lock_path}.slot{index}", "a+b")
+                self._slot_files[index] = handle
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue
+            self._held.add(index)
+            return index
+        return None
+
+    def _free_slot(self, index: int) -> None:
+        if index >= 0:
+            self._held.discard(index)
+            fcntl.flock(self._slot_files[index], fcntl.LOCK_UN)
+
+    def _refill(self, tokens: float, stamp: float, now: float) -> float:
+        return min(float(self.burst), tokens + (now - stamp) * self.rate)
+
+    def _take_token(self) -> float:
+        """Take a token and return 0, or return the seconds until one."""
+        if self.rate <= 0:
+            return 0.0
+        if self.lock_path is None:
+            now = time.time()
+            self._tokens = self._refill(self._tokens, self._stamp, now)
+            self._stamp = now
+            return self._spend()
+        with open(f"{self.lock_path}.bucket", "a+") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                fields = handle.read().split()
+                now = time.time()
+                if len(fields) == 2:
+                    tokens = float(fields[0])
+                    self._tokens = self._refill(tokens, float(fields[1]), now)
+                else:
+                    self._tokens = float(self.burst)
+                self._stamp = now
+                wait = self._spend()
+                handle.seek(0)
+                handle.truncate()
+                handle.write(f"{self._tokens} {self._stamp}")
+                handle.flush()
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return wait
+
+    def _spend(self) -> float:
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def try_acquire(self) -> Tuple[Optional[int], float]:
+        """Take a slot and a token without waiting.
+
+        Returns the slot to pass to ``release`` and ``0``, or ``None`` and
+        the seconds to wait before trying again.
+        """
+        with self._lock:
+            slot, wait = self._try_take()
+            return slot, POLL if wait is None else wait
+
+    def _try_take(self) -> Tuple[Optional[int], Optional[float]]:
+        """Like ``try_acquire`` with the lock held.
+
+        The wait is ``None`` when only a release in this process can help.
+        """
+        slot = self._take_slot()
+        if slot is None:
+            return None, POLL if self.lock_path else None
+        wait = self._take_token()
+        if wait > 0:
+            self._free_slot(slot)
+            return None, wait
+        self.in_flight += 1
+        return slot, 0.0
+
+    def release(self, slot: int) -> None:
+        """Give back the slot of a finished request."""
+        with self._lock:
+            self.in_flight -= 1
+            self._free_slot(slot)
+            self._wake()
+
+    def _wake(self) -> None:
+        """Let the waiting callers look again; the lock must be held."""
+        self._cond.notify_all()
+        for waiter in self._queue:
+            if isinstance(waiter, _AsyncWaiter):
+                waiter.wake()
+
+    def _record(self, waited: float) -> None:
+        with self._lock:
+            self.requests += 1
+            if waited > 0:
+                self.waited += 1
+                self.total_wait += waited
+            self._waits.append(waited)
+
+    def _turn(self, waiter: Any) -> Tuple[Optional[int], Optional[float]]:
+        """Try to take a slot for ``waiter`` if it is first in line."""
+        if self._queue[0] is not waiter:
+            return None, None
+        return self._try_take()
+
+    def _leave(self, waiter: Any) -> None:
+        with self._lock:
+            self._queue.remove(waiter)
+            self._wake()
+
+    def acquire(self) -> int:
+        """Block until a request may start and return its slot."""
+        started = time.monotonic()
+        waiter = _ThreadWaiter()
+        with self._lock:
+            slot = self._try_take()[0] if not self._queue else None
+            if slot is None:
+                self._queue.append(waiter)
+        if slot is not None:
+            self._record(0.0)
+            return slot
+        try:
+            with self._lock:
+                while True:
+                    slot, wait = self._turn(waiter)
+                    if slot is not None:
+                        break
+                    self._cond.wait(wait)
+        finally:
+            self._leave(waiter)
+        self._record(time.monotonic() - started)
+        return slot
+
+    async def acquire_async(self) -> int:
+        """Asyncio version of ``acquire``."""
+        started = time.monotonic()
+        waiter = _AsyncWaiter()
+        with self._lock:
+            slot = self._try_take()[0] if not self._queue else None
+            if slot is None:
+                self._queue.append(waiter)
+        if slot is not None:
+            self._record(0.0)
+            return slot
+        try:
+            while True:
+                with self._lock:
+                    slot, wait = self._turn(waiter)
+                    if slot is not None:
+                        break
+                    waiter.event.clear()
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._leave(waiter)
+        self._record(time.monotonic() - started)
+        return slot
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold a request slot for the duration of the block."""
+        if not self.active:
+            yield
+            return
+        index = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(index)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self) -> AsyncIterator[None]:
+        """Asyncio version of ``slot``."""
+        if not self.active:
+            yield
+            return
+        index = await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release(index)
+
+    def stats(self) -> Dict[str, float]:
+        """Return request count and queueing delays in seconds."""
+        with self._lock:
+            waits: List[float] = sorted(self._waits)
+            requests, waited, total = (
+                self.requests,
+                self.waited,
+                self.total_wait,
+            )
+        if not waits:
+            waits = [0.0]
+        return {
+            "requests": requests,
+            "waited": waited,
+            "mean_wait": total / requests if requests else 0.0,
+            "p95_wait": waits[min(len(waits) - 1, int(0.95 * len(waits)))],
+            "max_wait": waits[-1],
+        }
+
+    def describe(self) -> str:
+        """Return a one-line summary of ``stats``."""
+        st = self.stats()
+        return (
+            f"{st['requests']:.0f} requests, {st['waited']:.0f} queued, "
+            f"mean wait {st['mean_wait'] * 1000:.0f} ms, "
+            f"p95 {st['p95_wait'] * 1000:.0f} ms, "
+            f"max {st['max_wait'] * 1000:.0f} ms"
+        )
+
+    def close(self) -> None:
+        """Close the slot files."""
+        with self._lock:
+            for handle in self._slot_files.values():
+                handle.close()
+            self._slot_files.clear()
+            self._held.clear()
+
+
+class _ThreadWaiter:
+    """A caller of ``Governor.acquire``, woken through the condition."""
+
+    __slots__ = ()
+
+
+class _AsyncWaiter:
+    """A caller of ``Governor.acquire_async`` on the running event loop."""
+
+    __slots__ = ("loop", "event")
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:  # pragma: no cover - the loop has closed
+            pass
+
+
+def from_env() -> Governor:
+    """Return a ``Governor`` configured by environment variables.
+
+    ``POLLINATIONS_RATE`` (requests per second), ``POLLINATIONS_BURST``,
+    ``POLLINATIONS_MAX_IN_FLIGHT`` and ``POLLINATIONS_LIMIT_FILE`` map to
+    the ``Governor`` arguments; unset means unlimited and per process. A
+    malformed value is reported and replaced by its default, since this
+    runs when ``client`` is imported.
+    """
+    lock_path = os.environ.get("POLLINATIONS_LIMIT_FILE") or None
+    if lock_path and fcntl is None:
+        print("Warning: POLLINATIONS_LIMIT_FILE needs fcntl; ignored")
+        lock_path = None
+    return Governor(
+        rate=_number("POLLINATIONS_RATE", float, 0.0),
+        burst=_number("POLLINATIONS_BURST", int, 1),
+        max_in_flight=_number("POLLINATIONS_MAX_IN_FLIGHT", int, 0),
+        lock_path=lock_path,
+    )
+
+
+def _number(name: str, kind: Any, default: Any) -> Any:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return kind(value)
+    except ValueError:
+        print(f"Warning: invalid {name}={value!r}; using {default}")
+        return default
@@ -2,15 +2,33 @@
 
 from __future__ import annotations
 import argparse
+import asyncio
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Counter, Optional, Sequence, Tuple
 import base64
+import binascii
 import io
 from PIL import Image
 import tkinter as tk
 from tkinter import ttk, messagebox
 from computer_control import controller
+from computer_control import budget
+from computer_control import cache
+from computer_control import capture
 from computer_control import client
+from computer_control import encoder
+from computer_control import frames
+from computer_control import grabber
+from computer_control import hedge
+from computer_control import retry
+from computer_control import shell
+from computer_control.history import (
+    MessageStore,
+    call_ids,
+    last_unanswered,
+    next_turn,
+    window_bounds,
+)
 
 
 class PopupUI:
@@ -84,90 +102,172 @@ def blank_image() -> str:
     return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
 
 
-def trim_history(
-    msgs: List[Dict[str, Any]],
-    limit: int,
-) -> List[Dict[str, Any]]:
-    """Return at most ``limit`` recent messages starting from a user or system
-    message.
+def as_frame(screenshot: Any) -> frames.ScreenFrame:
+    """Return ``screenshot`` (a frame or data URL) as a ``ScreenFrame``."""
+    if isinstance(screenshot, frames.ScreenFrame):
+        return screenshot
+    try:
+        return frames.ScreenFrame.from_data_url(screenshot)
+    except (ValueError, binascii.Error):
+        print("Warning: invalid screenshot; using blank screenshot")
+        return frames.ScreenFrame.from_data_url(blank_image())
 
-    The helper ensures no assistant message with ``tool_calls`` is included
-    without the corresponding tool responses which would otherwise trigger API
-    errors.
+
+def take_screenshot(
+    frame_bytes: int = 0,
+    frame_ms: float = 0.0,
+    image: Optional[Image.Image] = None,
+) -> frames.ScreenFrame:
+    """Return a screenshot frame or a blank image without a GUI.
+
+    A positive ``frame_bytes`` encodes the screenshot with
+    ``encoder.encode_raw`` to stay within that many bytes. ``image`` is
+    encoded instead of grabbing a new screenshot if given.
     """
+    try:
+        if image is None:
+            image = controller.grab_screen()
+    except controller.GUIUnavailable as exc:
+        print(f"Warning: {exc}; using blank screenshot")
+        return as_frame(blank_image())
+    if image is None:
+        return as_frame(blank_image())
+    if frame_bytes <= 0:
+        return frames.ScreenFrame.from_image(image)
+    data, info = encoder.encode_raw(image, frame_bytes, max_ms=frame_ms)
+    print(f"Screenshot: {encoder.describe(info)}")
+    return frames.ScreenFrame(data, info["mime"], info["size"])
 
-    if limit <= 0:
-        return []
 
-    start = max(0, len(msgs) - limit)
-    while start < len(msgs) and msgs[start]["role"] not in ("system", "user"):
-        start += 1
-    trimmed = msgs[start:]
+def capture_delta(
+    capturer: frames.DeltaCapture,
+    caption: str,
+    image: Optional[Image.Image] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """Return delta capture content parts or a blank frame without a GUI."""
+    try:
+        return capturer.capture(caption, image)
+    except controller.GUIUnavailable as exc:
+        print(f"Warning: {exc}; using blank screenshot")
+        return screen_message(as_frame(blank_image()), caption)["content"]
 
-    def clean(seq: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Return ``seq`` with incomplete assistant/tool pairs removed."""
 
-        # drop trailing assistant messages that contain tool_calls
-        while seq and seq[-1].get("tool_calls"):
-            seq.pop()
+def screen_message(screenshot: Any, text: str) -> Dict[str, Any]:
+    """Return a user message carrying ``screenshot`` with a caption.
 
-        # drop leading tool messages without a preceding assistant
-        while seq and seq[0]["role"] == "tool":
-            seq.pop(0)
+    ``screenshot`` is a ``frames.ScreenFrame`` or a data URL.
+    """
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": text},
+            {"type": "image_url", "image_url": {"url": screenshot}},
+        ],
+    }
 
-        # remove any assistant message whose tool_calls lack responses
-        while True:
-            pending: List[str] = []
-            first_incomplete: Optional[int] = None
-            for i, msg in enumerate(seq):
-                if msg.get("tool_calls"):
-                    ids = [c.get("id", "") for c in msg["tool_calls"]]
-                    pending.extend(ids)
-                    if first_incomplete is None:
-                        first_incomplete = i
-                else:
-                    call_id = msg.get("tool_call_id")
-                    if call_id and call_id in pending:
-                        pending.remove(call_id)
-                        if not pending:
-                            first_incomplete = None
 
-            if not pending:
-                break
+def unchanged_message(step: int) -> Dict[str, Any]:
+    """Return a text-only user message noting the screen did not change."""
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": f"Screen unchanged since step {step}"}
+        ],
+    }
 
-            assert first_incomplete is not None
-            seq = seq[first_incomplete + 1 :]  # noqa: E203
-            while seq and seq[0]["role"] == "tool":
-                seq.pop(0)
 
-        # ensure sequence starts with system or user
-        while seq and seq[0]["role"] not in ("system", "user"):
-            seq.pop(0)
+def first_image(parts: List[Dict[str, Any]]) -> Any:
+    """Return the first image (frame or URL) in message content ``parts``."""
+    for part in parts:
+        if part.get("type") == "image_url":
+            return part["image_url"]["url"]
+    return None
 
-        return seq
 
-    trimmed = clean(trimmed)
+def trim_history(
+    msgs: Sequence[Dict[str, Any]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Return at most ``limit`` recent messages starting from a user or system
+    message.
 
-    if len(trimmed) > limit:
-        trimmed = trimmed[-limit:]
-        trimmed = clean(trimmed)
+    The helper ensures no assistant message with ``tool_calls`` is included
+    without the corresponding tool responses which would otherwise trigger API
+    errors. Only the last ``limit`` messages are examined.
+    """
 
-    return trimmed
+    if isinstance(msgs, MessageStore):
+        return msgs.trimmed(limit)
+    start, end = window_bounds(msgs, limit)
+    cut = last_unanswered(msgs, start, end)
+    if cut is not None:
+        start = cut + 1
+    start = next_turn(msgs, start, end)
+    return list(msgs[start:end])
 
 
-def validate_history(msgs: List[Dict[str, Any]]) -> None:
+def validate_history(msgs: Sequence[Dict[str, Any]]) -> None:
     """Ensure ``msgs`` contains no unfinished tool calls."""
 
-    pending: List[str] = []
+    pending: Counter[str] = Counter()
+    order: List[str] = []
     for msg in msgs:
         if msg.get("tool_calls"):
-            pending.extend(c.get("id", "") for c in msg["tool_calls"])
+            ids = call_ids(msg)
+            pending.update(ids)
+            order.extend(ids)
         else:
             call_id = msg.get("tool_call_id")
-            if call_id and call_id in pending:
-                pending.remove(call_id)
-    if pending:
-        raise ValueError(f"missing tool responses for: {', '.join(pending)}")
+            if call_id and pending[call_id]:
+                pending[call_id] -= 1
+    if any(pending.values()):
+        # answers match the earliest calls with the same id
+        skip = Counter(order) - pending
+        missing = []
+        for call_id in order:
+            if skip[call_id]:
+                skip[call_id] -= 1
+            else:
+                missing.append(call_id)
+        raise ValueError(f"missing tool responses for: {', '.join(missing)}")
+
+
+def shrink_request(
+    request_budget: Optional[budget.RequestBudget], history: int, sent: int
+) -> Optional[int]:
+    """Make the next request smaller after a 413 response.
+
+    ``sent`` is the number of messages in the rejected request. Returns the
+    ``history`` to use from now on, or ``None`` if nothing can be dropped.
+    """
+    if request_budget is not None and sent > 1:
+        request_budget.max_bytes = int(
+            min(request_budget.max_bytes, request_budget.last_bytes) * 0.75
+        )
+        print(
+            "Warning: payload too large; retrying with a",
+            f"{request_budget.max_bytes // 1024} KB request limit",
+        )
+        return history
+    if history > 1:
+        history = max(1, history // 2)
+        print(
+            "Warning: payload too large;",
+            f"retrying with history={history}",
+        )
+        return history
+    return None
+
+
+def open_cache(
+    path: Optional[str], ttl: float, max_mb: float
+) -> Optional[cache.ResponseCache]:
+    """Return a ``cache.ResponseCache`` stored at ``path`` or ``None``."""
+    if not path:
+        return None
+    return cache.ResponseCache(
+        path, ttl=ttl, max_bytes=int(max_mb * 1024 * 1024)
+    )
 
 
 def main(
@@ -179,6 +279,31 @@ def main(
     history: int = 8,
     save_dir: Optional[str] = None,
     delay: float = 0.0,
+    skip_unchanged: bool = True,
+    delta_keyframe: int = 0,
+    frame_bytes: int = 0,
+    frame_ms: float = 0.0,
+    background_capture: bool = False,
+    settle_ms: int = 0,
+    settle_timeout: float = 3.0,
+    history_memory: float = 32.0,
+    spill_file: Optional[str] = None,
+    max_request_kb: float = 0.0,
+    pool_size: int = 4,
+    connect_timeout: float = 5.0,
+    read_timeout: float = 60.0,
+    request_deadline: float = 120.0,
+    hedge_requests: bool = False,
+    hedge_url: Optional[str] = None,
+    api_urls: Optional[Sequence[str]] = None,
+    balance: str = "least",
+    warm_up: bool = False,
+    stream: bool = False,
+    cache_file: Optional[str] = None,
+    cache_ttl: float = 7 * 24 * 3600,
+    cache_mb: float = 64.0,
+    persistent_shell: bool = True,
+    paste_min_chars: int = 64,
 ) -> None:
     """Send ``goal`` to Pollinations and execute returned actions.
 
@@ -187,111 +312,519 @@ def main(
     to the API each loop. Limiting the history prevents request payloads
     from growing too large and triggering HTTP 413 errors.
 
+    When ``skip_unchanged`` is set, a screenshot that matches the last one
+    sent is replaced by a short text note instead of a new image.
+
+    A positive ``delta_keyframe`` sends a downscaled full screenshot only
+    every ``delta_keyframe`` steps and full-resolution crops of the changed
+    regions in between.
+
+    A positive ``frame_bytes`` picks resolution, format and quality of each
+    screenshot to fit that many bytes, and ``frame_ms`` bounds the time
+    spent encoding it.
+
+    With ``background_capture`` the post-action screenshot is grabbed and
+    encoded on a worker thread, and the ``delay`` after the last action is
+    waited out there too, while the loop records the step and serializes
+    the messages of the next request.
+
+    A positive ``settle_ms`` replaces the fixed ``delay`` after each action:
+    the screen is polled until it has not changed for ``settle_ms``
+    milliseconds, or for at most ``settle_timeout`` seconds, and the stable
+    frame becomes the next screenshot.
+
+    Screenshots outside the ``history`` window, or beyond
+    ``history_memory`` megabytes, are appended to ``spill_file`` and
+    reloaded on demand, or dropped when no spill file is given.
+
+    A positive ``max_request_kb`` keeps each request body under that many
+    kilobytes: older screenshots in the batch are sent as thumbnails or
+    placeholders, and the oldest turns are dropped only if that is not
+    enough. A 413 response then lowers the ceiling rather than ``history``.
+
+    Requests share up to ``pool_size`` keep-alive connections, each attempt
+    bounded by ``connect_timeout`` and ``read_timeout`` seconds. Failed
+    requests are retried with jittered backoff, honouring ``Retry-After``,
+    for at most ``request_deadline`` seconds per step. With ``warm_up``
+    the first connection is opened while the initial screenshot is taken.
+    With ``hedge_requests`` a request slower than 90% of recent ones is sent
+    again, to ``hedge_url`` if given, and the first answer is used.
+
+    Several ``api_urls`` (by default the ``POLLINATIONS_API`` list) share
+    the requests by ``balance``, ``"least"`` outstanding requests or
+    ``"ewma"`` latency, and failing endpoints are skipped for a while.
+
+    With ``stream`` the response is streamed and each tool call is executed
+    as soon as it is complete, while the rest of the turn is generated.
+
+    With ``cache_file`` responses are stored in that SQLite file and
+    replayed, without contacting the API, when the goal, the last few tool
+    calls and the screen match a stored state. Entries expire after
+    ``cache_ttl`` seconds and the cache is kept under ``cache_mb``
+    megabytes.
+
+    With ``persistent_shell`` all ``run_shell`` commands of the session run
+    in one ``shell.ShellSession``, so the working directory and exported
+    variables carry over; otherwise each command gets a new shell.
+
+    ``write_text`` pastes text of ``paste_min_chars`` or more characters,
+    and text with characters ``pyautogui`` cannot type, through the
+    clipboard instead of typing it key by key; ``0`` always types.
+
     """
     ui = PopupUI(steps)
     counter = 0
     if save_dir:
         os.makedirs(save_dir, exist_ok=True)
     print("AI is taking control. Do not touch your computer.")
-    messages: List[Dict[str, Any]] = [
-        {"role": "system", "content": client.SYSTEM_PROMPT}
-    ]
+    messages = MessageStore(
+        window=history,
+        max_image_bytes=int(history_memory * 1024 * 1024),
+        spill_path=spill_file,
+    )
+    messages.append({"role": "system", "content": client.SYSTEM_PROMPT})
+
+    capturer = (
+        frames.DeltaCapture(delta_keyframe) if delta_keyframe > 0 else None
+    )
+    request_budget = (
+        budget.RequestBudget(int(max_request_kb * 1024))
+        if max_request_kb > 0
+        else None
+    )
+
+    def settle() -> Optional[Image.Image]:
+        return frames.wait_for_settle(settle_ms / 1000, settle_timeout)
+
+    def shoot(
+        caption: str = "Updated screen", settled: bool = False
+    ) -> Tuple[Optional[List[Dict[str, Any]]], Any, Optional[bytes]]:
+        """Return delta content parts, a screenshot frame and its digest.
 
+        With ``settled`` the screen is first allowed to settle.
+        """
+        image = settle() if settled and settle_ms > 0 else None
+        if capturer is not None:
+            parts = capture_delta(capturer, caption, image)
+            return parts, first_image(parts or []), None
+        frame = take_screenshot(frame_bytes, frame_ms, image)
+        return None, frame, frame.digest if skip_unchanged else None
+
+    worker: Optional[capture.CaptureWorker] = None
+    responses: Optional[cache.ResponseCache] = None
     try:
-        screenshot = controller.capture_screen()
-    except controller.GUIUnavailable as exc:
-        print(f"Warning: {exc}; using blank screenshot")
-        screenshot = blank_image()
-    if save_dir:
-        path = os.path.join(save_dir, f"{counter}.jpg")
-        controller.save_image(screenshot, path)
-        counter += 1
+        controller.set_grabber(grabber.auto_grabber())
+        controller.set_paste_min_chars(paste_min_chars)
+        if persistent_shell:
+            controller.set_shell_session(shell.ShellSession())
+        api = client.PollinationsClient(
+            pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retry_policy=retry.RetryPolicy(deadline=request_deadline),
+            hedger=hedge.Hedger() if hedge_requests else None,
+            hedge_url=hedge_url,
+            urls=api_urls,
+            strategy=balance,
+        )
+        client.set_client(api)
+        if warm_up:
+            api.warm_up(background=True)
+        if background_capture:
+            worker = capture.CaptureWorker(shoot)
+        responses = open_cache(cache_file, cache_ttl, cache_mb)
+
+        parts, screenshot, last_digest = shoot(goal)
+        if capturer is not None:
+            screenshot = screenshot or as_frame(blank_image())
+            messages.append({"role": "user", "content": parts or []})
+        else:
+            assert screenshot is not None
+            messages.append(screen_message(screenshot, goal))
+        if save_dir:
+            path = os.path.join(save_dir, f"{counter}.{screenshot.extension}")
+            screenshot.save(path)
+            counter += 1
+
+        # the newest message holding a complete screenshot
+        last_full = messages[-1]
+        messages.pin(last_full)
+        last_screen = screenshot
+        last_step = 0
+
+        loop_limit = steps if steps is not None else max_steps
+        unlimited = steps is None and loop_limit <= 0
+        i = 0
+
+        while True:
+            dispatcher: Optional[client.StreamDispatcher] = None
+            try:
+                batch = trim_history(messages, history)
+                if (
+                    batch
+                    and batch[-1]["role"] == "user"
+                    and not any(m is last_full for m in batch)
+                ):
+                    # the last full screenshot fell out of the window
+                    if capturer is not None:
+                        known = capturer.snapshot() or last_screen
+                        batch.insert(
+                            len(batch) - 1,
+                            screen_message(known, "Current screen"),
+                        )
+                    else:
+                        batch[-1] = screen_message(
+                            last_screen, "Current screen"
+                        )
+                if request_budget is not None:
+                    batch = request_budget.fit(batch)
+                validate_history(batch)
+                cached = None
+                if responses is not None:
+                    # only the cache needs the digest of the known screen
+                    known = capturer.snapshot() if capturer else None
+                    screen_digest = (known or last_screen).digest
+                    cached = responses.lookup(goal, batch, screen_digest)
+                if cached is not None:
+                    data = cached
+                elif stream:
+                    dispatcher = client.StreamDispatcher(
+                        dry_run=dry_run,
+                        secure=secure,
+                        delay=delay,
+                        settle=settle if settle_ms > 0 else None,
+                    )
+                    data = client.query_pollinations(
+                        frames.materialize(batch), on_tool_call=dispatcher
+                    )
+                else:
+                    data = client.query_pollinations(frames.materialize(batch))
+                if responses is not None and cached is None:
+                    responses.store(goal, batch, screen_digest, data)
+            except RuntimeError as exc:
+                if dispatcher is not None:
+                    dispatcher.cancel()
+                if "413" in str(exc):
+                    smaller = shrink_request(
+                        request_budget, history, len(batch)
+                    )
+                    if smaller is not None:
+                        history = messages.window = smaller
+                        continue
+                print(f"Error: {exc}")
+                break
+
+            choice = data.get("choices", [{}])[0]
+            message = choice.get("message", {})
+            tool_calls = message.get("tool_calls")
+            tool_messages: List[Dict[str, Any]] = []
+            if tool_calls and stream and cached is None:
+                # already executed while the response was streaming
+                tool_messages = dispatcher.finish(
+                    trailing_delay=worker is None and settle_ms <= 0
+                )
+            elif tool_calls:
+                tool_messages = client.execute_tool_calls(
+                    tool_calls,
+                    dry_run=dry_run,
+                    secure=secure,
+                    delay=delay,
+                    trailing_delay=worker is None and settle_ms <= 0,
+                    settle=settle if settle_ms > 0 else None,
+                )  # noqa: E501
+            # only wait for the screen when something was actually executed
+            acted = bool(tool_calls) and not dry_run
+            if worker is not None:
+                worker.request(
+                    delay if tool_calls and settle_ms <= 0 else 0.0,
+                    settled=acted,
+                )
+            if tool_calls:
+                ui.update(
+                    i + 1, f"{tool_calls[0].get('function', {}).get('name')}"
+                )  # noqa: E501
+            if content := message.get("content"):
+                print(content)
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": message.get("content", ""),
+                    **({"tool_calls": tool_calls} if tool_calls else {}),
+                }
+            )
+            if tool_calls:
+                messages.extend(tool_messages)
+            if worker is not None:
+                # encode the next request's messages while the frame is made,
+                # so only the new screenshot is left to encode
+                for msg in frames.materialize(trim_history(messages, history)):
+                    api.body.message(msg)
+            parts, screenshot, digest = (
+                worker.result() if worker is not None else shoot(settled=acted)
+            )
+            if capturer is not None:
+                if parts is None:
+                    messages.append(unchanged_message(last_step))
+                else:
+                    messages.append({"role": "user", "content": parts})
+                    last_step = i + 1
+                    if capturer.last_was_keyframe:
+                        last_full = messages[-1]
+                        messages.pin(last_full)
+                        last_screen = screenshot or last_screen
+            else:
+                assert screenshot is not None
+                if frames.frames_match(digest, last_digest):
+                    messages.append(unchanged_message(last_step))
+                else:
+                    messages.append(
+                        screen_message(screenshot, "Updated screen")
+                    )
+                    last_full = messages[-1]
+                    messages.pin(last_full)
+                    last_screen = screenshot
+                    last_digest = digest
+                    last_step = i + 1
+            if save_dir and screenshot:
+                name = f"{counter}.{screenshot.extension}"
+                path = os.path.join(save_dir, name)
+                screenshot.save(path)
+                counter += 1
+            ui.update(i + 1, f"step {i + 1}")
+            if data.get("done") or message.get("done"):
+                break
+            i += 1
+            if not unlimited and i >= loop_limit:
+                break
+        if save_dir:
+            final = take_screenshot(frame_bytes, frame_ms)
+            final.save(os.path.join(save_dir, f"final.{final.extension}"))
+        print(f"History: {messages.describe()}")
+        if request_budget is not None:
+            print(f"Last request: {request_budget.describe()}")
+        if responses is not None:
+            print(f"Response cache: {responses.describe()}")
+        if api.hedger is not None:
+            print(f"Hedging: {api.hedger.describe()}")
+        if api.balancer is not None:
+            print(f"Endpoints: {api.balancer.describe()}")
+        if client.get_governor().active:
+            print(f"Rate limit: {client.get_governor().describe()}")
+        session = controller.get_shell_session()
+        if session is not None and session.commands:
+            print(f"Shell: {session.describe()}")
+    finally:
+        if worker is not None:
+            worker.close()
+        if responses is not None:
+            responses.close()
+        messages.close()
+        controller.set_grabber(None)
+        controller.set_shell_session(None)
+        client.set_client(None)
+        ui.done()
+
+
+async def main_async(
+    goal: str,
+    steps: Optional[int] = None,
+    max_steps: int = 0,
+    dry_run: bool = False,
+    secure: bool = True,
+    history: int = 8,
+    save_dir: Optional[str] = None,
+    delay: float = 0.0,
+    skip_unchanged: bool = True,
+    frame_bytes: int = 0,
+    frame_ms: float = 0.0,
+    settle_ms: int = 0,
+    settle_timeout: float = 3.0,
+    history_memory: float = 32.0,
+    spill_file: Optional[str] = None,
+    max_request_kb: float = 0.0,
+    stream: bool = False,
+    cache_file: Optional[str] = None,
+    cache_ttl: float = 7 * 24 * 3600,
+    cache_mb: float = 64.0,
+    api: Optional[client.AsyncPollinationsClient] = None,
+) -> None:
+    """Asyncio version of ``main``.
 
-    messages.append(
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": goal},
-                {"type": "image_url", "image_url": {"url": screenshot}},
-            ],
-        }
+    Requests and their retries, screenshots and actions are awaitable, so
+    the session can be cancelled at any step and many sessions can run in
+    one event loop. They may share one ``client.AsyncPollinationsClient``
+    passed as ``api``; otherwise a client is created and closed here.
+    Options behave as in ``main``. Progress goes to the console.
+    Delta capture and the background capture worker are not available.
+    """
+    own_api = api is None
+    if api is None:
+        api = client.AsyncPollinationsClient()
+    counter = 0
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    messages = MessageStore(
+        window=history,
+        max_image_bytes=int(history_memory * 1024 * 1024),
+        spill_path=spill_file,
+    )
+    messages.append({"role": "system", "content": client.SYSTEM_PROMPT})
+    request_budget = (
+        budget.RequestBudget(int(max_request_kb * 1024))
+        if max_request_kb > 0
+        else None
     )
+    responses = open_cache(cache_file, cache_ttl, cache_mb)
 
-    loop_limit = steps if steps is not None else max_steps
-    unlimited = steps is None and loop_limit <= 0
-    i = 0
+    def settle() -> Optional[Image.Image]:
+        return frames.wait_for_settle(settle_ms / 1000, settle_timeout)
 
-    while True:
+    def shoot(
+        settled: bool = False,
+    ) -> Tuple[frames.ScreenFrame, Optional[bytes]]:
+        image = settle() if settled and settle_ms > 0 else None
+        frame = take_screenshot(frame_bytes, frame_ms, image)
+        return frame, frame.digest if skip_unchanged else None
 
-        try:
+    def save(frame: frames.ScreenFrame) -> None:
+        nonlocal counter
+        if save_dir:
+            frame.save(os.path.join(save_dir, f"{counter}.{frame.extension}"))
+            counter += 1
+
+    try:
+        screenshot, last_digest = await client.in_thread(shoot)
+        messages.append(screen_message(screenshot, goal))
+        save(screenshot)
+        last_full = messages[-1]
+        messages.pin(last_full)
+        last_screen = screenshot
+        last_step = 0
+
+        loop_limit = steps if steps is not None else max_steps
+        unlimited = steps is None and loop_limit <= 0
+        i = 0
+
+        while True:
             batch = trim_history(messages, history)
+            if (
+                batch
+                and batch[-1]["role"] == "user"
+                and not any(m is last_full for m in batch)
+            ):
+                batch[-1] = screen_message(last_screen, "Current screen")
+            if request_budget is not None:
+                batch = request_budget.fit(batch)
             validate_history(batch)
-            data = client.query_pollinations(batch)
-        except RuntimeError as exc:
-            if "413" in str(exc) and history > 1:
-                history = max(1, history // 2)
-                print(
-                    "Warning: payload too large;",
-                    f"retrying with history={history}",
+            cached = (
+                responses.lookup(goal, batch, last_screen.digest)
+                if responses is not None
+                else None
+            )
+            dispatcher = (
+                client.AsyncStreamDispatcher(
+                    dry_run, secure, delay, settle if settle_ms > 0 else None
                 )
-                continue
-            print(f"Error: {exc}")
-            break
-
-        choice = data.get("choices", [{}])[0]
-        message = choice.get("message", {})
-        tool_calls = message.get("tool_calls")
-        tool_messages: List[Dict[str, Any]] = []
-        if tool_calls:
-            tool_messages = client.execute_tool_calls(
-                tool_calls, dry_run=dry_run, secure=secure, delay=delay
-            )  # noqa: E501
-            ui.update(
-                i + 1, f"{tool_calls[0].get('function', {}).get('name')}"
-            )  # noqa: E501
-        if content := message.get("content"):
-            print(content)
-        messages.append(
-            {
-                "role": "assistant",
-                "content": message.get("content", ""),
-                **({"tool_calls": tool_calls} if tool_calls else {}),
-            }
-        )
-        if tool_calls:
-            messages.extend(tool_messages)
-        try:
-            screenshot = controller.capture_screen()
-        except controller.GUIUnavailable as exc:
-            print(f"Warning: {exc}; using blank screenshot")
-            screenshot = blank_image()
-        if save_dir:
-            path = os.path.join(save_dir, f"{counter}.jpg")
-            controller.save_image(screenshot, path)
-            counter += 1
-        messages.append(
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Updated screen"},
-                    {"type": "image_url", "image_url": {"url": screenshot}},
-                ],
-            }
-        )
-        ui.update(i + 1, f"step {i + 1}")
-        if data.get("done") or message.get("done"):
-            break
-        i += 1
-        if not unlimited and i >= loop_limit:
-            break
-    if save_dir:
-        try:
-            final_img = controller.capture_screen()
-            path = os.path.join(save_dir, "final.jpg")
-            controller.save_image(final_img, path)
-        except controller.GUIUnavailable:
-            pass
-    ui.done()
+                if stream and cached is None
+                else None
+            )
+            try:
+                if cached is not None:
+                    data = cached
+                else:
+                    data = await api.query(
+                        frames.materialize(batch), on_tool_call=dispatcher
+                    )
+                    if responses is not None:
+                        responses.store(goal, batch, last_screen.digest, data)
+            except asyncio.CancelledError:
+                if dispatcher is not None:
+                    dispatcher.cancel()
+                raise
+            except RuntimeError as exc:
+                if dispatcher is not None:
+                    dispatcher.cancel()
+                if "413" in str(exc):
+                    smaller = shrink_request(
+                        request_budget, history, len(batch)
+                    )
+                    if smaller is not None:
+                        history = messages.window = smaller
+                        continue
+                print(f"Error: {exc}")
+                break
+
+            choice = data.get("choices", [{}])[0]
+            message = choice.get("message", {})
+            tool_calls = message.get("tool_calls")
+            tool_messages: List[Dict[str, Any]] = []
+            if dispatcher is not None:
+                tool_messages = await dispatcher.finish(settle_ms <= 0)
+            elif tool_calls:
+                tool_messages = await client.execute_tool_calls_async(
+                    tool_calls,
+                    dry_run=dry_run,
+                    secure=secure,
+                    delay=delay,
+                    trailing_delay=settle_ms <= 0,
+                    settle=settle if settle_ms > 0 else None,
+                )
+            acted = bool(tool_calls) and not dry_run
+            # grab the next screen while this step is recorded
+            capture_task = asyncio.ensure_future(
+                client.in_thread(shoot, acted)
+            )
+            if content := message.get("content"):
+                print(content)
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": message.get("content", ""),
+                    **({"tool_calls": tool_calls} if tool_calls else {}),
+                }
+            )
+            if tool_calls:
+                messages.extend(tool_messages)
+            screenshot, digest = await capture_task
+            if frames.frames_match(digest, last_digest):
+                messages.append(unchanged_message(last_step))
+            else:
+                messages.append(screen_message(screenshot, "Updated screen"))
+                last_full = messages[-1]
+                messages.pin(last_full)
+                last_screen = screenshot
+                last_digest = digest
+                last_step = i + 1
+            save(screenshot)
+            names = ", ".join(
+                str(c.get("function", {}).get("name"))
+                for c in tool_calls or []
+            )
+            print(f"Step {i + 1}: {names or 'no action'}")
+            if data.get("done") or message.get("done"):
+                break
+            i += 1
+            if not unlimited and i >= loop_limit:
+                break
+        print(f"History: {messages.describe()}")
+        if request_budget is not None:
+            print(f"Last request: {request_budget.describe()}")
+        if responses is not None:
+            print(f"Response cache: {responses.describe()}")
+        hedger = getattr(api, "hedger", None)
+        if hedger is not None:
+            print(f"Hedging: {hedger.describe()}")
+        lb = getattr(api, "balancer", None)
+        if lb is not None:
+            print(f"Endpoints: {lb.describe()}")
+        if client.get_governor().active:
+            print(f"Rate limit: {client.get_governor().describe()}")
+    finally:
+        if responses is not None:
+            responses.close()
+        messages.close()
+        if own_api:
+            await api.close()
 
 
 def cli_entry() -> None:
@@ -320,28 +853,300 @@ def cli_entry() -> None:
         action="store_true",
         help="Print actions instead of executing",
     )
+    parser.add_argument(
+        "--no-confirm",
+        action="store_true",
+        help="Run actions without asking first; lets calls be merged and "
+        "file or shell calls run concurrently",
+    )
     parser.add_argument(
         "--history",
         type=int,
         default=8,
         help="Number of recent messages to send to the API",
     )
+    parser.add_argument(
+        "--history-memory",
+        type=float,
+        default=32.0,
+        metavar="MB",
+        help="Maximum megabytes of screenshots kept in memory",
+    )
+    parser.add_argument(
+        "--spill-file",
+        help=(
+            "Append screenshots that leave the history window to this file "
+            "instead of dropping them"
+        ),
+    )
+    parser.add_argument(
+        "--max-request-kb",
+        type=float,
+        default=0.0,
+        metavar="KB",
+        help=(
+            "Keep each request body under this size by thumbnailing or "
+            "omitting older screenshots, then dropping old turns (0 to "
+            "disable)"
+        ),
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=4,
+        help="Keep-alive connections kept open to the API",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=5.0,
+        help="Seconds to wait for a connection to the API",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds to wait for the API to respond",
+    )
+    parser.add_argument(
+        "--request-deadline",
+        type=float,
+        default=120.0,
+        help="Seconds one step may spend on a request, retries included",
+    )
+    parser.add_argument(
+        "--api-url",
+        action="append",
+        dest="api_urls",
+        metavar="URL",
+        help=(
+            "Compatible endpoint to send requests to; repeat to spread "
+            "them over several (default: POLLINATIONS_API)"
+        ),
+    )
+    parser.add_argument(
+        "--balance",
+        choices=("least", "ewma"),
+        default="least",
+        help=(
+            "Pick the endpoint with the fewest requests in flight or the "
+            "lowest smoothed latency"
+        ),
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help=(
+            "Send a slow request a second time once it takes longer than "
+            "90%% of recent ones and use the first answer"
+        ),
+    )
+    parser.add_argument(
+        "--hedge-url",
+        help="Send hedged requests to this endpoint instead",
+    )
+    parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="Connect to the API while the first screenshot is taken",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream responses and run each action as soon as it arrives",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help=(
+            "Store responses in this file and replay them when the goal, "
+            "recent actions and screen match"
+        ),
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=7 * 24 * 3600,
+        help="Seconds a cached response stays valid",
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=float,
+        default=64.0,
+        metavar="MB",
+        help="Maximum size of the response cache",
+    )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="Run the agent loop on asyncio with an aiohttp client",
+    )
     parser.add_argument(
         "--delay",
         type=float,
         default=0.0,
         help="Seconds to wait after each action",
     )
+    parser.add_argument(
+        "--delta-keyframe",
+        type=int,
+        default=0,
+        metavar="K",
+        help=(
+            "Send a full screenshot every K steps and only the changed "
+            "regions in between (0 to disable)"
+        ),
+    )
+    parser.add_argument(
+        "--frame-bytes",
+        type=int,
+        default=0,
+        help=(
+            "Target size in bytes of each encoded screenshot; picks "
+            "resolution, format and quality to fit (0 for fixed JPEG)"
+        ),
+    )
+    parser.add_argument(
+        "--frame-ms",
+        type=float,
+        default=0.0,
+        help="Time budget in milliseconds for encoding each screenshot",
+    )
+    parser.add_argument(
+        "--settle-ms",
+        type=int,
+        default=0,
+        help=(
+            "Instead of --delay, wait after each action until the screen "
+            "has been unchanged for this many milliseconds (0 to disable)"
+        ),
+    )
+    parser.add_argument(
+        "--settle-timeout",
+        type=float,
+        default=3.0,
+        help="Maximum seconds to wait for the screen to settle",
+    )
+    parser.add_argument(
+        "--background-capture",
+        action="store_true",
+        help="Grab and encode screenshots on a background thread",
+    )
+    parser.add_argument(
+        "--resend-unchanged",
+        action="store_true",
+        help="Send every screenshot even if the screen did not change",
+    )
+    parser.add_argument(
+        "--fresh-shell",
+        action="store_true",
+        help=(
+            "Run each shell command in a new shell instead of one shell "
+            "kept for the session"
+        ),
+    )
+    parser.add_argument(
+        "--paste-min-chars",
+        type=int,
+        default=64,
+        help=(
+            "Paste text of at least this many characters through the "
+            "clipboard instead of typing it (0 always types)"
+        ),
+    )
     args = parser.parse_args()
     steps = None if str(args.steps).lower() == "auto" else int(args.steps)
+    if args.asyncio:
+        if args.delta_keyframe or args.background_capture:
+            parser.error(
+                "--asyncio does not support --delta-keyframe or "
+                "--background-capture"
+            )
+
+        async def run() -> None:
+            async with client.AsyncPollinationsClient(
+                pool_size=args.pool_size,
+                connect_timeout=args.connect_timeout,
+                read_timeout=args.read_timeout,
+                retry_policy=retry.RetryPolicy(
+                    deadline=args.request_deadline
+                ),
+                hedger=hedge.Hedger() if args.hedge else None,
+                hedge_url=args.hedge_url,
+                urls=args.api_urls,
+                strategy=args.balance,
+            ) as api:
+                if args.warm_up:
+                    warm = asyncio.ensure_future(api.warm_up())
+                await main_async(
+                    args.goal,
+                    steps=steps,
+                    max_steps=args.max_steps,
+                    dry_run=args.dry_run,
+                    secure=not args.no_confirm,
+                    history=args.history,
+                    delay=args.delay,
+                    skip_unchanged=not args.resend_unchanged,
+                    frame_bytes=args.frame_bytes,
+                    frame_ms=args.frame_ms,
+                    settle_ms=args.settle_ms,
+                    settle_timeout=args.settle_timeout,
+                    history_memory=args.history_memory,
+                    spill_file=args.spill_file,
+                    max_request_kb=args.max_request_kb,
+                    stream=args.stream,
+                    cache_file=args.cache_file,
+                    cache_ttl=args.cache_ttl,
+                    cache_mb=args.cache_mb,
+                    api=api,
+                )
+                if args.warm_up:
+                    await warm
+
+        print("AI is taking control. Do not touch your computer.")
+        controller.set_grabber(grabber.auto_grabber())
+        controller.set_paste_min_chars(args.paste_min_chars)
+        if not args.fresh_shell:
+            controller.set_shell_session(shell.ShellSession())
+        try:
+            asyncio.run(run())
+        finally:
+            controller.set_grabber(None)
+            controller.set_shell_session(None)
+        return
+
     main(
         args.goal,
         steps=steps,
         max_steps=args.max_steps,
         dry_run=args.dry_run,
-        secure=True,
+        secure=not args.no_confirm,
         history=args.history,
         delay=args.delay,
+        skip_unchanged=not args.resend_unchanged,
+        delta_keyframe=args.delta_keyframe,
+        frame_bytes=args.frame_bytes,
+        frame_ms=args.frame_ms,
+        background_capture=args.background_capture,
+        settle_ms=args.settle_ms,
+        settle_timeout=args.settle_timeout,
+        history_memory=args.history_memory,
+        spill_file=args.spill_file,
+        max_request_kb=args.max_request_kb,
+        pool_size=args.pool_size,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        request_deadline=args.request_deadline,
+        hedge_requests=args.hedge,
+        hedge_url=args.hedge_url,
+        api_urls=args.api_urls,
+        balance=args.balance,
+        warm_up=args.warm_up,
+        stream=args.stream,
+        cache_file=args.cache_file,
+        cache_ttl=args.cache_ttl,
+        cache_mb=args.cache_mb,
+        persistent_shell=not args.fresh_shell,
+        paste_min_chars=args.paste_min_chars,
     )
 
 
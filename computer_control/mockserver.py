@@ -0,0 +1,470 @@
+"""A local OpenAI-compatible stand-in for the Pollinations API.
+
+``MockServer`` answers chat completion requests with scripted tool calls,
+after a configurable latency, and injects 413, 429 and 5xx failures at
+chosen rates. Requests with ``"stream": true`` get server-sent events.
+It serves tests (see the ``mock_server`` fixture) and load tests (see
+``benchmarks/load_test.py``), and runs on its own with
+``python -m computer_control.mockserver [--port P] [--latency SPEC]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# One scripted turn: optional ``content``, ``tool_calls`` given as
+# ``{"name": ..., "arguments": {...}}`` and an optional ``done`` flag.
+Turn = Dict[str, Any]
+
+# Turns served in order, wrapping around, when no script is given.
+DEFAULT_SCRIPT: List[Turn] = [
+    {
+        "content": "Moving to the search box",
+        "tool_calls": [
+            {"name": "move_mouse", "arguments": {"x": 640, "y": 80}}
+        ],
+    },
+    {"tool_calls": [{"name": "click", "arguments": {"x": 640, "y": 80}}]},
+    {
+        "tool_calls": [
+            {"name": "write_text", "arguments": {"text": "hello world"}},
+            {"name": "press_key", "arguments": {"key": "enter"}},
+        ]
+    },
+]
+
+# Statuses that ``faults`` may inject.
+FAULT_STATUSES = frozenset({413, 429, 500, 502, 503, 504})
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Return a sampler of response delays in seconds described by ``spec``.
+
+    ``spec`` is ``SECONDS`` or ``fixed:SECONDS``, ``uniform:LOW:HIGH``,
+    ``exp:MEAN`` or ``lognormal:MEDIAN:SIGMA``. Every value must be finite
+    and not negative, ``LOW`` at most ``HIGH`` and ``MEDIAN`` above zero.
+    """
+    kind, _, rest = spec.partition(":")
+    if not rest:
+        kind, rest = "fixed", kind
+    try:
+        args = [float(value) for value in rest.split(":")]
+    except ValueError:
+        raise ValueError(f"invalid latency: {spec!r}") from None
+    if not all(math.isfinite(value) and value >= 0 for value in args):
+        raise ValueError(
+            f"invalid latency: {spec!r} (values must be finite and >= 0)"
+        )
+    if kind == "fixed" and len(args) == 1:
+        return lambda rng: args[0]
+    if kind == "uniform" and len(args) == 2:
+        if args[0] > args[1]:
+            raise ValueError(f"invalid latency: {spec!r} (LOW > HIGH)")
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "exp" and len(args) == 1:
+        return lambda rng: rng.expovariate(1 / args[0]) if args[0] else 0.0
+    if kind == "lognormal" and len(args) == 2:
+        if not args[0]:
+            raise ValueError(f"invalid latency: {spec!r} (MEDIAN must be > 0)")
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1])
+    raise ValueError(f"invalid latency: {spec!r}")
+
+
+def parse_fault(spec: str) -> Dict[int, float]:
+    """Return ``{status: probability}`` for a ``STATUS=PROBABILITY`` spec."""
+    status, _, rate = spec.partition("=")
+    try:
+        code, probability = int(status), float(rate)
+    except ValueError:
+        raise ValueError(f"invalid fault: {spec!r}") from None
+    if code not in FAULT_STATUSES or not 0 <= probability <= 1:
+        raise ValueError(f"invalid fault: {spec!r}")
+    return {code: probability}
+
+
+def _tool_calls(turn: Turn, step: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"call_{step}_{n}",
+            "type": "function",
+            "function": {
+                "name": call["name"],
+                "arguments": json.dumps(call.get("arguments") or {}),
+            },
+        }
+        for n, call in enumerate(turn.get("tool_calls") or [])
+    ]
+
+
+def completion(turn: Turn, step: int) -> Dict[str, Any]:
+    """Return the chat completion answering with ``turn``."""
+    message: Dict[str, Any] = {
+        "role": "assistant",
+        "content": turn.get("content", ""),
+    }
+    calls = _tool_calls(turn, step)
+    if calls:
+        message["tool_calls"] = calls
+    data: Dict[str, Any] = {
+        "id": f"mock-{step}",
+        "object": "chat.completion",
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if calls else "stop",
+            }
+        ],
+    }
+    if turn.get("done"):
+        data["done"] = True
+    return data
+
+
+def chunks(turn: Turn, step: int) -> List[Dict[str, Any]]:
+    """Return the ``chat.completion.chunk`` events streaming ``turn``.
+
+    Each tool call's arguments are split over two events, as real servers
+    do, so clients have to reassemble them.
+    """
+
+    def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> Any:
+        choice = {"index": 0, "delta": delta, "finish_reason": finish}
+        return {
+            "id": f"mock-{step}",
+            "object": "chat.completion.chunk",
+            "choices": [choice],
+        }
+
+    events = [chunk({"role": "assistant"})]
+    if turn.get("content"):
+        events.append(chunk({"content": turn["content"]}))
+    calls = _tool_calls(turn, step)
+    for index, call in enumerate(calls):
+        args = call["function"]["arguments"]
+        half = len(args) // 2
+        head = {
+            "index": index,
+            "id": call["id"],
+            "type": "function",
+            "function": {
+                "name": call["function"]["name"],
+                "arguments": args[:half],
+            },
+        }
+        tail = {"index": index, "function": {"arguments": args[half:]}}
+        events.append(chunk({"tool_calls": [head]}))
+        events.append(chunk({"tool_calls": [tail]}))
+    events.append(chunk({}, "tool_calls" if calls else "stop"))
+    return events
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, *_: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        # connection warm-up hits the endpoint without a body
+        self._reply(200, b"{}")
+
+    def do_HEAD(self) -> None:
+        self._reply(200, b"")
+
+    def do_POST(self) -> None:
+        mock = self.server.mock
+        size = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(size)
+        status, delay = mock._admit(len(raw))
+        time.sleep(delay)
+        if status != 200:
+            after = mock.retry_after if status == 429 else None
+            self._error(status, after)
+            return
+        try:
+            request = json.loads(raw or b"{}")
+        except ValueError:
+            self._error(400)
+            return
+        step, turn = mock._next_turn()
+        if request.get("stream"):
+            mock._count("streamed")
+            self._stream(chunks(turn, step))
+        else:
+            self._reply(200, json.dumps(completion(turn, step)).encode())
+
+    def _reply(
+        self,
+        status: int,
+        data: bytes,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+        self.server.mock._count("bytes_sent", len(data))
+
+    def _error(self, status: int, after: Optional[float] = None) -> None:
+        text = {
+            400: "invalid JSON body",
+            413: "request entity too large",
+            429: "rate limit exceeded",
+        }.get(status, "injected server error")
+        headers = {"Retry-After": f"{after:g}"} if after is not None else {}
+        data = json.dumps({"error": {"message": text, "code": status}})
+        self._reply(status, data.encode(), headers)
+
+    def _stream(self, events: List[Dict[str, Any]]) -> None:
+        mock = self.server.mock
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        gzip = mock.gzip and "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzip:
+            self.send_header("Content-Encoding", "gzip")
+            packer = zlib.compressobj(wbits=31)
+        self.end_headers()
+        lines = [f"data: {json.dumps(event)}\n\n" for event in events]
+        lines.append("data: [DONE]\n\n")
+        for n, line in enumerate(lines, 1):
+            data = line.encode()
+            if gzip:
+                # each event is flushed so it arrives on its own
+                mode = zlib.Z_FINISH if n == len(lines) else zlib.Z_SYNC_FLUSH
+                data = packer.compress(data) + packer.flush(mode)
+            self.wfile.write(data)
+            self.wfile.flush()
+            mock._count("bytes_sent", len(data))
+            if mock.chunk_delay > 0:
+                time.sleep(mock.chunk_delay)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    mock: "MockServer"
+
+
+class MockServer:
+    """Serve scripted chat completions on a local port.
+
+    The turns of ``script`` (by default ``DEFAULT_SCRIPT``) are answered
+    in order across all requests, wrapping around. Every response waits a
+    delay drawn from the ``latency`` spec (see ``parse_latency``) first.
+    ``faults`` maps statuses to the probability of answering a request with
+    them instead; 429 responses carry ``Retry-After: retry_after``. Bodies
+    over ``max_body`` bytes are refused with 413 when it is positive.
+    Streamed events are spaced by ``chunk_delay`` seconds and, with
+    ``gzip``, compressed for clients that accept it, as some proxies do.
+
+    All settings may be changed while the server runs. ``stats`` counts
+    requests, injected failures and bytes in both directions.
+    """
+
+    def __init__(
+        self,
+        script: Optional[Sequence[Turn]] = None,
+        latency: str = "0",
+        faults: Optional[Dict[int, float]] = None,
+        retry_after: float = 1.0,
+        max_body: int = 0,
+        chunk_delay: float = 0.0,
+        gzip: bool = False,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.script = list(script or DEFAULT_SCRIPT)
+        self.latency = latency
+        self.faults = dict(faults or {})
+        self.retry_after = retry_after
+        self.max_body = max_body
+        self.chunk_delay = chunk_delay
+        self.gzip = gzip
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self._steps = itertools.count()
+        self._stats: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._sampler = (latency, parse_latency(latency))
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/openai"
+
+    def start(self) -> "MockServer":
+        """Start serving on a background thread and return ``self``."""
+        if self._server is not None:
+            return self
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.mock = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mockserver", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the port."""
+        server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *_exc: Any) -> None:
+        self.stop()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + amount
+
+    def _admit(self, size: int) -> Tuple[int, float]:
+        """Return the status to answer a ``size`` byte body and the delay."""
+        with self._lock:
+            if self._sampler[0] != self.latency:
+                self._sampler = (self.latency, parse_latency(self.latency))
+            sample = self._sampler[1]
+            stats = self._stats
+            stats["requests"] = stats.get("requests", 0) + 1
+            stats["bytes_received"] = stats.get("bytes_received", 0) + size
+            delay = max(0.0, sample(self.rng))
+            status = 200
+            if self.max_body > 0 and size > self.max_body:
+                status = 413
+            else:
+                roll = self.rng.random()
+                for code, probability in sorted(self.faults.items()):
+                    if roll < probability:
+                        status = code
+                        break
+                    roll -= probability
+            if status != 200:
+                stats[str(status)] = stats.get(str(status), 0) + 1
+        return status, delay
+
+    def _next_turn(self) -> Tuple[int, Turn]:
+        step = next(self._steps)
+        return step, self.script[step % len(self.script)]
+
+    def stats(self) -> Dict[str, int]:
+        """Return request, failure and byte counts.
+
+        Injected failures are counted under their status as a string.
+        """
+        with self._lock:
+            counts = dict(self._stats)
+        for key in ("requests", "streamed", "bytes_received", "bytes_sent"):
+            counts.setdefault(key, 0)
+        return counts
+
+    def describe(self) -> str:
+        """Return a one-line summary of ``stats``."""
+        st = self.stats()
+        failed = sum(v for k, v in st.items() if k.isdigit())
+        return (
+            f"{st['requests']} requests ({st['streamed']} streamed, "
+            f"{failed} failed), {st['bytes_received'] / 1024:.1f} KiB in, "
+            f"{st['bytes_sent'] / 1024:.1f} KiB out"
+        )
+
+
+def load_script(path: str) -> List[Turn]:
+    """Read a JSON list of turns from ``path``."""
+    with open(path, "r", encoding="utf-8") as fh:
+        script = json.load(fh)
+    if not isinstance(script, list) or not script:
+        raise ValueError(f"{path}: expected a non-empty list of turns")
+    return script
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--script", help="JSON file with a list of turns to serve"
+    )
+    parser.add_argument(
+        "--latency",
+        default="0",
+        help="delay per response: SECONDS, uniform:LOW:HIGH, exp:MEAN or "
+        "lognormal:MEDIAN:SIGMA",
+    )
+    parser.add_argument(
+        "--fault",
+        action="append",
+        default=[],
+        metavar="STATUS=P",
+        help="answer with STATUS (413, 429 or 5xx) at probability P; "
+        "repeat for several",
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument(
+        "--max-body", type=int, default=0, help="refuse larger bodies (413)"
+    )
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument(
+        "--gzip", action="store_true", help="gzip streamed responses"
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    faults: Dict[int, float] = {}
+    try:
+        parse_latency(args.latency)
+        for spec in args.fault:
+            faults.update(parse_fault(spec))
+    except ValueError as exc:
+        parser.error(str(exc))
+    server = MockServer(
+        script=load_script(args.script) if args.script else None,
+        latency=args.latency,
+        faults=faults,
+        retry_after=args.retry_after,
+        max_body=args.max_body,
+        chunk_delay=args.chunk_delay,
+        gzip=args.gzip,
+        host=args.host,
+        port=args.port,
+        seed=args.seed,
+    )
+    server.start()
+    print(f"Serving {server.url}; point POLLINATIONS_API at it")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    print(f"Mock server: {server.describe()}")
+
+
+if __name__ == "__main__":
+    main()
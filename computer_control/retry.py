@@ -0,0 +1,238 @@
+"""Retry decisions, backoff and circuit breaking for API requests."""
+
+from __future__ import annotations
+
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+# Statuses worth another attempt: timeouts, rate limits and server errors.
+# Any other 4xx means the request itself is wrong and is not repeated.
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class EndpointUnavailable(RuntimeError):
+    """The endpoint could not be reached or failed with a server error."""
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the seconds a ``Retry-After`` header asks to wait, or ``None``.
+
+    Both forms of the header are accepted: a number of seconds and an HTTP
+    date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Fail fast while an endpoint keeps failing.
+
+    After ``threshold`` consecutive failures the breaker opens and requests
+    are refused for ``cooldown`` seconds. Then a single trial request is let
+    through: success closes the breaker, failure opens it again. A trial
+    whose outcome is never recorded, because it ended in some other
+    exception, gives way to a new trial after another ``cooldown``.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # start of the trial request in progress
+        self._trial: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return ``True`` if a request may be sent now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if self.remaining() > 0 or (
+                self._trial is not None and now - self._trial < self.cooldown
+            ):
+                return False
+            self._trial = now
+            return True
+
+    def remaining(self) -> float:
+        """Return the seconds until the open breaker admits a trial."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def record(self, ok: bool) -> None:
+        """Record the outcome of a request."""
+        with self._lock:
+            self._trial = None
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.threshold > 0 and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+
+class RetryPolicy:
+    """When and how long to wait before sending a failed request again.
+
+    Waits follow decorrelated jitter: each one is drawn between ``base``
+    and three times the previous wait, capped at ``cap`` seconds, so
+    clients that failed together do not retry together. A ``Retry-After``
+    header replaces the drawn wait, up to ``max_retry_after`` seconds. All
+    attempts for one request, waits included, end within ``deadline``
+    seconds. Each endpoint URL gets a ``CircuitBreaker``.
+
+    Subclass and override ``retryable`` or ``backoff`` to change the
+    decisions.
+    """
+
+    def __init__(
+        self,
+        base: float = 0.5,
+        cap: float = 20.0,
+        deadline: float = 120.0,
+        max_retry_after: float = 60.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+        self.max_retry_after = max_retry_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.rng = rng or random.Random()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def retryable(self, status: Optional[int]) -> bool:
+        """Return ``True`` if a failure with ``status`` may be retried.
+
+        ``None`` stands for a network error.
+        """
+        return status is None or status in RETRY_STATUSES
+
+    def backoff(self, previous: float) -> float:
+        """Return the wait following a wait of ``previous`` seconds."""
+        high = max(self.base, previous * 3)
+        return min(self.cap, self.rng.uniform(self.base, high))
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Return the circuit breaker of ``url``."""
+        with self._lock:
+            if url not in self._breakers:
+                self._breakers[url] = CircuitBreaker(
+                    self.breaker_threshold, self.breaker_cooldown
+                )
+            return self._breakers[url]
+
+    def admit(self, url: str) -> CircuitBreaker:
+        """Return the breaker of ``url`` if it lets a request through.
+
+        Raises ``EndpointUnavailable`` while the endpoint's breaker is open.
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise EndpointUnavailable(
+                "Pollinations API is unavailable; not retrying for "
+                f"{breaker.remaining():.0f}s"
+            )
+        return breaker
+
+    def start(self, url: str, attempts: int) -> "RetryState":
+        """Begin a request to ``url`` of at most ``attempts`` attempts.
+
+        Raises ``EndpointUnavailable`` while the endpoint's breaker is open.
+        """
+        return RetryState(self, self.admit(url), attempts)
+
+
+class RetryState:
+    """Progress of one request through a ``RetryPolicy``."""
+
+    def __init__(
+        self, policy: RetryPolicy, breaker: CircuitBreaker, attempts: int
+    ) -> None:
+        self.policy = policy
+        self.breaker = breaker
+        self.attempts = attempts
+        self.attempt = 1
+        self.started = time.monotonic()
+        self.wait = 0.0
+
+    def remaining(self) -> float:
+        """Return the seconds left before the deadline."""
+        return self.policy.deadline - (time.monotonic() - self.started)
+
+    def timeout(self, timeout: Any) -> Any:
+        """Return the ``requests`` timeout ``timeout`` cut to the deadline."""
+        left = max(0.001, self.remaining())
+        if isinstance(timeout, tuple):
+            return tuple(min(t, left) for t in timeout)
+        return min(timeout, left)
+
+    def succeeded(self) -> None:
+        self.breaker.record(True)
+
+    def switch(self, url: str) -> None:
+        """Send the following attempts to ``url`` instead.
+
+        The attempts and the backoff start over for the new endpoint; the
+        deadline does not. Raises ``EndpointUnavailable`` while its breaker
+        is open.
+        """
+        self.breaker = self.policy.admit(url)
+        self.attempt = 1
+        self.wait = 0.0
+
+    def failed(
+        self, status: Optional[int] = None, after: Optional[str] = None
+    ) -> Optional[float]:
+        """Record a failed attempt and return how long to wait, or ``None``.
+
+        ``None`` means give up: the status is not retryable, the attempts
+        or the deadline are used up, or the breaker has opened. ``after``
+        is the response's ``Retry-After`` header.
+        """
+        if status is None or status >= 500:
+            self.breaker.record(False)
+        else:
+            # the endpoint answered; it is up
+            self.breaker.record(True)
+        if not self.policy.retryable(status):
+            return None
+        if self.attempt >= self.attempts or self.breaker.is_open:
+            return None
+        wait = retry_after(after)
+        if wait is None:
+            wait = self.policy.backoff(self.wait)
+        elif wait > self.policy.max_retry_after:
+            return None
+        if wait >= self.remaining():
+            return None
+        self.wait = wait
+        self.attempt += 1
+        return wait
@@ -0,0 +1,240 @@
+"""Run independent shell and file tool calls side by side.
+
+GUI actions share one screen, keyboard and mouse, so they always run one
+after another. Shell commands and file operations mostly do not: a turn
+that starts several setup commands can run them at once and take as long
+as the slowest. ``plan`` splits a batch into runs of such calls, and
+``run`` executes a run on a thread pool, starting each call only after the
+earlier calls of the run that touch the same paths have finished.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import os
+import shlex
+import threading
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Tools that neither need the GUI nor care about the order of the others,
+# with the arguments naming the files they touch. ``open_url`` is not one:
+# it brings up the browser, which later GUI actions rely on.
+CONCURRENT: Dict[str, FrozenSet[str]] = {
+    "run_shell": frozenset(),
+    "create_file": frozenset({"path"}),
+    "delete_file": frozenset({"path"}),
+}
+
+# Commands that change the state of a persistent shell session, so later
+# commands depend on them.
+STATEFUL = frozenset(
+    {
+        ".",
+        "activate",
+        "alias",
+        "cd",
+        "conda",
+        "deactivate",
+        "eval",
+        "export",
+        "popd",
+        "pushd",
+        "set",
+        "source",
+        "umask",
+        "unalias",
+        "unset",
+    }
+)
+
+# Shell operators after which a new program starts.
+SEPARATORS = frozenset({";", "&", "&&", "|", "||", "(", ")", ";;"})
+
+# Calls running at the same time.
+MAX_WORKERS = 4
+
+_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class Resources:
+    """The paths and programs one tool call may touch.
+
+    ``everything`` is set when they cannot be told, for example for a
+    shell command that does not parse.
+    """
+
+    __slots__ = ("paths", "programs", "everything")
+
+    def __init__(self) -> None:
+        self.paths: List[str] = []
+        self.programs: List[str] = []
+        self.everything = False
+
+    def conflicts(self, other: "Resources") -> bool:
+        """Return ``True`` if the two calls must not overlap."""
+        if self.everything or other.everything:
+            return True
+        if set(self.programs) & set(other.programs):
+            return True
+        return any(
+            _nested(mine, theirs)
+            for mine in self.paths
+            for theirs in other.paths
+        )
+
+
+def _nested(a: str, b: str) -> bool:
+    """Return ``True`` if one of the paths is or contains the other."""
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+
+def _path(value: str) -> str:
+    return os.path.normcase(os.path.abspath(os.path.expanduser(value)))
+
+
+def _shell_resources(command: Any, files: List[str]) -> Resources:
+    """Guess what the shell ``command`` touches.
+
+    Its program names count, so two ``git`` or ``make`` commands never
+    overlap, and so does every argument that looks like a path, exists,
+    or contains one of the batch's ``files``. Commands changing the state
+    of a persistent shell, such as ``cd`` or ``export``, touch everything.
+    """
+    found = Resources()
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        words = list(lexer)
+    except (AttributeError, TypeError, ValueError):
+        found.everything = True
+        return found
+    program = assigned = True
+    for word in words:
+        if word in SEPARATORS:
+            # a bare ``VAR=value`` sets a shell variable
+            found.everything |= assigned and not program
+            program = True
+            continue
+        if program:
+            # skip ``VAR=value`` assignments in front of the program
+            program = assigned = "=" in word
+            if not program:
+                found.programs.append(os.path.basename(word))
+            continue
+        if word.startswith("-") or not word.strip("<>&"):
+            continue
+        path = _path(word)
+        if (
+            os.sep in word
+            or os.path.exists(path)
+            or any(_nested(path, f) for f in files)
+        ):
+            found.paths.append(path)
+    if program and assigned and words:
+        found.everything = True
+    if STATEFUL & set(found.programs):
+        found.everything = True
+    return found
+
+
+def _params(call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    func = call.get("function") or {}
+    try:
+        params = json.loads(func.get("arguments") or "{}")
+    except (TypeError, ValueError):
+        return None
+    return params if isinstance(params, dict) else None
+
+
+def resources(
+    call: Dict[str, Any], files: Optional[List[str]] = None
+) -> Optional[Resources]:
+    """Return what ``call`` touches, or ``None`` if it must run alone.
+
+    ``files`` are the paths the file operations of the batch name.
+    """
+    name = (call.get("function") or {}).get("name")
+    keys = CONCURRENT.get(name or "")
+    params = _params(call)
+    if keys is None or params is None:
+        return None
+    if name == "run_shell":
+        return _shell_resources(params.get("command"), files or [])
+    found = Resources()
+    for key in keys:
+        value = params.get(key)
+        if not isinstance(value, str):
+            return None
+        found.paths.append(_path(value))
+    return found
+
+
+def plan(tool_calls: List[Dict[str, Any]]) -> List[List[int]]:
+    """Split ``tool_calls`` into runs of indices executed in order.
+
+    Adjacent calls that may run concurrently share a run; every other call
+    is a run of its own.
+    """
+    runs: List[List[int]] = []
+    alone = True
+    for index, call in enumerate(tool_calls):
+        solo = resources(call) is None
+        if solo or alone:
+            runs.append([index])
+        else:
+            runs[-1].append(index)
+        alone = solo
+    return runs
+
+
+def _pool_instance() -> concurrent.futures.ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(
+                MAX_WORKERS, thread_name_prefix="tool"
+            )
+        return _pool
+
+
+def _ordered(a: Optional[Resources], b: Optional[Resources]) -> bool:
+    return a is None or b is None or a.conflicts(b)
+
+
+def _after(
+    earlier: List["concurrent.futures.Future[Any]"],
+    func: Callable[[Dict[str, Any]], T],
+    call: Dict[str, Any],
+) -> T:
+    concurrent.futures.wait(earlier)
+    return func(call)
+
+
+def run(
+    tool_calls: List[Dict[str, Any]],
+    func: Callable[[Dict[str, Any]], T],
+) -> List[T]:
+    """Return ``func(call)`` for each of ``tool_calls``, run concurrently.
+
+    A call waits for every earlier call whose resources it conflicts with,
+    so calls on the same path keep their order. The results keep the order
+    of ``tool_calls``.
+    """
+    if len(tool_calls) < 2:
+        return [func(call) for call in tool_calls]
+    named = [resources(call) for call in tool_calls]
+    files = [p for r in named if r is not None for p in r.paths]
+    found = [resources(call, files) for call in tool_calls]
+    pool = _pool_instance()
+    futures: List["concurrent.futures.Future[T]"] = []
+    for index, call in enumerate(tool_calls):
+        mine = found[index]
+        earlier = [
+            futures[n] for n in range(index) if _ordered(mine, found[n])
+        ]
+        futures.append(pool.submit(_after, earlier, func, call))
+    return [future.result() for future in futures]
@@ -0,0 +1,514 @@
+"""Run shell commands with captured, bounded output and a time limit.
+
+``run`` reads a command's stdout and stderr as they are written, keeping
+only the first and last few kilobytes of each, and stops the command's
+whole process group when it runs too long or writes too much. Its result
+summarises the exit code and the output for the model, so a command's
+output no longer needs a screenshot to be read.
+"""
+
+from __future__ import annotations
+
+import os
+import selectors
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from queue import Empty, Queue
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple
+
+# Seconds a command may run before it is stopped.
+TIMEOUT = 120.0
+# Upper bound for the timeout a tool call may ask for.
+MAX_TIMEOUT = 3600.0
+# Bytes of output, both streams together, after which it is stopped.
+MAX_OUTPUT = 8 * 1024 * 1024
+# Bytes kept from the start and from the end of each stream.
+HEAD = 2048
+TAIL = 4096
+# Seconds between asking a stopped command to exit and killing it.
+GRACE = 2.0
+# Seconds to keep reading after the shell exits; background jobs it
+# started may hold the pipes open much longer.
+DRAIN = 0.2
+# Longest wait between checks of the deadline and the process.
+POLL = 0.05
+
+
+class OutputBuffer:
+    """The first ``head`` and the last ``tail`` bytes of a stream.
+
+    Everything in between is counted but dropped, so memory stays bounded
+    however much a command prints.
+    """
+
+    def __init__(self, head: int = HEAD, tail: int = TAIL) -> None:
+        self.head_size = head
+        self.tail_size = tail
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_size - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_size:
+                del self.tail[: len(self.tail) - self.tail_size]
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def text(self) -> str:
+        """Return the kept output, marking where bytes were dropped."""
+        head = self.head.decode("utf-8", "replace")
+        if not self.omitted:
+            return head + self.tail.decode("utf-8", "replace")
+        # cut the tail at a line start when one is near
+        tail = self.tail.decode("utf-8", "replace")
+        newline = tail.find("\n")
+        if 0 <= newline < 200:
+            tail = tail[newline + 1 :]
+        return f"{head}\n[... {self.omitted} bytes omitted ...]\n{tail}"
+
+
+class ShellResult:
+    """Exit code, output and limits hit by one command."""
+
+    def __init__(self, command: str) -> None:
+        self.command = command
+        self.exit_code: Optional[int] = None
+        self.stdout = OutputBuffer()
+        self.stderr = OutputBuffer()
+        self.seconds = 0.0
+        self.timeout = 0.0
+        self.timed_out = False
+        self.truncated = False
+
+    def summary(self) -> str:
+        """Return the exit status and the kept output as one text."""
+        if self.timed_out:
+            status = f"timed out after {self.timeout:g}s and was stopped"
+        elif self.truncated:
+            status = (
+                f"stopped after {self.stdout.total + self.stderr.total} "
+                "bytes of output"
+            )
+        else:
+            status = f"exit code {self.exit_code}"
+        lines = [f"{status} ({self.seconds:.1f}s)"]
+        for name, buf in (("stdout", self.stdout), ("stderr", self.stderr)):
+            if buf.total:
+                lines.append(f"{name}:")
+                lines.append(buf.text().rstrip("\n"))
+        if len(lines) == 1:
+            lines.append("(no output)")
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.summary()
+
+
+def _popen_group() -> Dict[str, Any]:
+    """Return ``Popen`` arguments starting a new process group."""
+    if os.name == "nt":  # pragma: no cover - Windows
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def stop(proc: "subprocess.Popen[bytes]", grace: float = GRACE) -> None:
+    """Stop ``proc`` and every process it started.
+
+    The group gets ``SIGTERM`` and, if still running after ``grace``
+    seconds, ``SIGKILL``.
+    """
+    if os.name == "nt":  # pragma: no cover - Windows
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+            capture_output=True,
+        )
+        proc.kill()
+        return
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+        try:
+            proc.wait(grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def _echo(stream: IO[str], data: bytes) -> None:
+    try:
+        stream.write(data.decode("utf-8", "replace"))
+        stream.flush()
+    except (OSError, ValueError):  # pragma: no cover - closed console
+        pass
+
+
+class _Limits:
+    """Deadline and output budget of one command."""
+
+    def __init__(
+        self, result: ShellResult, timeout: float, max_output: int
+    ) -> None:
+        self.result = result
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout if timeout > 0 else None
+        self.max_output = max_output
+        self.exited_at: Optional[float] = None
+
+    def wait(self, proc: "subprocess.Popen[bytes]") -> Optional[float]:
+        """Return how long to wait for output, or ``None`` to stop reading.
+
+        Marks the result as timed out when the deadline passed.
+        """
+        now = time.monotonic()
+        if self.exited_at is None and proc.poll() is not None:
+            self.exited_at = now
+        if self.exited_at is not None and now - self.exited_at >= DRAIN:
+            return None
+        if self.deadline is not None and now >= self.deadline:
+            self.result.timed_out = True
+            return None
+        return POLL
+
+    def add(
+        self, buf: OutputBuffer, console: IO[str], data: bytes, echo: bool
+    ) -> bool:
+        """Store ``data``; return ``False`` once there was too much."""
+        buf.write(data)
+        if echo and data:
+            _echo(console, data)
+        written = self.result.stdout.total + self.result.stderr.total
+        if self.max_output > 0 and written > self.max_output:
+            self.result.truncated = True
+            return False
+        return True
+
+
+# Called with each pipe's file descriptor and the bytes read from it;
+# returns ``False`` to stop reading.
+_Feed = Callable[[int, bytes], bool]
+
+
+def _pump_select(
+    proc: "subprocess.Popen[bytes]",
+    pipes: List[IO[bytes]],
+    limits: _Limits,
+    feed: _Feed,
+) -> None:
+    """Read ``pipes`` without blocking until ``feed`` or ``limits`` stop.
+
+    Reading also ends once every pipe is closed.
+    """
+    with selectors.DefaultSelector() as sel:
+        for pipe in pipes:
+            os.set_blocking(pipe.fileno(), False)
+            sel.register(pipe, selectors.EVENT_READ)
+        while sel.get_map():
+            wait = limits.wait(proc)
+            if wait is None:
+                return
+            for key, _ in sel.select(wait):
+                try:
+                    data = os.read(key.fd, 65536)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    sel.unregister(key.fileobj)
+                elif not feed(key.fd, data):
+                    return
+
+
+def _pump_threads(
+    proc: "subprocess.Popen[bytes]",
+    pipes: List[IO[bytes]],
+    limits: _Limits,
+    feed: _Feed,
+) -> None:  # pragma: no cover - Windows
+    """``_pump_select`` for platforms that cannot select on pipes."""
+    chunks: "Queue[Tuple[int, bytes]]" = Queue()
+
+    def reader(pipe: IO[bytes]) -> None:
+        read = getattr(pipe, "read1", pipe.read)
+        while data := read(65536):
+            chunks.put((pipe.fileno(), data))
+        chunks.put((pipe.fileno(), b""))
+
+    for pipe in pipes:
+        threading.Thread(target=reader, args=(pipe,), daemon=True).start()
+    open_pipes = len(pipes)
+    while open_pipes:
+        wait = limits.wait(proc)
+        if wait is None:
+            return
+        try:
+            key, data = chunks.get(timeout=wait)
+        except Empty:
+            continue
+        if not data:
+            open_pipes -= 1
+        elif not feed(key, data):
+            return
+
+
+_pump = _pump_threads if os.name == "nt" else _pump_select
+
+
+def run(
+    command: str,
+    timeout: float = TIMEOUT,
+    max_output: int = MAX_OUTPUT,
+    echo: bool = False,
+    cwd: Optional[str] = None,
+) -> ShellResult:
+    """Run ``command`` in a new shell and return its ``ShellResult``.
+
+    The command is stopped, with every process it started, after
+    ``timeout`` seconds or once it has written more than ``max_output``
+    bytes; zero disables either limit. With ``echo`` its output is also
+    copied to this process' stdout and stderr as it arrives. Background
+    jobs the command starts keep running after it exits.
+    """
+    result = ShellResult(command)
+    result.timeout = timeout
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **_popen_group(),
+    )
+    assert proc.stdout is not None and proc.stderr is not None
+    pipes = [proc.stdout, proc.stderr]
+    sinks = {
+        proc.stdout.fileno(): (result.stdout, sys.stdout),
+        proc.stderr.fileno(): (result.stderr, sys.stderr),
+    }
+    limits = _Limits(result, timeout, max_output)
+
+    def feed(fd: int, data: bytes) -> bool:
+        return limits.add(*sinks[fd], data, echo)
+
+    try:
+        _pump(proc, pipes, limits, feed)
+        if result.timed_out or result.truncated:
+            stop(proc)
+        elif proc.poll() is None:
+            # the pipes closed but the shell is still running
+            left = None
+            if limits.deadline is not None:
+                left = max(0.0, limits.deadline - time.monotonic())
+            try:
+                proc.wait(left)
+            except subprocess.TimeoutExpired:
+                result.timed_out = True
+                stop(proc)
+    finally:
+        for pipe in pipes:
+            pipe.close()
+        result.exit_code = proc.wait()
+        result.seconds = time.monotonic() - limits.started
+    return result
+
+
+class _Marked:
+    """Output of one pipe up to the line that marks the command's end."""
+
+    def __init__(self, marker: bytes) -> None:
+        # the marker always follows a newline the session printed itself
+        self.marker = b"\n" + marker
+        self.pending = bytearray()
+        self.line: Optional[bytes] = None
+
+    def feed(self, data: bytes) -> bytes:
+        """Add ``data`` and return what is certainly command output."""
+        if self.line is not None:
+            return b""
+        self.pending += data
+        at = self.pending.find(self.marker)
+        if at >= 0:
+            end = self.pending.find(b"\n", at + len(self.marker))
+            out = bytes(self.pending[:at])
+            if end >= 0:
+                self.line = bytes(self.pending[at + len(self.marker) : end])
+                self.pending.clear()
+            else:
+                del self.pending[:at]
+            return out
+        # hold back what may be the start of a split marker
+        cut = max(0, len(self.pending) - len(self.marker) + 1)
+        out = bytes(self.pending[:cut])
+        del self.pending[:cut]
+        return out
+
+    def rest(self) -> bytes:
+        """Return the held back output of a command that never finished."""
+        out = bytes(self.pending)
+        self.pending.clear()
+        return out
+
+
+class ShellSession:
+    """One long-lived shell running an agent session's commands.
+
+    Commands are written to the shell's stdin, so ``cd``, exported
+    variables and activated environments carry over from one command to
+    the next, and no shell is started per command. After each command the
+    shell prints a marker line with the exit code and working directory on
+    both pipes; the output before it is the command's.
+
+    A command that hits its limits is stopped together with the shell, and
+    a shell that exits is replaced by a new one in the last known working
+    directory when the next command arrives. Exported variables do not
+    survive that.
+
+    Commands run one at a time; one arriving while the shell is busy waits
+    for it, so every command sees the session's environment. Where no
+    POSIX shell is available every command gets a new shell.
+    """
+
+    def __init__(
+        self, shell: Optional[str] = None, cwd: Optional[str] = None
+    ) -> None:
+        self.shell = shell or "/bin/sh"
+        self.cwd = cwd or os.getcwd()
+        self.proc: Optional["subprocess.Popen[bytes]"] = None
+        self.commands = 0
+        self.restarts = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    @property
+    def supported(self) -> bool:
+        return os.name != "nt"
+
+    def _ensure(self) -> "subprocess.Popen[bytes]":
+        if self.proc is not None and self.proc.poll() is None:
+            return self.proc
+        if self.proc is not None:
+            self._close()
+        if self._started:
+            self.restarts += 1
+        self._started = True
+        cwd = self.cwd if os.path.isdir(self.cwd) else None
+        self.proc = subprocess.Popen(
+            [self.shell],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **_popen_group(),
+        )
+        return self.proc
+
+    def _close(self) -> None:
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            stop(proc)
+        for pipe in (proc.stdin, proc.stdout, proc.stderr):
+            if pipe is not None:
+                pipe.close()
+        proc.wait()
+
+    def run(
+        self,
+        command: str,
+        timeout: float = TIMEOUT,
+        max_output: int = MAX_OUTPUT,
+        echo: bool = False,
+    ) -> ShellResult:
+        """Run ``command`` in the session; see ``run`` for the limits."""
+        if not self.supported:
+            return run(command, timeout, max_output, echo, cwd=self.cwd)
+        with self._lock:
+            return self._run(command, timeout, max_output, echo)
+
+    def _send(self, script: bytes) -> "subprocess.Popen[bytes]":
+        for attempt in range(2):
+            proc = self._ensure()
+            assert proc.stdin is not None
+            try:
+                proc.stdin.write(script)
+                proc.stdin.flush()
+                return proc
+            except (BrokenPipeError, OSError):
+                if attempt:
+                    raise
+                self._close()
+        raise AssertionError("unreachable")
+
+    def _run(
+        self, command: str, timeout: float, max_output: int, echo: bool
+    ) -> ShellResult:
+        result = ShellResult(command)
+        result.timeout = timeout
+        token = f"__cc_done_{uuid.uuid4().hex}"
+        marker = token.encode()
+        script = (
+            f"eval {shlex.quote(command)} </dev/null\n"
+            "__cc_status=$?\n"
+            f"printf '\\n{token} %d %s\\n' \"$__cc_status\" \"$PWD\"\n"
+            f"printf '\\n{token}\\n' >&2\n"
+        ).encode()
+        proc = self._send(script)
+        self.commands += 1
+        assert proc.stdout is not None and proc.stderr is not None
+        streams = {
+            proc.stdout.fileno(): (_Marked(marker), result.stdout, sys.stdout),
+            proc.stderr.fileno(): (_Marked(marker), result.stderr, sys.stderr),
+        }
+        limits = _Limits(result, timeout, max_output)
+
+        def feed(fd: int, data: bytes) -> bool:
+            marked, buf, console = streams[fd]
+            if not limits.add(buf, console, marked.feed(data), echo):
+                return False
+            return any(m.line is None for m, _, _ in streams.values())
+
+        _pump(proc, [proc.stdout, proc.stderr], limits, feed)
+        status = streams[proc.stdout.fileno()][0].line
+        finished = all(m.line is not None for m, _, _ in streams.values())
+        if finished and status is not None:
+            fields = status.decode("utf-8", "replace").strip()
+            code, _, cwd = fields.partition(" ")
+            result.exit_code = int(code)
+            self.cwd = cwd or self.cwd
+        else:
+            for marked, buf, console in streams.values():
+                limits.add(buf, console, marked.rest(), echo)
+            # stopped for its limits, or the command ended the shell
+            if proc is self.proc:
+                self._close()
+            result.exit_code = proc.returncode
+        result.seconds = time.monotonic() - limits.started
+        return result
+
+    def close(self) -> None:
+        """Stop the shell and whatever it still runs."""
+        with self._lock:
+            self._close()
+
+    def describe(self) -> str:
+        """Return a one-line summary of the session."""
+        return (
+            f"{self.commands} commands in one shell, "
+            f"{self.restarts} restarts, cwd {self.cwd}"
+        )
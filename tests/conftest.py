@@ -0,0 +1,20 @@
+import os
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import mockserver  # noqa: E402
+
+
+@pytest.fixture
+def mock_server():
+    """A running ``mockserver.MockServer``; use its ``url`` as endpoint."""
+    with mockserver.MockServer(seed=0) as srv:
+        yield srv
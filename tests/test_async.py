@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+pytest.importorskip("aiohttp")
+
+from computer_control import client  # noqa: E402
+from computer_control import controller  # noqa: E402
+from computer_control.main import main_async  # noqa: E402
+
+
+CALL = {
+    "id": "1",
+    "type": "function",
+    "function": {"name": "press_key", "arguments": '{"key": "a"}'},
+}
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        self.server.peers.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        threading.Event().wait(self.server.pause)
+        if self.server.failures:
+            self.server.failures -= 1
+            self.send_response(500)
+            self.send_header("Content-Length", "4")
+            self.end_headers()
+            self.wfile.write(b"oops")
+            return
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            part = {**CALL, "index": 0}
+            chunk = {"choices": [{"delta": {"tool_calls": [part]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            self.server.early = self.server.dispatched.wait(2)
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        data = json.dumps({"choices": [{"message": {"content": "ok"}}]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data.encode())
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    srv.peers, srv.pause, srv.failures = set(), 0.0, 0
+    srv.dispatched, srv.early = threading.Event(), False
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _url(srv):
+    return f"http://127.0.0.1:{srv.server_address[1]}/openai"
+
+
+def test_async_client_reuses_connection_and_retries(server, monkeypatch):
+    server.failures = 1
+
+    async def no_sleep(_):
+        pass
+
+    monkeypatch.setattr(client.asyncio, "sleep", no_sleep)
+
+    async def run():
+        async with client.AsyncPollinationsClient(_url(server)) as api:
+            return [await api.query([]) for _ in range(3)]
+
+    replies = asyncio.run(run())
+    assert [r["choices"][0]["message"]["content"] for r in replies] == [
+        "ok"
+    ] * 3
+    assert len(server.peers) == 1
+
+
+def test_async_client_streams_calls_early(server):
+    async def run():
+        seen = []
+
+        def on_call(call):
+            seen.append(call)
+            server.dispatched.set()
+
+        async with client.AsyncPollinationsClient(_url(server)) as api:
+            data = await api.query([], on_tool_call=on_call)
+        return seen, data
+
+    seen, data = asyncio.run(run())
+    assert server.early
+    assert seen == data["choices"][0]["message"]["tool_calls"]
+    assert seen[0]["function"]["name"] == "press_key"
+
+
+def test_async_query_can_be_cancelled(server):
+    server.pause = 2.0
+
+    async def run():
+        async with client.AsyncPollinationsClient(_url(server)) as api:
+            task = asyncio.ensure_future(api.query([]))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    start = time.monotonic()
+    asyncio.run(run())
+    assert time.monotonic() - start < 1.5
+
+
+class FakeAPI:
+    def __init__(self, load):
+        self.load = load
+        self.calls = 0
+
+    async def query(self, messages, on_tool_call=None):
+        self.calls += 1
+        self.load["now"] += 1
+        self.load["peak"] = max(self.load["peak"], self.load["now"])
+        await asyncio.sleep(0.05)
+        self.load["now"] -= 1
+        if self.calls == 1:
+            if on_tool_call is not None:
+                on_tool_call(CALL)
+            return {"choices": [{"message": {"tool_calls": [CALL]}}]}
+        return {"choices": [{"message": {"content": "done", "done": True}}]}
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_main_async_runs_sessions_concurrently(monkeypatch, stream):
+    load = {"now": 0, "peak": 0}
+    monkeypatch.setattr(
+        controller, "grab_screen", lambda: Image.new("RGB", (8, 8))
+    )
+    apis = [FakeAPI(load), FakeAPI(load)]
+
+    async def run():
+        await asyncio.gather(
+            *(
+                main_async(
+                    "hi",
+                    steps=3,
+                    dry_run=True,
+                    secure=False,
+                    stream=stream,
+                    api=api,
+                )
+                for api in apis
+            )
+        )
+
+    asyncio.run(run())
+    assert [api.calls for api in apis] == [2, 2]
+    # both sessions were waiting on the API at the same time
+    assert load["peak"] == 2
@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import balancer  # noqa: E402
+from computer_control import client  # noqa: E402
+from computer_control import retry  # noqa: E402
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.count += 1
+        status = self.server.status
+        data = json.dumps({"choices": [{"message": {"content": "ok"}}]})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data.encode())
+
+
+@pytest.fixture
+def servers():
+    started = []
+    for _ in range(3):
+        srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+        srv.count, srv.status = 0, 200
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        started.append(srv)
+    yield started
+    for srv in started:
+        srv.shutdown()
+        srv.server_close()
+
+
+def _url(srv):
+    return f"http://127.0.0.1:{srv.server_address[1]}/openai"
+
+
+def test_least_outstanding_spreads_load():
+    lb = balancer.Balancer(["a", "b", "c"], rng=random.Random(0))
+    picked = [lb.pick() for _ in range(6)]
+    assert sorted(b.url for b in picked) == ["a", "a", "b", "b", "c", "c"]
+
+
+def test_ewma_prefers_fast_backend():
+    lb = balancer.Balancer(["a", "b"], strategy="ewma")
+    for url, latency in (("a", 0.1), ("b", 1.0)):
+        backend = lb.backend(url)
+        backend.outstanding += 1
+        lb.release(backend, True, latency)
+    assert {lb.pick().url for _ in range(3)} == {"a"}
+
+
+def test_ewma_does_not_favour_unsampled_backend():
+    lb = balancer.Balancer(["a", "b", "c"], strategy="ewma")
+    for url, latency in (("a", 0.1), ("b", 0.5)):
+        backend = lb.backend(url)
+        backend.outstanding += 1
+        lb.release(backend, True, latency)
+    lb.backend("a").outstanding = 5
+    # "c" counts as average, 0.3 s, so it is ahead of "b" but only
+    # until it has requests in flight
+    lb.release(lb.pick(), True)
+    assert [lb.pick().url for _ in range(3)] == ["c", "b", "c"]
+
+
+def test_failing_backend_is_ejected_and_ramped_back():
+    lb = balancer.Balancer(["a", "b"], eject_after=2, eject_for=10, ramp=30)
+    bad = lb.backend("a")
+    for _ in range(2):
+        bad.outstanding += 1
+        lb.release(bad, False)
+    assert bad.ejected_until
+    assert {lb.pick().url for _ in range(4)} == {"b"}
+
+    bad.ejected_until -= 11
+    lb.pick(lb.backend("b"))
+    assert not bad.ejected_until and bad.readmitted
+    # the returning backend starts with a small share
+    assert lb._weight(bad, bad.readmitted) == pytest.approx(0.1)
+    bad.outstanding -= 1
+
+    # failing again ejects it for twice as long
+    for _ in range(2):
+        bad.outstanding += 1
+        lb.release(bad, False)
+    left = bad.ejected_until - balancer.time.monotonic()
+    assert 19 < left <= 20
+
+
+def test_client_balances_and_skips_failing_endpoint(servers, monkeypatch):
+    monkeypatch.setattr(client.time, "sleep", lambda *_: None)
+    servers[0].status = 500
+    urls = [_url(srv) for srv in servers]
+    policy = retry.RetryPolicy(breaker_threshold=0)
+    msgs = [{"role": "user", "content": "hi"}]
+    with client.PollinationsClient(urls=urls, retry_policy=policy) as pc:
+        for _ in range(30):
+            pc.query(msgs, retries=1)
+        assert pc.balancer.backend(urls[0]).ejected_until
+    # each failure moved its request to a working endpoint
+    assert servers[0].count == 3
+    assert servers[1].count + servers[2].count == 30
+    assert servers[1].count > 5 and servers[2].count > 5
+
+
+def _dead_url():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    url = _url(srv)
+    srv.server_close()
+    return url
+
+
+def test_client_fails_over_from_dead_endpoint(servers, monkeypatch):
+    monkeypatch.setattr(client.time, "sleep", lambda *_: None)
+    urls = [_dead_url(), _url(servers[0])]
+    policy = retry.RetryPolicy(breaker_threshold=2, breaker_cooldown=60)
+    msgs = [{"role": "user", "content": "hi"}]
+    with client.PollinationsClient(urls=urls, retry_policy=policy) as pc:
+        for _ in range(10):
+            assert pc.query(msgs)["choices"][0]["message"]["content"] == "ok"
+        # the dead endpoint's breaker is open; picks of it are passed on
+        assert policy.breaker(urls[0]).is_open
+        dead = pc.balancer.backend(urls[0])
+        dead.ejected_until, dead.readmitted = 0.0, 0.0
+        live = pc.balancer.backend(urls[1])
+        live.outstanding += 5
+        before = dead.requests
+        pc.query(msgs)
+        live.outstanding -= 5
+        assert dead.requests == before + 1 and dead.outstanding == 0
+    assert servers[0].count == 11
+
+
+def test_client_raises_when_every_endpoint_fails(servers, monkeypatch):
+    monkeypatch.setattr(client.time, "sleep", lambda *_: None)
+    for srv in servers[:2]:
+        srv.status = 503
+    urls = [_url(srv) for srv in servers[:2]]
+    policy = retry.RetryPolicy(breaker_threshold=0)
+    with client.PollinationsClient(urls=urls, retry_policy=policy) as pc:
+        with pytest.raises(retry.EndpointUnavailable):
+            pc.query([{"role": "user", "content": "hi"}], retries=2)
+        assert [b.outstanding for b in pc.balancer.backends] == [0, 0]
+    # one attempt on the first endpoint, all retries on the last
+    assert sorted(srv.count for srv in servers[:2]) == [1, 2]
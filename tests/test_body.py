@@ -0,0 +1,87 @@
+import gc
+import json
+import os
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from PIL import Image  # noqa: E402
+
+from computer_control import body  # noqa: E402
+from computer_control import budget  # noqa: E402
+from computer_control import client  # noqa: E402
+from computer_control import frames  # noqa: E402
+from computer_control.main import screen_message  # noqa: E402
+
+
+def _session():
+    frame = frames.ScreenFrame.from_image(Image.new("RGB", (64, 48), "red"))
+    return [
+        {"role": "system", "content": client.SYSTEM_PROMPT},
+        screen_message(frame, "goal"),
+        {"role": "user", "content": [{"type": "text", "text": "é"}]},
+    ]
+
+
+def test_body_matches_payload():
+    msgs = _session()
+    data = client.body_builder().build(frames.materialize(msgs), stream=True)
+    expected = {**client.build_payload(frames.materialize(msgs))}
+    expected["stream"] = True
+    assert json.loads(data) == expected
+    if body.orjson is None:
+        stream = len(', "stream": true')
+        assert len(data) == budget.estimate_bytes(msgs) + stream
+
+
+def test_body_reuses_serialized_messages():
+    msgs = _session()
+    builder = client.body_builder()
+    first = builder.build(frames.materialize(msgs))
+    assert builder.misses == 3 and builder.hits == 0
+    # a new step reuses every message already sent
+    msgs.append({"role": "user", "content": "next"})
+    second = builder.build(frames.materialize(msgs))
+    assert builder.misses == 4 and builder.hits == 3
+    assert json.loads(second)["messages"][:3] == json.loads(first)["messages"]
+
+
+def test_body_notices_changed_messages():
+    msgs = _session()
+    builder = client.body_builder()
+    builder.build(frames.materialize(msgs))
+    msgs[2]["content"][0]["text"] = "changed"
+    sent = json.loads(builder.build(frames.materialize(msgs)))
+    assert sent["messages"][2]["content"][0]["text"] == "changed"
+    assert builder.misses == 4
+
+
+def test_materialize_reuses_data_urls():
+    msgs = _session()
+    first = frames.materialize(msgs)[1]["content"][1]["image_url"]["url"]
+    second = frames.materialize(msgs)[1]["content"][1]["image_url"]["url"]
+    assert first is second
+
+
+def test_data_urls_live_only_as_long_as_their_frame():
+    msgs = _session()
+    frames.materialize(msgs)
+    frame = msgs[1]["content"][1]["image_url"]["url"]
+    assert frame in frames._data_urls
+    sha = frame.sha
+    del msgs, frame
+    gc.collect()
+    assert all(f.sha != sha for f in frames._data_urls.keys())
+
+
+def test_body_cache_is_bounded_by_bytes():
+    builder = body.BodyBuilder({"model": "m"}, max_bytes=100)
+    for n in range(5):
+        builder.message({"role": "user", "content": f"{n}" * 40})
+    assert builder.cached_bytes <= 100
+    assert len(builder._messages) == 1
@@ -0,0 +1,117 @@
+import json
+import os
+import random
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from PIL import Image  # noqa: E402
+
+from computer_control import budget  # noqa: E402
+from computer_control import client  # noqa: E402
+from computer_control import controller  # noqa: E402
+from computer_control import frames  # noqa: E402
+from computer_control.history import OMITTED  # noqa: E402
+from computer_control.main import screen_message  # noqa: E402
+
+
+def _noise_image(seed, size=(320, 200)):
+    rng = random.Random(seed)
+    data = bytes(rng.getrandbits(8) for _ in range(size[0] * size[1] * 3))
+    return Image.frombytes("RGB", size, data)
+
+
+def _noise(seed, size=(320, 200)):
+    return frames.ScreenFrame.from_image(_noise_image(seed, size))
+
+
+def _session(turns):
+    msgs = [{"role": "system", "content": "sys"}]
+    for i in range(turns):
+        msgs.append(screen_message(_noise(i), f"step {i}"))
+        msgs.append(
+            {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [{"id": str(i), "type": "function"}],
+            }
+        )
+        msgs.append({"role": "tool", "tool_call_id": str(i), "content": "ok"})
+    msgs.append(screen_message(_noise(turns), "now"))
+    return msgs
+
+
+def _sent_bytes(msgs):
+    payload = client.build_payload(frames.materialize(msgs))
+    return len(json.dumps(payload))
+
+
+def test_estimate_matches_serialized_body():
+    msgs = _session(2)
+    msgs.append({"role": "user", "content": [{"type": "text", "text": "é"}]})
+    assert budget.estimate_bytes(msgs) == _sent_bytes(msgs)
+
+
+def test_fit_thumbnails_older_screenshots_first():
+    msgs = _session(3)
+    full = budget.estimate_bytes(msgs)
+    newest = msgs[-1]["content"][1]["image_url"]["url"]
+    policy = budget.RequestBudget(full - 1000)
+
+    fitted = policy.fit(msgs)
+
+    assert len(fitted) == len(msgs)
+    assert policy.thumbnailed >= 1 and not policy.omitted
+    assert policy.last_bytes == _sent_bytes(fitted) <= full - 1000
+    assert fitted[-1]["content"][1]["image_url"]["url"] is newest
+    # the history itself is left untouched
+    assert budget.estimate_bytes(msgs) == full
+
+
+def test_fit_omits_then_drops_turns():
+    msgs = _session(3)
+    last = budget.estimate_bytes(msgs[-1:]) + 50
+
+    fitted = budget.RequestBudget(last).fit(msgs)
+
+    assert fitted[-1] is msgs[-1]
+    assert fitted[0]["role"] in ("system", "user")
+    assert _sent_bytes(fitted) <= last
+
+    policy = budget.RequestBudget(budget.estimate_bytes(msgs) // 3)
+    fitted = policy.fit(msgs)
+    assert policy.omitted and not policy.dropped
+    assert any(
+        part.get("text") == OMITTED
+        for msg in fitted[:-1]
+        if isinstance(msg["content"], list)
+        for part in msg["content"]
+    )
+
+
+def test_main_lowers_budget_on_413(monkeypatch):
+    from computer_control import main as cc_main
+
+    sizes = []
+
+    def fake_query(messages):
+        sizes.append(len(json.dumps(client.build_payload(messages))))
+        if len(sizes) == 3:
+            raise RuntimeError("Pollinations API returned 413: too large")
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    shots = iter(range(100))
+    monkeypatch.setattr(
+        controller,
+        "grab_screen",
+        lambda: _noise_image(next(shots), (64, 64)),
+    )
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    cc_main("hi", steps=3, dry_run=True, max_request_kb=1024)
+    assert len(sizes) == 4
+    assert sizes[3] <= sizes[2] * 0.75
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from computer_control import cache  # noqa: E402
+from computer_control import frames  # noqa: E402
+
+
+def _call(name, **args):
+    return {
+        "id": "call_1",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args)},
+    }
+
+
+def _response(*calls):
+    message = {"content": "", "tool_calls": list(calls)}
+    return {"choices": [{"message": message}]}
+
+
+def _history(*calls):
+    return [
+        {"role": "system", "content": "sys"},
+        {"role": "assistant", "content": "", "tool_calls": list(calls)},
+        {"role": "tool", "tool_call_id": "call_1", "content": "ok"},
+    ]
+
+
+def _digest(marked=False):
+    image = Image.new("RGB", (640, 480), "white")
+    if marked:
+        ImageDraw.Draw(image).rectangle((100, 100, 300, 300), fill="black")
+    return frames.frame_digest(image)
+
+
+def test_cache_replays_matching_state(tmp_path):
+    store = cache.ResponseCache(str(tmp_path / "cache.db"))
+    msgs = _history(_call("click", x=1, y=2))
+    store.store("Open  Calculator", msgs, _digest(), _response(_call("type")))
+
+    hit = store.lookup("open calculator", msgs, _digest())
+    assert hit is not None
+    call = hit["choices"][0]["message"]["tool_calls"][0]
+    assert call["function"]["name"] == "type"
+    assert call["id"] != "call_1"
+
+    assert store.lookup("open calculator", msgs, _digest(True)) is None
+    other = _history(_call("click", x=5, y=2))
+    assert store.lookup("open calculator", other, _digest()) is None
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 2
+    store.close()
+
+
+def test_cache_never_matches_unknown_screen(tmp_path):
+    store = cache.ResponseCache(str(tmp_path / "cache.db"))
+    store.store("goal", [], None, _response(_call("scroll")))
+    assert store.stats()["entries"] == 0
+    store.store("goal", [], _digest(), _response(_call("scroll")))
+    assert store.lookup("goal", [], None) is None
+    store.close()
+
+
+def test_cache_shared_between_runs(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = cache.ResponseCache(path)
+    first.store("goal", [], _digest(), _response(_call("scroll")))
+    first.close()
+    second = cache.ResponseCache(path)
+    assert second.lookup("goal", [], _digest()) is not None
+    second.close()
+
+
+def test_cache_expires_entries(tmp_path, monkeypatch):
+    screen = _digest()
+    store = cache.ResponseCache(str(tmp_path / "cache.db"), ttl=10)
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    store.store("goal", [], screen, _response(_call("scroll")))
+    assert store.lookup("goal", [], screen) is not None
+    now[0] += 11
+    assert store.lookup("goal", [], screen) is None
+    store.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    screen = _digest()
+    store = cache.ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    for goal in ("a", "b"):
+        store.store(goal, [], screen, _response(_call(goal)))
+        now[0] += 1
+    assert store.lookup("a", [], screen) is not None
+    now[0] += 1
+    store.store("c", [], screen, _response(_call("c")))
+    assert store.lookup("b", [], screen) is None
+    assert store.lookup("a", [], screen) is not None
+    assert store.lookup("c", [], screen) is not None
+    assert store.stats()["entries"] == 2
+    store.close()
+
+
+def test_cache_size_cap(tmp_path):
+    screen = _digest()
+    cap = 3 * len(screen)
+    store = cache.ResponseCache(str(tmp_path / "cache.db"), max_bytes=cap)
+    for goal in "abcdefgh":
+        response = _response(_call("click", text=goal * 20))
+        store.store(goal, [], screen, response)
+    assert store.stats()["bytes"] <= cap
+    assert store.stats()["entries"] == 2
+    assert store.lookup("h", [], screen) is not None
+    store.close()
+
+
+def test_tool_history_keeps_last_calls():
+    msgs = _history(*[_call("click", x=i) for i in range(6)])
+    names = [args["x"] for _, args in cache.tool_history(msgs)]
+    assert names == [2, 3, 4, 5]
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from computer_control import body  # noqa: E402
+from computer_control import capture  # noqa: E402
+from computer_control import client  # noqa: E402
+from computer_control import controller  # noqa: E402
+
+
+def test_capture_worker_returns_latest_frame():
+    count = {"n": 0}
+
+    def grab():
+        count["n"] += 1
+        return count["n"]
+
+    worker = capture.CaptureWorker(grab)
+    try:
+        worker.request()
+        assert worker.result(timeout=2) == 1
+        worker.request()
+        assert worker.result(timeout=2) == 2
+    finally:
+        worker.close()
+
+
+def test_capture_worker_coalesces_and_delays():
+    release = threading.Event()
+    calls: List[float] = []
+
+    def grab():
+        calls.append(time.monotonic())
+        release.wait(2)
+        return len(calls)
+
+    worker = capture.CaptureWorker(grab)
+    try:
+        worker.request()
+        time.sleep(0.05)
+        worker.request()
+        worker.request(delay=0.1)
+        requested = time.monotonic()
+        release.set()
+        assert worker.result(timeout=2) == 2
+        assert len(calls) == 2
+        assert calls[1] - requested >= 0.09
+    finally:
+        worker.close()
+
+
+def test_capture_worker_reraises_errors():
+    def grab():
+        raise ValueError("boom")
+
+    worker = capture.CaptureWorker(grab)
+    try:
+        worker.request()
+        with pytest.raises(ValueError):
+            worker.result(timeout=2)
+    finally:
+        worker.close()
+
+
+def test_main_background_capture(monkeypatch):
+    from computer_control import main as cc_main
+
+    sent: List[List[Dict[str, Any]]] = []
+    threads = set()
+    responses = [
+        {
+            "choices": [
+                {
+                    "message": {
+                        "tool_calls": [
+                            {
+                                "id": "1",
+                                "function": {
+                                    "name": "press_key",
+                                    "arguments": '{"key": "a"}',
+                                },
+                            }
+                        ]
+                    }
+                }
+            ]
+        },
+        {"choices": [{"message": {"done": True}}]},
+    ]
+
+    encoded: List[str] = []
+    seen: List[List[str]] = []
+
+    def fake_query(messages):
+        sent.append(messages)
+        seen.append(list(encoded))
+        return responses[len(sent) - 1]
+
+    def fake_grab():
+        threads.add(threading.current_thread().name)
+        color = "white" if len(threads) == 1 else "black"
+        return Image.new("RGB", (8, 8), color)
+
+    encode = body.BodyBuilder.message
+
+    def record(self, msg):
+        encoded.append(msg["role"])
+        return encode(self, msg)
+
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    monkeypatch.setattr(controller, "grab_screen", fake_grab)
+    monkeypatch.setattr(body.BodyBuilder, "message", record)
+    cc_main("goal", dry_run=True, secure=False, background_capture=True)
+
+    assert "capture-worker" in threads
+    # the step was serialized while the screenshot was taken
+    assert seen[0] == [] and seen[1][-2:] == ["assistant", "tool"]
+    assert len(sent) == 2
+    assert sent[1][-1]["content"][0]["text"] == "Updated screen"
@@ -107,7 +107,7 @@ def test_execute_tool_calls_delay(monkeypatch):
     }
     sleeps: List[float] = []
     monkeypatch.setattr(client.time, "sleep", lambda d: sleeps.append(d))
-    monkeypatch.setattr(client.controller, "run_shell", lambda **_: None)
+    monkeypatch.setitem(client.ACTION_MAP, "run_shell", lambda **_: None)
     client.execute_tool_calls([call], dry_run=False, secure=False, delay=0.5)
     assert sleeps == [0.5]
 
@@ -254,9 +254,10 @@ def test_capture_screen_unidentified(monkeypatch):
 def test_query_pollinations_payload(monkeypatch):
     captured = {}
 
-    def fake_post(url, json=None, headers=None, timeout=60):
+    def fake_post(url, data=None, headers=None, timeout=60):
         captured["url"] = url
-        captured["json"] = json
+        captured["json"] = json.loads(data)
+        captured["headers"] = headers
 
         class Response:
 
@@ -277,6 +278,7 @@ def test_query_pollinations_payload(monkeypatch):
     assert captured["json"]["model"] == "openai"
     assert captured["json"]["messages"] == messages
     assert captured["json"]["tools"] == client.FUNCTIONS_SPEC
+    assert captured["headers"]["Content-Type"] == "application/json"
 
 
 def test_query_pollinations_network_error(monkeypatch):
@@ -313,7 +315,7 @@ def test_query_pollinations_http_error(monkeypatch):
 def test_main_uses_blank_image(monkeypatch):
     from computer_control import main as cc_main
 
-    def fake_capture():
+    def fake_grab():
         raise controller.GUIUnavailable("no gui")
 
     def fake_query(messages: List[Dict[str, Any]]):
@@ -322,7 +324,7 @@ def test_main_uses_blank_image(monkeypatch):
         return {"choices": [{}]}
 
     payload = ""
-    monkeypatch.setattr(controller, "capture_screen", fake_capture)
+    monkeypatch.setattr(controller, "grab_screen", fake_grab)
     monkeypatch.setattr(client, "execute_tool_calls", lambda *_, **__: None)
     monkeypatch.setattr(client, "query_pollinations", fake_query)
     cc_main("hello", steps=1, dry_run=True)
@@ -332,7 +334,7 @@ def test_main_uses_blank_image(monkeypatch):
 def test_main_uses_blank_image_no_dry_run(monkeypatch):
     from computer_control import main as cc_main
 
-    def fake_capture():
+    def fake_grab():
         raise controller.GUIUnavailable("no gui")
 
     def fake_query(messages: List[Dict[str, Any]]):
@@ -341,7 +343,7 @@ def test_main_uses_blank_image_no_dry_run(monkeypatch):
         return {"choices": [{}]}
 
     payload = ""
-    monkeypatch.setattr(controller, "capture_screen", fake_capture)
+    monkeypatch.setattr(controller, "grab_screen", fake_grab)
     monkeypatch.setattr(client, "execute_tool_calls", lambda *_, **__: None)
     monkeypatch.setattr(client, "query_pollinations", fake_query)
     cc_main("hello", steps=1)
@@ -407,6 +409,7 @@ def test_execute_tool_calls_returns_messages():
 
 def test_main_unlimited(monkeypatch):
     from computer_control import main as cc_main
+    from PIL import Image
 
     responses = [
         {
@@ -444,7 +447,7 @@ def test_main_unlimited(monkeypatch):
         ],  # noqa: E501
     )
     monkeypatch.setattr(
-        controller, "capture_screen", lambda: "data:image/png;base64,abc"
+        controller, "grab_screen", lambda: Image.new("RGB", (8, 8))
     )
     cc_main("hi", max_steps=0, dry_run=True)
     assert idx["i"] == 2
@@ -586,24 +589,96 @@ def test_trim_history_multi_tool_call_partial():
     assert trimmed == [{"role": "user", "content": "next"}]
 
 
+def test_main_releases_resources_on_error(monkeypatch):
+    from computer_control import main as cc_main
+    from PIL import Image
+
+    opened = {}
+
+    def fake_query(_):
+        opened["shell"] = controller.get_shell_session()
+        opened["shell"]._ensure()
+        opened["client"] = client._client
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(
+        controller, "grab_screen", lambda: Image.new("RGB", (8, 8))
+    )
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    with pytest.raises(KeyboardInterrupt):
+        cc_main("goal", steps=1, dry_run=True, background_capture=True)
+    assert opened["shell"].proc is None and opened["client"] is not None
+    assert controller.get_shell_session() is None
+    assert client._client is None
+
+
+@pytest.mark.parametrize(
+    "flags, secure", [([], True), (["--no-confirm"], False)]
+)
+def test_cli_entry_confirms_unless_disabled(monkeypatch, flags, secure):
+    main_module = sys.modules["computer_control.main"]
+    seen = {}
+
+    def fake_main(goal, **kwargs):
+        seen.update(kwargs)
+
+    monkeypatch.setattr(main_module, "main", fake_main)
+    monkeypatch.setattr(sys, "argv", ["computer_control.py", "goal"] + flags)
+    main_module.cli_entry()
+    assert seen["secure"] is secure
+
+
 def test_main_save_dir(monkeypatch, tmp_path):
     from computer_control import main as cc_main
+    from PIL import Image
     from computer_control import controller, client
-    import base64
 
-    def fake_capture():
-        return "data:image/jpeg;base64," + base64.b64encode(b"abc").decode()
+    def fake_grab():
+        return Image.new("RGB", (16, 16), "blue")
 
     def fake_query(_):
         return {"choices": [{"message": {"content": "done", "done": True}}]}
 
-    monkeypatch.setattr(controller, "capture_screen", fake_capture)
+    monkeypatch.setattr(controller, "grab_screen", fake_grab)
     monkeypatch.setattr(client, "execute_tool_calls", lambda *_, **__: [])
     monkeypatch.setattr(client, "query_pollinations", fake_query)
 
     cc_main("goal", steps=1, dry_run=True, save_dir=str(tmp_path))
-    assert (tmp_path / "0.jpg").exists()
-    assert (tmp_path / "final.jpg").exists()
+    first = (tmp_path / "0.jpg").read_bytes()
+    assert first == (tmp_path / "final.jpg").read_bytes()
+    assert first == controller.encode_jpeg(fake_grab())
+
+
+def test_main_save_dir_writes_encoded_final_frame(monkeypatch, tmp_path):
+    from computer_control import main as cc_main
+    from computer_control import controller, client
+    from PIL import Image
+
+    def no_data_url():
+        raise AssertionError("frames are saved without a data URL")
+
+    def fake_query(_):
+        return {"choices": [{"message": {"content": "done", "done": True}}]}
+
+    monkeypatch.setattr(controller, "capture_screen", no_data_url)
+    monkeypatch.setattr(
+        controller, "grab_screen", lambda: Image.new("RGB", (64, 48), "red")
+    )
+    monkeypatch.setattr(client, "execute_tool_calls", lambda *_, **__: [])
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+
+    cc_main(
+        "goal",
+        steps=1,
+        dry_run=True,
+        save_dir=str(tmp_path),
+        frame_bytes=4096,
+    )
+    final = [p for p in tmp_path.iterdir() if p.stem == "final"]
+    assert len(final) == 1
+    first = [p for p in tmp_path.iterdir() if p.stem == "0"]
+    assert final[0].suffix == first[0].suffix
+    assert final[0].read_bytes() == first[0].read_bytes()
 
 
 def test_query_pollinations_413(monkeypatch):
@@ -622,6 +697,7 @@ def test_query_pollinations_413(monkeypatch):
 
 def test_main_retries_on_413(monkeypatch):
     from computer_control import main as cc_main
+    from PIL import Image
 
     calls = {"count": 0}
 
@@ -636,7 +712,7 @@ def test_main_retries_on_413(monkeypatch):
     monkeypatch.setattr(client, "query_pollinations", fake_query)
     monkeypatch.setattr(client, "execute_tool_calls", lambda *_, **__: [])
     monkeypatch.setattr(
-        controller, "capture_screen", lambda: "data:image/png;base64,abc"
+        controller, "grab_screen", lambda: Image.new("RGB", (8, 8))
     )
 
     cc_main("goal", steps=1, dry_run=True, history=4)
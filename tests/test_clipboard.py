@@ -0,0 +1,160 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import clipboard  # noqa: E402
+from computer_control import controller  # noqa: E402
+
+
+class FakeBoard:
+    def __init__(self, text: Optional[str] = "old") -> None:
+        self.text = text
+        self.history: List[Optional[str]] = []
+        self.fail = False
+
+    def get(self) -> Optional[str]:
+        return self.text
+
+    def set(self, text: str) -> None:
+        if self.fail:
+            raise clipboard.ClipboardError("no owner")
+        self.text = text
+        self.history.append(text)
+
+
+class FakeGUI:
+    def __init__(self) -> None:
+        self.typed: List[str] = []
+        self.hotkeys: List[tuple] = []
+
+    def write(self, text: str) -> None:
+        self.typed.append(text)
+
+    def hotkey(self, *keys: str) -> None:
+        self.hotkeys.append(keys)
+
+
+@pytest.fixture
+def gui(monkeypatch):
+    fake = FakeGUI()
+    monkeypatch.setattr(controller, "pyautogui", fake)
+    monkeypatch.setattr(clipboard, "RESTORE_DELAY", 0)
+    monkeypatch.setattr(controller, "PASTE_MIN_CHARS", 8)
+    return fake
+
+
+def test_paste_restores_previous_text(monkeypatch):
+    monkeypatch.setattr(clipboard, "RESTORE_DELAY", 0)
+    board = FakeBoard()
+    seen: List[Optional[str]] = []
+    assert clipboard.paste("new", lambda: seen.append(board.text), board)
+    assert seen == ["new"]
+    assert board.text == "old" and board.history == ["new", "old"]
+
+    empty = FakeBoard(None)
+    assert clipboard.paste("new", lambda: None, empty)
+    assert empty.history == ["new"]
+
+
+def test_paste_reports_unusable_clipboard(monkeypatch):
+    board = FakeBoard()
+    board.fail = True
+    pressed: List[int] = []
+    assert not clipboard.paste("new", lambda: pressed.append(1), board)
+    assert pressed == []
+
+    monkeypatch.setattr(clipboard, "detect", lambda: None)
+    assert not clipboard.paste("new", lambda: pressed.append(1))
+    assert pressed == []
+
+
+def test_write_text_pastes_long_and_non_ascii_text(monkeypatch, gui):
+    board = FakeBoard()
+    monkeypatch.setattr(clipboard, "detect", lambda: board)
+    controller.write_text("short")
+    controller.write_text("long enough")
+    controller.write_text("héllo")
+    assert gui.typed == ["short"]
+    assert gui.hotkeys == [controller.PASTE_KEYS] * 2
+    assert board.history == ["long enough", "old", "héllo", "old"]
+
+
+def test_write_text_types_without_clipboard(monkeypatch, gui):
+    monkeypatch.setattr(clipboard, "detect", lambda: None)
+    controller.write_text("long enough")
+    assert gui.typed == ["long enough"] and gui.hotkeys == []
+
+    board = FakeBoard()
+    monkeypatch.setattr(clipboard, "detect", lambda: board)
+    controller.set_paste_min_chars(0)
+    controller.write_text("long enough")
+    assert gui.typed == ["long enough"] * 2 and board.history == []
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX shell")
+def test_command_clipboard_round_trip(tmp_path):
+    store = tmp_path / "board"
+    board = clipboard.CommandClipboard(
+        ["sh", "-c", f"cat > '{store}'"], ["cat", str(store)]
+    )
+    assert board.get() is None
+    board.set("ünïcode\ntext")
+    assert board.get() == "ünïcode\ntext"
+
+    broken = clipboard.CommandClipboard(["false"], ["false"])
+    with pytest.raises(clipboard.ClipboardError):
+        broken.set("x")
+
+
+def test_detect_needs_a_display(monkeypatch):
+    if sys.platform == "darwin" or os.name == "nt":
+        pytest.skip("X11 and Wayland only")
+    monkeypatch.delenv("DISPLAY", raising=False)
+    monkeypatch.delenv("WAYLAND_DISPLAY", raising=False)
+    assert clipboard.detect() is None
+    monkeypatch.setenv("DISPLAY", ":0")
+    monkeypatch.setattr(
+        shutil, "which", lambda name: name if name == "xsel" else None
+    )
+    board = clipboard.detect()
+    assert board is not None and board.copy[0] == "xsel"
+
+
+@pytest.mark.skipif(
+    not (shutil.which("Xvfb") and shutil.which("xclip")),
+    reason="needs Xvfb and xclip",
+)
+def test_xclip_under_xvfb(monkeypatch):
+    server = subprocess.Popen(
+        ["Xvfb", ":97", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(0.5)
+        monkeypatch.setenv("DISPLAY", ":97")
+        monkeypatch.delenv("WAYLAND_DISPLAY", raising=False)
+        board = clipboard.detect()
+        assert board is not None
+        board.set("before")
+        seen: List[Optional[str]] = []
+        assert clipboard.paste(
+            "ütf-8 text", lambda: seen.append(board.get()), board
+        )
+        assert seen == ["ütf-8 text"]
+        assert board.get() == "before"
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import sys
+from typing import List
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from computer_control import client  # noqa: E402
+from computer_control import coalesce  # noqa: E402
+
+
+def _call(id_, name, **args):
+    return {
+        "id": id_,
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args)},
+    }
+
+
+def _planned(calls):
+    return [
+        (
+            call["function"]["name"],
+            json.loads(call["function"]["arguments"]),
+            indices,
+        )
+        for call, indices in coalesce.plan(calls)
+    ]
+
+
+def test_move_before_click_on_same_spot_is_dropped():
+    calls = [
+        _call("a", "move_mouse", x=5, y=6),
+        _call("b", "move_mouse", x=10, y=20),
+        _call("c", "click", x=10, y=20),
+        _call("d", "move_mouse", x=1, y=1),
+        _call("e", "click", x=2, y=2),
+    ]
+    assert _planned(calls) == [
+        ("click", {"x": 10, "y": 20}, [0, 1, 2]),
+        ("move_mouse", {"x": 1, "y": 1}, [3]),
+        ("click", {"x": 2, "y": 2}, [4]),
+    ]
+
+
+def test_adjacent_text_is_joined():
+    calls = [
+        _call("a", "write_text", text="Hello, "),
+        _call("b", "write_text", text="world"),
+        _call("c", "press_key", key="enter"),
+        _call("d", "write_text", text="!"),
+    ]
+    assert _planned(calls)[0] == (
+        "write_text",
+        {"text": "Hello, world"},
+        [0, 1],
+    )
+    assert len(coalesce.plan(calls)) == 3
+
+
+def test_key_sequence_becomes_hotkey():
+    calls = [
+        _call("a", "key_down", key="ctrl"),
+        _call("b", "key_down", key="shift"),
+        _call("c", "press_key", key="t"),
+        _call("d", "key_up", key="shift"),
+        _call("e", "key_up", key="ctrl"),
+        _call("f", "key_down", key="alt"),
+        _call("g", "key_up", key="ctrl"),
+    ]
+    planned = _planned(calls)
+    assert planned[0] == (
+        "hotkey",
+        {"keys": ["ctrl", "shift", "t"]},
+        [0, 1, 2, 3, 4],
+    )
+    # mismatched releases are left as they are
+    assert [p[0] for p in planned[1:]] == ["key_down", "key_up"]
+
+
+def test_invalid_call_separates_runs():
+    calls = [
+        _call("a", "write_text", text="a"),
+        {"id": "b", "function": {"name": "write_text", "arguments": "{"}},
+        _call("c", "write_text", text="c"),
+    ]
+    assert [indices for _, indices in coalesce.plan(calls)] == [[0], [1], [2]]
+
+
+def test_execute_reports_every_call(monkeypatch):
+    typed: List[str] = []
+    monkeypatch.setitem(
+        client.ACTION_MAP, "write_text", lambda text: typed.append(text)
+    )
+    monkeypatch.setitem(client.ACTION_MAP, "hotkey", lambda keys: None)
+    sleeps: List[float] = []
+    monkeypatch.setattr(client.time, "sleep", sleeps.append)
+    calls = [
+        _call("a", "write_text", text="ab"),
+        _call("b", "write_text", text="cd"),
+        _call("c", "key_down", key="ctrl"),
+        _call("d", "press_key", key="s"),
+        _call("e", "key_up", key="ctrl"),
+    ]
+    msgs = client.execute_tool_calls(calls, delay=0.5)
+    assert typed == ["abcd"]
+    assert sleeps == [0.5, 0.5]
+    assert [m["tool_call_id"] for m in msgs] == list("abcde")
+    assert [m["name"] for m in msgs] == [
+        "write_text",
+        "write_text",
+        "key_down",
+        "press_key",
+        "key_up",
+    ]
+    assert all(m["content"] == "" for m in msgs)
+
+    typed.clear()
+    client.execute_tool_calls(calls[:2], optimize=False)
+    assert typed == ["ab", "cd"]
+
+
+def test_secure_mode_confirms_the_original_calls(monkeypatch):
+    typed: List[str] = []
+    prompts: List[str] = []
+    monkeypatch.setitem(
+        client.ACTION_MAP, "write_text", lambda text: typed.append(text)
+    )
+    monkeypatch.setattr(
+        "builtins.input", lambda prompt: prompts.append(prompt) or "y"
+    )
+    calls = [
+        _call("a", "write_text", text="ab"),
+        _call("b", "write_text", text="cd"),
+    ]
+    msgs = client.execute_tool_calls(calls, secure=True)
+    assert typed == ["ab", "cd"] and len(prompts) == 2
+    assert [m["tool_call_id"] for m in msgs] == ["a", "b"]
+
+
+def test_async_execute_coalesces(monkeypatch):
+    typed: List[str] = []
+    monkeypatch.setitem(
+        client.ACTION_MAP, "write_text", lambda text: typed.append(text)
+    )
+    calls = [
+        _call("a", "write_text", text="x"),
+        _call("b", "write_text", text="y"),
+    ]
+    msgs = asyncio.run(client.execute_tool_calls_async(calls))
+    assert typed == ["xy"]
+    assert [m["tool_call_id"] for m in msgs] == ["a", "b"]
@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from computer_control import encoder  # noqa: E402
+
+
+def _noisy(width, height):
+    rng = random.Random(0)
+    data = bytes(rng.randrange(256) for _ in range(width * height * 3))
+    return Image.frombytes("RGB", (width, height), data)
+
+
+def test_encode_raw_fits_budget():
+    data, info = encoder.encode_raw(_noisy(640, 400), 40_000)
+    assert len(data) < info["bytes"] <= 40_000
+    assert info["format"] in ("jpeg", "webp")
+    assert info["mime"] == encoder.MIME[info["format"]]
+
+
+def test_encode_raw_downscales_when_needed():
+    data, info = encoder.encode_raw(
+        _noisy(1200, 800), 20_000, formats=["jpeg"], min_dim=300
+    )
+    assert len(data) < info["bytes"] <= 20_000
+    assert max(info["size"]) < 1200
+
+
+def test_encode_raw_flat_ui_uses_palette_png():
+    image = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(20, 580, 20):
+        draw.text((10, y), "Lorem ipsum dolor sit amet", fill="black")
+    data, info = encoder.encode_raw(image, 60_000)
+    assert info["format"] == "png"
+    assert data.startswith(b"\x89PNG")
+    assert "png" in encoder.describe(info)
+
+
+def test_main_reports_frame_encoding(monkeypatch, capsys):
+    from computer_control import main as cc_main
+    from computer_control import client, controller
+
+    sent = []
+
+    def fake_query(messages):
+        sent.append(messages)
+        return {"choices": [{"message": {"done": True}}]}
+
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    monkeypatch.setattr(controller, "grab_screen", lambda: _noisy(320, 200))
+    cc_main("goal", steps=1, dry_run=True, frame_bytes=30_000)
+
+    url = sent[0][1]["content"][1]["image_url"]["url"]
+    assert len(url) <= 30_000
+    assert "Screenshot: " in capsys.readouterr().out
@@ -0,0 +1,284 @@
+import base64
+import io
+import os
+import sys
+from typing import Any, Dict, List
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control import controller  # noqa: E402
+from computer_control import frames  # noqa: E402
+
+
+def _jpeg(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=70)
+    return buf.getvalue()
+
+
+def _data_url(image: Image.Image) -> str:
+    data = base64.b64encode(_jpeg(image)).decode()
+    return "data:image/jpeg;base64," + data
+
+
+def _has_image(msgs: List[Dict[str, Any]]) -> bool:
+    return any(
+        part.get("type") == "image_url"
+        for msg in msgs
+        if isinstance(msg.get("content"), list)
+        for part in msg["content"]
+    )
+
+
+def test_frames_match_identical_and_changed():
+    base = Image.new("RGB", (640, 480), "white")
+    changed = base.copy()
+    ImageDraw.Draw(changed).rectangle((100, 100, 130, 120), fill="black")
+
+    a = frames.bytes_digest(_jpeg(base))
+    b = frames.bytes_digest(_jpeg(base.copy()))
+    c = frames.bytes_digest(_jpeg(changed))
+    assert frames.frames_match(a, b)
+    assert not frames.frames_match(a, c)
+
+
+def test_bytes_digest_invalid():
+    assert frames.bytes_digest(b"abc") is None
+    assert not frames.frames_match(None, None)
+
+
+def test_main_skips_unchanged_screens(monkeypatch):
+    from computer_control import main as cc_main
+
+    screen = Image.new("RGB", (200, 100), "white")
+    sent: List[List[Dict[str, Any]]] = []
+
+    def fake_query(messages):
+        sent.append(messages)
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    monkeypatch.setattr(controller, "grab_screen", lambda: screen)
+    cc_main("goal", steps=3, dry_run=True, history=8)
+
+    last = sent[-1][-1]["content"]
+    assert last == [{"type": "text", "text": "Screen unchanged since step 0"}]
+    assert _has_image(sent[-1])
+
+
+def test_main_restores_image_outside_window(monkeypatch):
+    from computer_control import main as cc_main
+
+    screen = Image.new("RGB", (200, 100), "white")
+    sent: List[List[Dict[str, Any]]] = []
+
+    def fake_query(messages):
+        sent.append(messages)
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    monkeypatch.setattr(controller, "grab_screen", lambda: screen)
+    cc_main("goal", steps=4, dry_run=True, history=1)
+
+    assert all(_has_image(batch) for batch in sent)
+
+
+def test_changed_regions_finds_boxes():
+    prev = Image.new("RGB", (320, 240), "white")
+    cur = prev.copy()
+    draw = ImageDraw.Draw(cur)
+    draw.rectangle((20, 20, 40, 30), fill="black")
+    draw.rectangle((200, 150, 230, 170), fill="black")
+
+    boxes = frames.changed_regions(prev, cur)
+    assert len(boxes) == 2
+    assert boxes[0][0] <= 20 and boxes[0][2] >= 40
+    assert frames.changed_regions(prev, prev.copy()) == []
+    merged = frames.changed_regions(prev, cur, max_regions=1)
+    assert merged == [(16, 16, 240, 176)]
+
+
+def test_delta_capture_keyframes_and_crops(monkeypatch):
+    screens = [Image.new("RGB", (400, 300), "white") for _ in range(4)]
+    ImageDraw.Draw(screens[1]).rectangle((50, 60, 70, 70), fill="red")
+    screens[2] = screens[1].copy()
+    screens[3] = screens[1].copy()
+    it = iter(screens)
+    monkeypatch.setattr(controller, "grab_screen", lambda: next(it))
+
+    capturer = frames.DeltaCapture(keyframe_interval=3)
+    first = capturer.capture()
+    assert capturer.last_was_keyframe and len(first) == 2
+
+    delta = capturer.capture()
+    assert not capturer.last_was_keyframe
+    assert "x=48, y=48" in delta[1]["text"]
+    crop = delta[2]["image_url"]["url"]
+    assert isinstance(crop, frames.ScreenFrame)
+    assert (crop.width, crop.height) == (32, 32)
+    assert crop.data_url().startswith("data:image/jpeg;base64,")
+
+    assert capturer.capture() is None
+    capturer.capture()
+    assert capturer.last_was_keyframe
+
+
+def test_main_delta_mode(monkeypatch):
+    from computer_control import main as cc_main
+
+    sent: List[List[Dict[str, Any]]] = []
+
+    def fake_query(messages):
+        sent.append(messages)
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    monkeypatch.setattr(
+        controller, "grab_screen", lambda: Image.new("RGB", (64, 48), "white")
+    )
+    snapshots: List[int] = []
+    snapshot = frames.DeltaCapture.snapshot
+
+    def counted(self):
+        snapshots.append(1)
+        return snapshot(self)
+
+    monkeypatch.setattr(frames.DeltaCapture, "snapshot", counted)
+    cc_main("goal", steps=2, dry_run=True, delta_keyframe=4)
+
+    assert sent[0][1]["content"][0]["text"] == "goal (64x48 screen)"
+    assert sent[-1][-1]["content"][0]["text"].startswith("Screen unchanged")
+    # without a response cache the known screen is never re-encoded
+    assert snapshots == []
+
+
+def test_wait_for_settle_returns_stable_frame(monkeypatch):
+    white = Image.new("RGB", (64, 64), "white")
+    black = Image.new("RGB", (64, 64), "black")
+    seq = iter([white, black, white] + [black] * 100)
+    monkeypatch.setattr(controller, "grab_screen", lambda: next(seq))
+
+    image = frames.wait_for_settle(stable=0.02, timeout=2, interval=0.01)
+    assert image is black
+
+
+def test_wait_for_settle_times_out(monkeypatch):
+    colors = iter(range(10_000))
+    monkeypatch.setattr(
+        controller,
+        "grab_screen",
+        lambda: Image.new("L", (8, 8), next(colors) % 2 * 255),
+    )
+    image = frames.wait_for_settle(stable=1, timeout=0.05, interval=0.01)
+    assert image is not None
+
+
+def test_wait_for_settle_spares_slow_grabbers(monkeypatch):
+    grabs = []
+    sleeps = []
+
+    def slow_grab():
+        grabs.append(1)
+        return Image.new("L", (8, 8), len(grabs) % 2 * 255)
+
+    clock = iter(x * 0.1 for x in range(10_000))
+    monkeypatch.setattr(controller, "grab_screen", slow_grab)
+    monkeypatch.setattr(frames.time, "monotonic", lambda: next(clock))
+    monkeypatch.setattr(frames.time, "sleep", sleeps.append)
+    frames.wait_for_settle(stable=10, timeout=100, interval=0.05)
+    assert len(grabs) == frames.SLOW_POLLS
+    # each poll waits as long as a grab takes
+    assert sleeps and min(sleeps) >= 0.1 - 1e-9
+
+    grabs.clear()
+    monkeypatch.setattr(controller, "fast_grabber", lambda: True)
+    frames.wait_for_settle(stable=10, timeout=3, interval=0.05)
+    assert len(grabs) > frames.SLOW_POLLS
+
+
+def test_execute_tool_calls_settle_replaces_delay(monkeypatch):
+    calls = [
+        {"function": {"name": "press_key", "arguments": '{"key": "a"}'}},
+        {"function": {"name": "press_key", "arguments": '{"key": "b"}'}},
+    ]
+    settled: List[int] = []
+    monkeypatch.setitem(client.ACTION_MAP, "press_key", lambda **_: None)
+    monkeypatch.setattr(client.time, "sleep", lambda _: settled.append(-1))
+    client.execute_tool_calls(
+        calls,
+        delay=1.0,
+        trailing_delay=False,
+        settle=lambda: settled.append(1),
+    )
+    assert settled == [1]
+
+
+def test_main_uses_settled_frame(monkeypatch):
+    from computer_control import main as cc_main
+
+    responses = [
+        {
+            "choices": [
+                {
+                    "message": {
+                        "tool_calls": [
+                            {
+                                "id": "1",
+                                "function": {
+                                    "name": "press_key",
+                                    "arguments": '{"key": "a"}',
+                                },
+                            }
+                        ]
+                    }
+                }
+            ]
+        },
+        {"choices": [{"message": {"done": True}}]},
+    ]
+    grabs: List[int] = []
+
+    def grab():
+        grabs.append(1)
+        return Image.new("RGB", (32, 32), "white")
+
+    monkeypatch.setitem(client.ACTION_MAP, "press_key", lambda **_: None)
+    monkeypatch.setattr(
+        client, "query_pollinations", lambda _: responses.pop(0)
+    )
+    monkeypatch.setattr(controller, "grab_screen", grab)
+    cc_main("goal", secure=False, settle_ms=10, delta_keyframe=0)
+    assert len(grabs) >= 2
+
+
+def test_screen_frame_round_trip(tmp_path):
+    url = _data_url(Image.new("RGB", (40, 30), "red"))
+    frame = frames.ScreenFrame.from_data_url(url)
+    assert (frame.width, frame.height) == (40, 30)
+    assert frame.mime == "image/jpeg"
+    assert frame.data_url() == url
+    assert not hasattr(frame, "__dict__")
+
+    path = tmp_path / f"shot.{frame.extension}"
+    frame.save(str(path))
+    assert path.read_bytes() == frame.data
+    assert frame == frames.ScreenFrame(frame.data)
+
+
+def test_materialize_keeps_history_frames():
+    frame = frames.ScreenFrame.from_image(Image.new("RGB", (8, 8), "blue"))
+    from computer_control.main import screen_message
+
+    msgs = [{"role": "system", "content": "hi"}, screen_message(frame, "x")]
+    wire = frames.materialize(msgs)
+    assert wire[0] is msgs[0]
+    assert wire[1]["content"][1]["image_url"]["url"] == frame.data_url()
+    assert msgs[1]["content"][1]["image_url"]["url"] is frame
@@ -0,0 +1,132 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from computer_control import controller  # noqa: E402
+from computer_control import grabber  # noqa: E402
+
+
+class FakeGrabber(grabber.ScreenGrabber):
+    def __init__(self, image=None):
+        self.image = image
+        self.closed = False
+
+    def grab(self):
+        if self.image is None:
+            raise RuntimeError("boom")
+        return self.image
+
+    def close(self):
+        self.closed = True
+
+
+def test_auto_grabber_without_display(monkeypatch):
+    monkeypatch.delenv("DISPLAY", raising=False)
+    assert isinstance(grabber.auto_grabber(), grabber.PyAutoGUIGrabber)
+
+
+def test_set_grabber_routes_and_falls_back(monkeypatch):
+    red = Image.new("RGB", (4, 4), "red")
+    blue = Image.new("RGB", (4, 4), "blue")
+    monkeypatch.setattr(
+        controller,
+        "pyautogui",
+        type("Dummy", (), {"screenshot": staticmethod(lambda: blue)}),
+    )
+
+    fake = FakeGrabber(red)
+    controller.set_grabber(fake)
+    try:
+        assert controller.grab_screen() is red
+        failing = FakeGrabber()
+        controller.set_grabber(failing)
+        assert fake.closed
+        assert controller.grab_screen() is blue
+    finally:
+        controller.set_grabber(None)
+    assert failing.closed
+
+
+def test_x_errors_are_counted_per_grabber_display(monkeypatch):
+    passed = []
+    monkeypatch.setattr(grabber, "_x_errors", {1234: 0})
+    monkeypatch.setattr(
+        grabber,
+        "_x_handlers",
+        {"previous": lambda display, event: passed.append(display) or 7},
+    )
+    assert grabber._on_x_error(1234, None) == 0
+    assert grabber._x_errors == {1234: 1}
+    # errors of other connections, such as Tk's, reach their handler
+    assert grabber._on_x_error(99, None) == 7
+    assert passed == [99]
+
+    installed = []
+    monkeypatch.setattr(grabber, "_x_handlers", {})
+    grabber._install_error_handler(lambda h: installed.append(h) or None)
+    grabber._install_error_handler(lambda h: installed.append(h) or None)
+    assert len(installed) == 1
+
+
+def test_failed_shmat_removes_the_segment():
+    calls = []
+    grab = grabber.XShmGrabber.__new__(grabber.XShmGrabber)
+    grab._display = 1
+    grab.width, grab.height = 4, 2
+    image = grabber._XImage(bits_per_pixel=32, bytes_per_line=16, height=2)
+    grab._x = {
+        "shm_query": lambda display: 1,
+        "visual": lambda display, screen: None,
+        "depth": lambda display, screen: 24,
+        "shm_create": lambda *args: grabber.ctypes.pointer(image),
+    }
+    grab._libc = {
+        "shmget": lambda key, size, flags: 42,
+        "shmat": lambda shmid, addr, flags: grabber.ctypes.c_void_p(-1).value,
+        "shmctl": lambda shmid, cmd, buf: calls.append((shmid, cmd)),
+    }
+    with pytest.raises(OSError, match="shmat failed"):
+        grab._attach_shm(0)
+    assert calls == [(42, grabber.IPC_RMID)]
+
+
+@pytest.mark.skipif(shutil.which("Xvfb") is None, reason="Xvfb not installed")
+def test_xshm_grabber_under_xvfb():
+    display = ":97"
+    proc = subprocess.Popen(
+        ["Xvfb", display, "-screen", "0", "320x200x24"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(50):
+            try:
+                grab = grabber.XShmGrabber(display)
+                break
+            except RuntimeError:
+                time.sleep(0.1)
+        else:
+            pytest.fail("Xvfb did not start")
+        try:
+            first = grab.grab()
+            second = grab.grab()
+        finally:
+            grab.close()
+        assert first.size == (320, 200)
+        assert first.mode == "RGB"
+        assert first.tobytes() == second.tobytes()
+    finally:
+        proc.terminate()
+        proc.wait()
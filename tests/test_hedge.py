@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control import hedge  # noqa: E402
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            pause = self.server.pauses.pop(0) if self.server.pauses else 0
+            self.server.count += 1
+        threading.Event().wait(pause)
+        data = json.dumps({"choices": [{"message": {"content": pause}}]})
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data.encode())
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    srv.pauses, srv.count, srv.lock = [], 0, threading.Lock()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _url(srv):
+    return f"http://127.0.0.1:{srv.server_address[1]}/openai"
+
+
+def _hedger():
+    return hedge.Hedger(min_delay=0.05, min_samples=3, max_ratio=1.0)
+
+
+def test_tracker_percentiles_and_histogram():
+    tracker = hedge.LatencyTracker(window=10)
+    for i in range(20):
+        tracker.record("a", i / 10)
+    assert tracker.count("a") == 10
+    assert tracker.percentile("a", 0.9) == 1.9
+    assert tracker.percentile("b", 0.9) is None
+    assert tracker.histogram("a", [1.45]) == [5, 5]
+
+
+def test_hedger_waits_for_samples_and_caps_load():
+    hedger = hedge.Hedger(min_samples=2, max_ratio=0.5)
+    assert hedger.delay("a") is None
+    hedger.tracker.record("a", 0.1)
+    hedger.tracker.record("a", 0.3)
+    assert hedger.delay("a") == 0.5
+    hedger.requests = 1
+    assert not hedger._allow()
+    hedger.requests = 2
+    assert hedger._allow() and not hedger._allow()
+
+
+def test_client_hedges_slow_request(server):
+    hedger = _hedger()
+    msgs = [{"role": "user", "content": "hi"}]
+    with client.PollinationsClient(_url(server), hedger=hedger) as pc:
+        for _ in range(3):
+            pc.query(msgs)
+        server.pauses = [2.0, 0.0]
+        reply = pc.query(msgs)
+    assert reply["choices"][0]["message"]["content"] == 0
+    assert hedger.hedged == 1 and hedger.hedge_wins == 1
+    assert server.count == 5
+
+
+def test_async_client_cancels_losing_request(server):
+    hedger = _hedger()
+    msgs = [{"role": "user", "content": "hi"}]
+
+    async def run():
+        async with client.AsyncPollinationsClient(
+            _url(server), hedger=hedger
+        ) as api:
+            for _ in range(3):
+                await api.query(msgs)
+            server.pauses = [2.0, 0.0]
+            started = asyncio.get_running_loop().time()
+            reply = await api.query(msgs)
+            return reply, asyncio.get_running_loop().time() - started
+
+    reply, took = asyncio.run(run())
+    assert reply["choices"][0]["message"]["content"] == 0
+    assert took < 1.5
+    assert hedger.hedged == 1 and hedger.hedge_wins == 1
@@ -0,0 +1,158 @@
+import os
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from computer_control import frames  # noqa: E402
+from computer_control import trim_history  # noqa: E402
+from computer_control.history import MessageStore  # noqa: E402
+from computer_control.main import screen_message  # noqa: E402
+
+
+def _frame(color):
+    return frames.ScreenFrame.from_image(Image.new("RGB", (16, 16), color))
+
+
+def _steps(store, count):
+    shots = []
+    for i in range(count):
+        store.append({"role": "assistant", "content": "x" * 500})
+        shot = _frame((i * 20 % 256, 0, 0))
+        shots.append(shot)
+        store.append(screen_message(shot, f"step {i}"))
+    return shots
+
+
+def test_store_drops_frames_outside_window():
+    store = MessageStore(window=4)
+    store.append({"role": "system", "content": "hi"})
+    _steps(store, 5)
+
+    fp = store.footprint()
+    assert fp["messages"] == 11
+    assert fp["images_in_memory"] == 2
+    assert fp["dropped"] == 3
+    assert store[2]["content"][1] == {
+        "type": "text",
+        "text": "[earlier screenshot omitted]",
+    }
+    assert store[1]["content"].endswith("...")
+    assert len(store[-2]["content"]) == 500
+    assert "dropped" in store.describe()
+
+
+def test_store_spills_and_reloads(tmp_path):
+    store = MessageStore(window=2, spill_path=str(tmp_path / "spill.bin"))
+    shots = _steps(store, 3)
+    try:
+        old = store[1]["content"][1]["image_url"]["url"]
+        assert not isinstance(old, frames.ScreenFrame)
+        assert old.data == shots[0].data
+        wire = frames.materialize(list(store))
+        assert wire[1]["content"][1]["image_url"]["url"] == (
+            shots[0].data_url()
+        )
+        assert store.footprint()["spill_bytes"] == sum(
+            len(s.data) for s in shots[:2]
+        )
+    finally:
+        store.close()
+
+
+def test_store_memory_ceiling_keeps_newest():
+    store = MessageStore(window=100, max_image_bytes=1)
+    shots = _steps(store, 3)
+    assert store.footprint()["images_in_memory"] == 1
+    assert store[-1]["content"][1]["image_url"]["url"] is shots[-1]
+
+
+def test_store_memory_ceiling_keeps_pinned_screenshot():
+    store = MessageStore(window=100, max_image_bytes=1)
+    shots = _steps(store, 1)
+    store.pin(store[-1])
+    _steps(store, 2)
+    assert store.footprint()["images_in_memory"] == 2
+    assert store[1]["content"][1]["image_url"]["url"] is shots[0]
+    with pytest.raises(ValueError):
+        store.pin({"role": "user", "content": "elsewhere"})
+
+
+def test_spill_file_starts_empty(tmp_path):
+    path = tmp_path / "spill.bin"
+    path.write_bytes(b"left over from an earlier run")
+    store = MessageStore(window=2, spill_path=str(path))
+    try:
+        shots = _steps(store, 2)
+        assert store.footprint()["spill_bytes"] == len(shots[0].data)
+        assert path.read_bytes() == shots[0].data
+    finally:
+        store.close()
+
+
+def test_store_works_with_trim_history():
+    store = MessageStore(window=4)
+    store.append({"role": "system", "content": "hi"})
+    _steps(store, 3)
+    trimmed = trim_history(store, 4)
+    assert trimmed[0]["role"] in ("system", "user")
+    assert trimmed[-1] is store[-1]
+
+
+def _call(*ids):
+    return {"role": "assistant", "tool_calls": [{"id": i} for i in ids]}
+
+
+def _result(call_id):
+    return {"role": "tool", "tool_call_id": call_id, "content": "ok"}
+
+
+def test_store_trimmed_skips_unanswered_calls():
+    msgs = [
+        {"role": "system", "content": "hi"},
+        {"role": "user", "content": "go"},
+        _call("a", "b"),
+        _result("a"),
+        {"role": "user", "content": "again"},
+        _call("c"),
+        _result("c"),
+        {"role": "user", "content": "more"},
+        _call("d"),
+    ]
+    store = MessageStore(window=100)
+    for count, msg in enumerate(msgs, 1):
+        store.append(msg)
+        for limit in range(1, count + 1):
+            expected = trim_history(msgs[:count], limit)
+            assert [id(m) for m in store.trimmed(limit)] == [
+                id(m) for m in expected
+            ]
+    assert store.trimmed(9) == msgs[4:8]
+
+
+def test_store_trimmed_ignores_old_history():
+    store = MessageStore(window=8)
+    store.append({"role": "system", "content": "hi"})
+    store.append(_call("lost"))
+    for i in range(1000):
+        store.append({"role": "user", "content": str(i)})
+        store.append(_call(str(i)))
+        store.append(_result(str(i)))
+    trimmed = store.trimmed(6)
+    assert [m.get("content") for m in trimmed[::3]] == ["998", "999"]
+    assert trimmed[-1] is store[-1]
+
+
+def test_validate_history_reports_unanswered_in_order():
+    from computer_control.main import validate_history
+
+    msgs = [_call("x", "y"), _call("x"), _result("x"), _result("y")]
+    with pytest.raises(ValueError, match="responses for: x$"):
+        validate_history(msgs)
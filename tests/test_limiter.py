@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control import limiter  # noqa: E402
+
+
+def test_token_bucket_paces_requests():
+    gov = limiter.Governor(rate=50, burst=2)
+    started = time.monotonic()
+    for _ in range(7):
+        with gov.slot():
+            pass
+    # two from the burst, five more at 50 per second
+    assert time.monotonic() - started >= 0.09
+    st = gov.stats()
+    assert st["requests"] == 7 and st["waited"] >= 4
+    assert st["max_wait"] > 0 and "queued" in gov.describe()
+
+
+def test_in_flight_cap_across_threads():
+    gov = limiter.Governor(max_in_flight=2)
+    peak = []
+    lock = threading.Lock()
+    running = [0]
+
+    def work():
+        with gov.slot():
+            with lock:
+                running[0] += 1
+                peak.append(running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) == 2
+    assert gov.in_flight == 0
+
+
+def test_waiters_are_served_in_arrival_order():
+    gov = limiter.Governor(rate=100, burst=1, max_in_flight=1)
+    order = []
+    held = gov.acquire()
+
+    def work(name):
+        with gov.slot():
+            order.append(name)
+
+    threads = []
+    for name in "abcd":
+        thread = threading.Thread(target=work, args=(name,))
+        thread.start()
+        threads.append(thread)
+        while len(gov._queue) < len(threads):
+            time.sleep(0.001)
+    gov.release(held)
+    for thread in threads:
+        thread.join()
+    assert order == list("abcd")
+    assert gov.stats()["waited"] == 4
+
+
+@pytest.mark.skipif(limiter.fcntl is None, reason="needs fcntl")
+def test_limits_shared_through_lock_file(tmp_path):
+    path = str(tmp_path / "limit")
+    first = limiter.Governor(rate=1, burst=1, max_in_flight=1, lock_path=path)
+    second = limiter.Governor(rate=1, burst=1, max_in_flight=1, lock_path=path)
+    slot, _ = first.try_acquire()
+    assert slot == 0
+    # the only slot is held by the other instance
+    assert second.try_acquire() == (None, limiter.POLL)
+    first.release(slot)
+    # and so is the only token
+    none, wait = second.try_acquire()
+    assert none is None and 0.5 < wait <= 1
+    first.close()
+    second.close()
+
+
+def test_async_slot_waits_for_free_slot():
+    gov = limiter.Governor(max_in_flight=1)
+    order = []
+
+    async def work(name):
+        async with gov.slot_async():
+            order.append(name)
+            await asyncio.sleep(0.02)
+            order.append(name)
+
+    async def run():
+        await asyncio.gather(work("a"), work("b"))
+
+    asyncio.run(run())
+    assert order in (["a", "a", "b", "b"], ["b", "b", "a", "a"])
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        data = json.dumps({"choices": []})
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data.encode())
+
+
+def test_clients_share_the_governor(monkeypatch):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_address[1]}/openai"
+    gov = limiter.Governor(rate=1000, burst=10)
+    monkeypatch.setattr(client, "_governor", gov)
+    try:
+        for _ in range(2):
+            with client.PollinationsClient(url) as pc:
+                pc.query([{"role": "user", "content": "hi"}])
+    finally:
+        srv.shutdown()
+        srv.server_close()
+    assert client.get_governor().requests == 2
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("POLLINATIONS_RATE", "2.5")
+    monkeypatch.setenv("POLLINATIONS_MAX_IN_FLIGHT", "3")
+    gov = limiter.from_env()
+    assert gov.rate == 2.5 and gov.max_in_flight == 3 and gov.burst == 1
+    assert gov.active
+
+
+def test_from_env_ignores_malformed_values(monkeypatch, capsys):
+    monkeypatch.setenv("POLLINATIONS_RATE", "fast")
+    monkeypatch.setenv("POLLINATIONS_BURST", "4")
+    gov = limiter.from_env()
+    assert gov.rate == 0.0 and gov.burst == 4
+    assert "POLLINATIONS_RATE" in capsys.readouterr().out
@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import sys
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control.main import main  # noqa: E402
+from computer_control import mockserver  # noqa: E402
+from computer_control import retry  # noqa: E402
+
+
+MSGS = [{"role": "user", "content": "hi"}]
+
+
+def test_serves_script_in_order(mock_server):
+    with client.PollinationsClient(mock_server.url) as pc:
+        names = []
+        for _ in range(4):
+            message = pc.query(MSGS)["choices"][0]["message"]
+            calls = message["tool_calls"]
+            names.append([c["function"]["name"] for c in calls])
+    assert names == [
+        ["move_mouse"],
+        ["click"],
+        ["write_text", "press_key"],
+        ["move_mouse"],
+    ]
+    args = json.loads(message["tool_calls"][0]["function"]["arguments"])
+    assert args == {"x": 640, "y": 80}
+    st = mock_server.stats()
+    assert st["requests"] == 4 and st["bytes_received"] > 0
+
+
+def test_streams_tool_calls(mock_server):
+    mock_server.script = [
+        {"tool_calls": [{"name": "write_text", "arguments": {"text": "ab"}}]},
+    ]
+    seen = []
+    with client.PollinationsClient(mock_server.url) as pc:
+        data = pc.query(MSGS, on_tool_call=seen.append)
+    assert [json.loads(c["function"]["arguments"]) for c in seen] == [
+        {"text": "ab"}
+    ]
+    assert data["choices"][0]["message"]["tool_calls"] == seen
+    assert mock_server.stats()["streamed"] == 1
+
+
+def test_streams_gzipped_events(mock_server):
+    mock_server.gzip = True
+    mock_server.script = [
+        {"tool_calls": [{"name": "press_key", "arguments": {"key": "a"}}]},
+    ]
+    seen = []
+    with client.PollinationsClient(mock_server.url) as pc:
+        pc.query(MSGS, on_tool_call=seen.append)
+    assert [c["function"]["name"] for c in seen] == ["press_key"]
+
+
+def test_injected_429_is_retried(mock_server, monkeypatch):
+    waits = []
+    monkeypatch.setattr(client.time, "sleep", waits.append)
+    mock_server.faults = {429: 1.0}
+    mock_server.retry_after = 2
+    policy = retry.RetryPolicy()
+    with client.PollinationsClient(mock_server.url, retry_policy=policy) as pc:
+        with pytest.raises(RuntimeError, match="429"):
+            pc.query(MSGS, retries=2)
+        mock_server.faults = {}
+        assert pc.query(MSGS)["choices"]
+    assert 2 in waits
+    assert mock_server.stats()["429"] == 2
+
+
+def test_large_body_gets_413(mock_server):
+    mock_server.max_body = 10
+    with client.PollinationsClient(mock_server.url) as pc:
+        with pytest.raises(RuntimeError, match="413"):
+            pc.query(MSGS)
+    assert mock_server.stats()["413"] == 1
+
+
+def test_parse_latency_and_fault():
+    rng = random.Random(0)
+    assert mockserver.parse_latency("0.25")(rng) == 0.25
+    assert 1 <= mockserver.parse_latency("uniform:1:2")(rng) <= 2
+    assert mockserver.parse_latency("exp:0.1")(rng) >= 0
+    assert mockserver.parse_latency("lognormal:0.1:0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        mockserver.parse_latency("gamma:1")
+    for spec in ("lognormal:0:0.5", "-1", "uniform:2:1", "exp:nan"):
+        with pytest.raises(ValueError, match="invalid latency"):
+            mockserver.parse_latency(spec)
+    assert mockserver.parse_fault("503=0.2") == {503: 0.2}
+    with pytest.raises(ValueError):
+        mockserver.parse_fault("404=0.2")
+
+
+def test_cli_reports_bad_latency(capsys):
+    with pytest.raises(SystemExit) as exc:
+        mockserver.main(["--latency", "lognormal:0:0.5"])
+    assert exc.value.code == 2
+    assert "invalid latency" in capsys.readouterr().err
+
+
+def test_session_runs_against_mock(mock_server, capsys):
+    mock_server.script = mockserver.DEFAULT_SCRIPT[:2] + [{"done": True}]
+    main(
+        "goal",
+        steps=10,
+        dry_run=True,
+        secure=False,
+        api_urls=[mock_server.url],
+    )
+    out = capsys.readouterr().out
+    assert "move_mouse(" in out and "click(" in out
+    assert mock_server.stats()["requests"] == 3
@@ -0,0 +1,137 @@
+import os
+import random
+import sys
+from typing import List
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control import retry  # noqa: E402
+
+
+class Resp:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.ok = status < 400
+        self.text = "err"
+        self.headers = headers or {}
+
+    def json(self):
+        return {"choices": []} if self.ok else {}
+
+
+def _serve(monkeypatch, statuses, policy=None):
+    posts: List[int] = []
+    sleeps: List[float] = []
+
+    def fake_post(*_, **__):
+        posts.append(1)
+        status = statuses.pop(0) if statuses else 200
+        if status is None:
+            raise client.requests.ConnectionError("down")
+        if isinstance(status, tuple):
+            return Resp(*status)
+        return Resp(status)
+
+    monkeypatch.setattr(client.requests, "post", fake_post)
+    monkeypatch.setattr(client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(client, "_retry", policy or retry.RetryPolicy())
+    return posts, sleeps
+
+
+def _query(retries=3):
+    return client.query_pollinations(
+        [{"role": "user", "content": "hi"}], retries=retries
+    )
+
+
+def test_retry_after_forms():
+    assert retry.retry_after("3") == 3.0
+    assert retry.retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert retry.retry_after("soon") is None
+    assert retry.retry_after(None) is None
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = retry.RetryPolicy(base=1, cap=5, rng=random.Random(1))
+    wait = 0.0
+    waits = []
+    for _ in range(20):
+        wait = policy.backoff(wait)
+        waits.append(wait)
+    assert waits[0] == 1
+    assert all(1 <= w <= 5 for w in waits)
+    assert len(set(waits)) > 10
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    posts, sleeps = _serve(monkeypatch, [400])
+    with pytest.raises(RuntimeError, match="400"):
+        _query()
+    assert len(posts) == 1 and sleeps == []
+
+
+def test_rate_limit_honours_retry_after(monkeypatch):
+    posts, sleeps = _serve(monkeypatch, [(429, {"Retry-After": "7"}), 503])
+    assert _query() == {"choices": []}
+    assert len(posts) == 3
+    assert sleeps[0] == 7
+    assert 0.5 <= sleeps[1] <= 21
+
+
+def test_deadline_stops_retrying(monkeypatch):
+    policy = retry.RetryPolicy(deadline=5)
+    posts, _ = _serve(monkeypatch, [(503, {"Retry-After": "10"})], policy)
+    with pytest.raises(RuntimeError, match="503"):
+        _query()
+    assert len(posts) == 1
+
+
+def test_breaker_fails_fast_then_recovers(monkeypatch):
+    policy = retry.RetryPolicy(breaker_threshold=2, breaker_cooldown=30)
+    posts, _ = _serve(monkeypatch, [None, None, None], policy)
+    with pytest.raises(RuntimeError, match="Failed to contact"):
+        _query()
+    assert len(posts) == 2
+    with pytest.raises(RuntimeError, match="unavailable"):
+        _query()
+    assert len(posts) == 2
+
+    breaker = policy.breaker(client.POLLINATIONS_API)
+    breaker.opened_at -= 31
+    # the trial request fails and opens the breaker again
+    with pytest.raises(RuntimeError, match="Failed to contact"):
+        _query()
+    assert len(posts) == 3
+    breaker.opened_at -= 31
+    assert _query() == {"choices": []}
+    assert not breaker.is_open
+
+
+def test_breaker_trial_ending_in_other_error_expires(monkeypatch):
+    policy = retry.RetryPolicy(breaker_threshold=1, breaker_cooldown=30)
+    posts, _ = _serve(monkeypatch, [None], policy)
+    with pytest.raises(RuntimeError, match="Failed to contact"):
+        _query()
+    breaker = policy.breaker(client.POLLINATIONS_API)
+    breaker.opened_at -= 31
+
+    def interrupted(*_, **__):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(client.requests, "post", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        _query()
+    # the lost trial blocks the endpoint only for another cooldown
+    assert not breaker.allow()
+    breaker._trial -= 31
+    _serve(monkeypatch, [], policy)
+    assert _query() == {"choices": []}
+    assert not breaker.is_open
@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import threading
+from typing import List
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+from computer_control import client  # noqa: E402
+from computer_control import scheduler  # noqa: E402
+
+
+def _call(id_, name, **args):
+    return {
+        "id": id_,
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args)},
+    }
+
+
+def test_plan_keeps_gui_actions_alone():
+    calls = [
+        _call("a", "run_shell", command="make"),
+        _call("b", "create_file", path="x.txt", content=""),
+        _call("c", "click", x=1, y=2),
+        _call("d", "open_url", url="https://example.com"),
+        _call("e", "run_shell", command="npm install"),
+        {"id": "f", "function": {"name": "run_shell", "arguments": "{"}},
+    ]
+    assert scheduler.plan(calls) == [[0, 1], [2], [3], [4], [5]]
+
+
+def test_shell_resources(tmp_path):
+    target = str(tmp_path / "build")
+    found = scheduler._shell_resources(
+        f"cd {target} && CC=gcc make -j4 >log.txt; npm test",
+        [os.path.join(target, "out.o")],
+    )
+    assert found.programs == ["cd", "make", "npm"]
+    assert found.paths == [target]
+    assert scheduler._shell_resources("echo 'open", []).everything
+
+
+def test_conflicts():
+    make = scheduler.resources(_call("a", "run_shell", command="make all"))
+    make2 = scheduler.resources(_call("b", "run_shell", command="make test"))
+    pip = scheduler.resources(_call("c", "run_shell", command="pip install"))
+    assert make.conflicts(make2)
+    assert not make.conflicts(pip)
+    write = scheduler.resources(
+        _call("d", "create_file", path="/tmp/dir/a", content="")
+    )
+    wipe = scheduler.resources(
+        _call("e", "run_shell", command="rm -rf /tmp/dir")
+    )
+    assert write.conflicts(wipe)
+
+
+def test_independent_shell_calls_overlap(monkeypatch):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def shell(command):
+        barrier.wait()
+        return command
+
+    monkeypatch.setitem(client.ACTION_MAP, "run_shell", shell)
+    sleeps: List[float] = []
+    monkeypatch.setattr(client.time, "sleep", sleeps.append)
+    calls = [
+        _call(n, "run_shell", command=cmd)
+        for n, cmd in (("a", "make"), ("b", "npm install"), ("c", "cargo b"))
+    ]
+    # each call blocks until all three run at once
+    msgs = client.execute_tool_calls(calls, delay=0.5)
+    assert [m["tool_call_id"] for m in msgs] == ["a", "b", "c"]
+    assert [m["content"] for m in msgs] == ["make", "npm install", "cargo b"]
+    assert sleeps == [0.5]
+
+
+def test_same_path_keeps_order(monkeypatch, tmp_path):
+    order: List[str] = []
+    lock = threading.Lock()
+
+    def record(name):
+        def action(**kwargs):
+            with lock:
+                order.append(name)
+
+        return action
+
+    monkeypatch.setitem(client.ACTION_MAP, "create_file", record("create"))
+    monkeypatch.setitem(client.ACTION_MAP, "delete_file", record("delete"))
+    path = str(tmp_path / "notes.txt")
+    calls = [
+        _call("a", "create_file", path=path, content="x"),
+        _call("b", "delete_file", path=path),
+        _call("c", "create_file", path=path, content="y"),
+    ]
+    for _ in range(5):
+        order.clear()
+        client.execute_tool_calls(calls)
+        assert order == ["create", "delete", "create"]
+
+
+def test_secure_runs_serially(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda *_: "n")
+    monkeypatch.setattr(
+        scheduler, "run", lambda *_: (_ for _ in ()).throw(AssertionError)
+    )
+    calls = [
+        _call("a", "run_shell", command="make"),
+        _call("b", "run_shell", command="npm install"),
+    ]
+    msgs = client.execute_tool_calls(calls, secure=True)
+    assert [m["content"] for m in msgs] == ["skipped", "skipped"]
+
+
+def test_state_changes_run_alone():
+    for command in (
+        "cd build",
+        "export A=1",
+        "A=1",
+        "source env/bin/activate",
+    ):
+        found = scheduler.resources(_call("a", "run_shell", command=command))
+        assert found.everything, command
+    found = scheduler.resources(_call("a", "run_shell", command="A=1 make"))
+    assert not found.everything
@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import client  # noqa: E402
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_HEAD(self):
+        self.server.peers.add(self.client_address)
+        self.send_response(405)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        self.server.peers.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.bodies.append((body, dict(self.headers)))
+        # not time.sleep, which tests patch out
+        threading.Event().wait(self.server.pause)
+        data = json.dumps({"choices": [{"message": {"content": "ok"}}]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data.encode())
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    srv.peers, srv.bodies, srv.pause = set(), [], 0.0
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _url(srv):
+    return f"http://127.0.0.1:{srv.server_address[1]}/openai"
+
+
+def test_client_reuses_one_connection(server):
+    msgs = [{"role": "user", "content": "hi"}]
+    with client.PollinationsClient(_url(server), referrer="r") as pc:
+        assert pc.warm_up()
+        for _ in range(3):
+            assert pc.query(msgs)["choices"][0]["message"]["content"] == "ok"
+    assert len(server.peers) == 1
+    body, headers = server.bodies[0]
+    assert body["messages"] == msgs and body["tools"] == client.FUNCTIONS_SPEC
+    assert headers["Referer"] == "r"
+
+
+def test_client_read_timeout(server, monkeypatch):
+    server.pause = 0.5
+    monkeypatch.setattr(client.time, "sleep", lambda *_: None)
+    with client.PollinationsClient(_url(server), read_timeout=0.1) as pc:
+        with pytest.raises(RuntimeError, match="Failed to contact"):
+            pc.query([{"role": "user", "content": "hi"}], retries=2)
+
+
+def test_query_pollinations_uses_installed_client(server):
+    pc = client.PollinationsClient(_url(server))
+    client.set_client(pc)
+    try:
+        for _ in range(2):
+            client.query_pollinations([{"role": "user", "content": "hi"}])
+    finally:
+        client.set_client(None)
+    assert len(server.bodies) == 2
+    assert len(server.peers) == 1
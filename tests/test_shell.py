@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import time
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control import controller  # noqa: E402
+from computer_control import scheduler  # noqa: E402
+from computer_control import shell  # noqa: E402
+
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="POSIX shell")
+
+
+def test_output_buffer_keeps_head_and_tail():
+    buf = shell.OutputBuffer(head=4, tail=6)
+    for chunk in (b"abcdefgh", b"ijkl\nmnop"):
+        buf.write(chunk)
+    assert bytes(buf.head) == b"abcd" and bytes(buf.tail) == b"l\nmnop"
+    assert buf.total == 17 and buf.omitted == 7
+    assert buf.text() == "abcd\n[... 7 bytes omitted ...]\nmnop"
+
+
+def test_run_captures_exit_code_and_streams(capfd):
+    result = shell.run("echo out; echo err >&2; exit 3", echo=True)
+    assert result.exit_code == 3
+    assert result.summary() == (
+        f"exit code 3 ({result.seconds:.1f}s)\nstdout:\nout\nstderr:\nerr"
+    )
+    echoed = capfd.readouterr()
+    assert echoed.out == "out\n" and echoed.err == "err\n"
+
+
+def test_timeout_stops_the_process_group(tmp_path):
+    marker = tmp_path / "late"
+    started = time.monotonic()
+    result = shell.run(
+        f"(sleep 1; touch {marker}) & sleep 30", timeout=0.3, echo=False
+    )
+    assert time.monotonic() - started < 5
+    assert result.timed_out and result.exit_code != 0
+    assert "timed out after 0.3s" in result.summary()
+    time.sleep(1.2)
+    # the child started in the background was stopped too
+    assert not marker.exists()
+
+
+def test_output_limit():
+    result = shell.run("yes", max_output=100_000)
+    assert result.truncated
+    assert result.stdout.total > 100_000
+    assert len(result.stdout.head) + len(result.stdout.tail) <= (
+        shell.HEAD + shell.TAIL
+    )
+    assert "bytes omitted" in result.summary()
+
+
+def test_background_job_does_not_hold_the_call():
+    started = time.monotonic()
+    result = shell.run("sleep 5 & echo started")
+    assert time.monotonic() - started < 2
+    assert result.exit_code == 0 and "started" in result.summary()
+
+
+def test_controller_returns_summary():
+    text = controller.run_shell("printf hi", timeout=10)
+    assert text.startswith("exit code 0") and text.endswith("stdout:\nhi")
+
+
+@pytest.fixture
+def session(tmp_path):
+    sess = shell.ShellSession(shell="/bin/sh", cwd=str(tmp_path))
+    yield sess
+    sess.close()
+
+
+def test_session_keeps_cwd_and_variables(session, tmp_path):
+    (tmp_path / "sub").mkdir()
+    assert session.run("cd sub && export GREETING=hi").exit_code == 0
+    result = session.run('pwd; printf "$GREETING"')
+    assert result.exit_code == 0
+    assert result.stdout.text() == f"{tmp_path / 'sub'}\nhi"
+    assert session.cwd == str(tmp_path / "sub")
+    assert session.commands == 2 and session.restarts == 0
+
+
+def test_session_reports_errors_and_does_not_read_stdin(session):
+    result = session.run("cat; echo oops >&2; false")
+    assert result.exit_code == 1 and result.stderr.text() == "oops\n"
+    assert session.run("echo 'unbalanced").exit_code != 0
+    assert session.run("echo fine").stdout.text() == "fine\n"
+
+
+def test_session_restarts_after_exit_and_timeout(session, tmp_path):
+    session.run("cd /")
+    assert session.run("exit 4").exit_code == 4
+    assert session.run("pwd").stdout.text() == "/\n"
+    result = session.run("sleep 30", timeout=0.3)
+    assert result.timed_out
+    assert session.run("echo back").stdout.text() == "back\n"
+    assert session.restarts == 2
+
+
+def test_concurrent_commands_share_the_session(session):
+    controller.set_shell_session(session)
+    try:
+        controller.run_shell("export MARK=42")
+        commands = ["sleep 0.2; echo 0-$MARK", "printf '1-%s' \"$MARK\""]
+        calls = [
+            {
+                "id": str(n),
+                "type": "function",
+                "function": {
+                    "name": "run_shell",
+                    "arguments": json.dumps({"command": command}),
+                },
+            }
+            for n, command in enumerate(commands)
+        ]
+        assert len(scheduler.plan(calls)) == 1
+        results = scheduler.run(
+            calls, lambda call: client._run_tool_call(call, False, False)
+        )
+    finally:
+        controller.set_shell_session(None)
+    outputs = [message["content"] for message, _ in results]
+    assert outputs[0].endswith("stdout:\n0-42")
+    assert outputs[1].endswith("stdout:\n1-42")
+    assert session.commands == 3
+
+
+def test_controller_uses_installed_session(session):
+    controller.set_shell_session(session)
+    try:
+        controller.run_shell("export MARK=42")
+        assert controller.run_shell("echo $MARK").endswith("stdout:\n42")
+    finally:
+        controller.set_shell_session(None)
+    # the session was closed with it
+    assert session.proc is None
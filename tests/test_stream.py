@@ -0,0 +1,235 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+)
+
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from computer_control import client  # noqa: E402
+from computer_control import limiter  # noqa: E402
+
+
+def _chunk(content=None, calls=None, finish=None):
+    delta = {}
+    if content:
+        delta["content"] = content
+    if calls:
+        delta["tool_calls"] = calls
+    return {"choices": [{"delta": delta, "finish_reason": finish}]}
+
+
+def _call(index, id_=None, name=None, args=""):
+    part = {"index": index, "function": {"arguments": args}}
+    if id_:
+        part["id"] = id_
+        part["type"] = "function"
+    if name:
+        part["function"]["name"] = name
+    return part
+
+
+CHUNKS = [
+    _chunk(content="Typing"),
+    _chunk(calls=[_call(0, "a", "write_text", '{"te')]),
+    _chunk(calls=[_call(0, args='xt": "hi"}')]),
+    "first-done",
+    _chunk(calls=[_call(1, "b", "press_key", '{"key":')]),
+    _chunk(calls=[_call(1, args=' "enter"}')], finish="tool_calls"),
+]
+
+
+class SSE(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.bodies.append(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in CHUNKS:
+            if chunk == "first-done":
+                # hold the rest of the turn until the first call ran
+                self.server.early = self.server.dispatched.wait(2)
+                continue
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b": keep-alive\n\ndata: [DONE]\n\n")
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), SSE)
+    srv.bodies, srv.dispatched, srv.early = [], threading.Event(), False
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_stream_dispatches_calls_early(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/openai"
+    seen = []
+
+    def on_call(call):
+        seen.append(call["function"]["name"])
+        server.dispatched.set()
+
+    with client.PollinationsClient(url) as pc:
+        data = pc.query([{"role": "user", "content": "hi"}], 1, on_call)
+
+    assert server.early
+    assert server.bodies[0]["stream"] is True
+    assert seen == ["write_text", "press_key"]
+    message = data["choices"][0]["message"]
+    assert message["content"] == "Typing"
+    assert [c["id"] for c in message["tool_calls"]] == ["a", "b"]
+    assert json.loads(message["tool_calls"][1]["function"]["arguments"]) == {
+        "key": "enter"
+    }
+
+
+def test_stream_actions_run_outside_the_request(server, monkeypatch):
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    gov = limiter.Governor(max_in_flight=1)
+    monkeypatch.setattr(client, "_governor", gov)
+    seen = []
+
+    def on_call(call):
+        # a slow action must not hold the slot or count as latency
+        seen.append((gov.in_flight, sum(b.outstanding for b in backends)))
+        time.sleep(0.1)
+        server.dispatched.set()
+
+    with client.PollinationsClient(urls=[base + "/a", base + "/b"]) as pc:
+        backends = pc.balancer.backends
+        pc.query([{"role": "user", "content": "hi"}], 1, on_call)
+
+    assert seen == [(0, 0), (0, 0)]
+    latencies = [b.ewma for b in backends if b.ewma is not None]
+    assert len(latencies) == 1 and latencies[0] < 0.1
+
+
+def test_stream_stops_when_an_action_fails(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/openai"
+
+    def on_call(call):
+        raise KeyboardInterrupt
+
+    with client.PollinationsClient(url) as pc:
+        with pytest.raises(KeyboardInterrupt):
+            pc.query([{"role": "user", "content": "hi"}], 1, on_call)
+
+
+class BrokenStream:
+    headers = {"Content-Type": "text/event-stream"}
+    raw = None
+
+    def __init__(self, started):
+        self.started = started
+
+    def iter_lines(self):
+        for index, name in enumerate(("press_key", "write_text")):
+            call = _call(index, name[0], name, "{}")
+            yield f"data: {json.dumps(_chunk(calls=[call]))}"
+            yield ""
+        self.started.wait(2)
+        yield "data: {not json"
+        yield ""
+
+    def close(self):
+        pass
+
+
+def test_stream_failure_drops_queued_calls():
+    started = threading.Event()
+    seen = []
+
+    def on_call(call):
+        seen.append(call["function"]["name"])
+        started.set()
+        time.sleep(0.2)  # the stream fails meanwhile
+
+    with pytest.raises(RuntimeError, match="invalid stream"):
+        client.read_stream(BrokenStream(started), on_call)
+    assert seen == ["press_key"]
+
+    dispatcher = client.StreamDispatcher(dry_run=True)
+    dispatcher.cancel()
+    dispatcher({"id": "c", "function": {"name": "click", "arguments": "{}"}})
+    assert dispatcher.finish() == [] and dispatcher.calls == 0
+
+
+def test_assembler_flushes_incomplete_call_at_end():
+    seen = []
+    asm = client.ToolCallAssembler(seen.append)
+    asm.feed(_chunk(calls=[_call(0, "x", "click", '{"x": 1')]))
+    assert not seen
+    data = asm.finish()
+    assert seen == data["choices"][0]["message"]["tool_calls"]
+
+
+def test_stream_dispatcher_waits_between_actions(monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        client,
+        "execute_tool_calls",
+        lambda calls, **kw: events.append(("run", kw["trailing_delay"]))
+        or [{"role": "tool", "tool_call_id": calls[0]["id"]}],
+    )
+    monkeypatch.setattr(
+        client.time, "sleep", lambda s: events.append(("sleep", s))
+    )
+    dispatcher = client.StreamDispatcher(delay=0.5)
+    dispatcher({"id": "1"})
+    dispatcher({"id": "2"})
+    results = dispatcher.finish(trailing_delay=False)
+    assert events == [("run", False), ("sleep", 0.5), ("run", False)]
+    assert [r["tool_call_id"] for r in results] == ["1", "2"]
+
+
+def test_main_streams_actions(monkeypatch):
+    from computer_control import controller
+    from computer_control import main as cc_main
+
+    sent = []
+
+    def fake_query(messages, on_tool_call=None):
+        sent.append(messages)
+        call = {
+            "id": "1",
+            "type": "function",
+            "function": {"name": "press_key", "arguments": '{"key": "a"}'},
+        }
+        if len(sent) == 1:
+            on_tool_call(call)
+            return {"choices": [{"message": {"tool_calls": [call]}}]}
+        return {"choices": [{"message": {"content": "done", "done": True}}]}
+
+    monkeypatch.setattr(client, "query_pollinations", fake_query)
+    monkeypatch.setattr(
+        controller, "grab_screen", lambda: Image.new("RGB", (8, 8))
+    )
+    cc_main("hi", steps=2, dry_run=True, secure=False, stream=True)
+    assert len(sent) == 2
+    assert sent[1][-2] == {
+        "role": "tool",
+        "tool_call_id": "1",
+        "name": "press_key",
+        "content": "dry-run",
+    }